@@ -136,8 +136,9 @@ class LifetimeGUI(GuiBase):
         This function is triggered by the logic module.
         """
         
-        if self._qtlogic.measurement_type == "LIFETIME":
-            liveInfo=self._qtlogic.getLFTLiveInfo()
+        snapshot = self._qtlogic.lifetime_snapshot
+        if self._qtlogic.measurement_type == "LIFETIME" and snapshot is not None:
+            liveInfo=snapshot['stats'][self._qtlogic.lifetime_channels[1]]
             self._mw.start_events.setText(str(liveInfo[1]))
             self._mw.stop_events.setText(str(liveInfo[2]))
             self._mw.int_time.setText(str(round(liveInfo[3]*self.ps,1)))
@@ -88,7 +88,7 @@ class CounterGUI(GuiBase):
     def count(self):
         #self.count_1 = self._counter([self.counter_channels[0]])
         #self.count_2 = self._counter([self.counter_channels[1]])
-        self.counts = self._counter.get_count_rates(self.counter_channels)
+        self.counts = self._counter.get_latest_count_rates(self.counter_channels)
         self._mw.daq_channel1.setText(str(self.counts[0]))
         self._mw.daq_channel2.setText(str(self.counts[1]))
         #self._mw.channel1.setText(str(self.counts[0]))
@@ -135,13 +135,13 @@ class QuTagGUI(GuiBase):
     def update_text_display(self):
         """ Updates display text with current rates, events, and the total time integrated
         """
-        if self._qtlogic.measurement_type == "G2":
-            liveInfo=self._qtlogic.getHBTLiveInfo()
-            rates=self._qtlogic.get_count_rates([1,2])
+        snapshot = self._qtlogic.hbt_snapshot
+        if self._qtlogic.measurement_type == "G2" and snapshot is not None:
+            rates=snapshot['rates']
             self._mw.rates_ch1.setText(str(rates[0]))
             self._mw.rates_ch2.setText(str(rates[1]))
-            self._mw.events_ch1.setText(str(liveInfo[0]))
-            self._mw.time_output.setText(str(round(self._qtlogic.getHBTIntegrationTime(),1)))
+            self._mw.events_ch1.setText(str(snapshot['event_count'][0]))
+            self._mw.time_output.setText(str(round(snapshot['integration_time'],1)))
 
     def __get_save_scan_data_func(self):
         def save_scan_func():
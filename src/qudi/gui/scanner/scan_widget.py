@@ -241,6 +241,7 @@ class Scan2DWidget(_BaseScanWidget):
         self.image_widget.set_data_label(label=channels[0].name, unit=channels[0].unit)
 
         self.layout().addWidget(self.image_widget, 1, 0, 1, 4)
+        self._image = None  # copy of the displayed channel, lines are updated in place
 
         # disable buggy pyqtgraph 'Export..' context menu
         self.image_widget.plot_widget.getPlotItem().vb.scene().contextMenu[0].setVisible(False)
@@ -304,6 +305,30 @@ class Scan2DWidget(_BaseScanWidget):
         # Set data
         self._update_scan_data()
 
+    def set_scan_lines(self, data: ScanData, lines: Sequence[int], line_data: dict, redraw: bool = False) -> None:
+        """ Live update of a running scan, copies only the given lines into the displayed image.
+
+        The first update of a scan (redraw) or line data that does not match the displayed image is drawn in
+        full from data.
+
+        @param ScanData data: ScanData of the running scan
+        @param list lines: indices of the lines (first image axis) to update
+        @param dict line_data: {channel: image} to copy the lines from, e.g. the scanning logic's get_scan_update views
+        @param bool redraw: draw data in full, e.g. for the first update of a new scan
+        """
+        # Save reference for channel changes
+        self._scan_data = data
+        current_channel = self.channel_selection_combobox.currentText()
+        image = line_data.get(current_channel, None)
+        if redraw or (self._image is None) or (image is None) or (image.shape != self._image.shape):
+            self._update_scan_data()
+            return
+        lines = np.unique(np.asarray(lines, dtype=int))
+        if lines.size == 0:
+            return
+        self._image[:, lines] = image[:, lines]
+        self.image_widget.set_image(self._image)
+
     @QtCore.Slot(dict)
     def _region_changed(self, regions) -> None:
         center = regions[self.image_widget.SelectionMode.XY][0][0]
@@ -327,9 +352,11 @@ class Scan2DWidget(_BaseScanWidget):
         current_channel = self.channel_selection_combobox.currentText()
         if (self._scan_data is None) or (self._scan_data.data is None) \
             or (current_channel not in self._scan_data.channels):
+            self._image = None
             self.image_widget.set_image(None)
         else:
-            self.image_widget.set_image(self._scan_data.data[current_channel])
+            self._image = np.array(self._scan_data.data[current_channel], dtype=np.float64)
+            self.image_widget.set_image(self._image)
             self.image_widget.set_image_extent(self._scan_data.scan_range,
                                                adjust_for_px_size=True)
             self.image_widget.autoRange()
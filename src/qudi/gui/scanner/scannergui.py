@@ -156,6 +156,8 @@ class ScannerGui(GuiBase):
         the event argument from fysom to the methods.
         """
         self._optimizer_id = self._optimize_logic().module_uuid
+        # Id of the running scan in the scanning logic and number of its line updates already drawn
+        self._live_scan = (None, 0)
 
         self.scan_2d_dockwidgets = dict()
         self.scan_1d_dockwidgets = dict()
@@ -806,7 +808,7 @@ class ScannerGui(GuiBase):
                     dockwidget = self.scan_1d_dockwidgets.get(scan_axes, None)
                 if dockwidget is not None:
                     dockwidget.scan_widget.toggle_scan_button.setChecked(is_running)
-                    self._update_scan_data(scan_data)
+                    self._update_scan_data(scan_data, incremental=True)
         return
 
     @QtCore.Slot(bool, dict, object)
@@ -939,17 +941,39 @@ class ScannerGui(GuiBase):
         self.set_active_tab(scan_data.scan_axes)
 
     @QtCore.Slot(object)
-    def _update_scan_data(self, scan_data):
+    def show_scan_preview(self, scan_data):
+        """ Displays scan data that is not part of the scan history, e.g. the max projection of a volume scan.
+
+        @param ScanData scan_data: 1D or 2D scan data of an axes combination that has a scan dockwidget
+        """
+        if scan_data is not None:
+            self._update_scan_data(scan_data)
+
+    @QtCore.Slot(object)
+    def _update_scan_data(self, scan_data, incremental=False):
         """
         @param ScanData scan_data:
+        @param bool incremental: live update of a running scan, 2D images only redraw the lines the scanning
+                                 logic reports with get_scan_update
         """
         axes = scan_data.scan_axes
         try:
             dockwidget = self.scan_2d_dockwidgets[axes]
         except KeyError:
             dockwidget = self.scan_1d_dockwidgets.get(axes, None)
+            incremental = False
         if dockwidget is None:
             self.log.error(f'No scan dockwidget found for scan axes {axes}')
+        elif incremental and hasattr(self._scanning_logic(), 'get_scan_update'):
+            scan_id, line_count = self._live_scan
+            update = self._scanning_logic().get_scan_update(scan_id, line_count)
+            if update is None:
+                dockwidget.scan_widget.set_scan_data(scan_data)
+                return
+            new_scan_id, lines, line_data = update
+            new_scan = new_scan_id != scan_id
+            self._live_scan = (new_scan_id, (0 if new_scan else line_count) + len(lines))
+            dockwidget.scan_widget.set_scan_lines(scan_data, lines, line_data, redraw=new_scan)
         else:
             dockwidget.scan_widget.set_scan_data(scan_data)
 
@@ -1,12 +1,23 @@
 # -*- coding: utf-8 -*-
 """ Hardware module for the DAQ
+
+Buffered output scans (set_diff_voltage_scan) do not mark the lines or points they write on any other instrument.
+Hardware timed line scans of the scanning probe interfuse (line_scan_mode: 'hardware_timed') bin the quTAG time tags
+against such markers, so the board's D/A pacer clock has to be wired to the quTAG: set the SYNC terminal to output in
+InstaCal, connect it to a free quTAG input and give that input as pixel_clock_channel of the qutag module. Every
+written point then starts a pixel. A separate line start pulse on the quTAG input set as sync_channel works as well,
+the pixels are then placed on a regular grid after it. Without either option the interfuse falls back to step
+scanning.
 """
 
 from mcculw import ul
 from mcculw.enums import CounterChannelType
 from mcculw.device_info import DaqDeviceInfo
 from mcculw.enums import ULRange
+from mcculw.enums import ScanOptions
 from mcculw.ul import ULError
+import ctypes
+import numpy as np
 import time
 from pylab import *
 
@@ -128,6 +139,57 @@ class DAQ(Base):
             print("please use correct mode, single_ended or differential")
             return "null"
         
+    def set_diff_voltage_scan(self, channel_pairs, voltages, rate):
+        '''
+        Write a buffered differential voltage waveform in one analog output scan.
+
+        Args:
+            channel_pairs (list): [(channel_high, channel_low), ...], the channels of all pairs together
+                must form one contiguous block, each channel used once
+            voltages (np.ndarray): shape (points, len(channel_pairs)) differential voltages
+            rate (float): points per second and channel
+
+        Blocks until the whole waveform has been written.
+
+        Raises:
+            ValueError: a voltage exceeds the output range or the channels are not one contiguous block,
+                nothing is written
+        '''
+        # The board writes every channel between the lowest and the highest one, a gap would be driven to 0 V.
+        channels = sorted(channel for pair in channel_pairs for channel in pair)
+        if channels != list(range(channels[0], channels[0] + len(channels))):
+            raise ValueError('Channel pairs {0} do not form one contiguous block of output channels'
+                             ''.format(list(channel_pairs)))
+        voltages = np.atleast_2d(np.asarray(voltages, dtype=np.float64))
+        voltage_pk = 20
+        if np.any(np.abs(voltages) > voltage_pk):
+            raise ValueError('Differential voltage scan of up to {0:.3f} V exceeds the {1} V output range'
+                             ''.format(np.abs(voltages).max(), voltage_pk))
+        low_chan = min(min(pair) for pair in channel_pairs)
+        high_chan = max(max(pair) for pair in channel_pairs)
+        num_chans = high_chan - low_chan + 1
+        num_points = voltages.shape[0]
+
+        # Interleave the channels the way the board expects them: one full channel block per point
+        waveform = np.zeros((num_points, num_chans), dtype=np.float64)
+        for i, (channel_high, channel_low) in enumerate(channel_pairs):
+            waveform[:, channel_high - low_chan] = voltages[:, i] / 2
+            waveform[:, channel_low - low_chan] = -voltages[:, i] / 2
+
+        total_count = num_points * num_chans
+        memhandle = ul.scaled_win_buf_alloc(total_count)
+        if not memhandle:
+            raise RuntimeError('Failed to allocate DAQ output buffer')
+        try:
+            buffer = np.ctypeslib.as_array(ctypes.cast(memhandle, ctypes.POINTER(ctypes.c_double)),
+                                           shape=(total_count,))
+            buffer[:] = waveform.ravel()
+            ul.a_out_scan(self.board_num, low_chan, high_chan, total_count, int(rate), self.range,
+                          memhandle, ScanOptions.SCALEDATA)
+        finally:
+            ul.win_buf_free(memhandle)
+        return
+
     def set_zero(self):
         '''
         Reset Galvo config
@@ -14,7 +14,56 @@ from qudi.util.mutex import RecursiveMutex, Mutex
 # from qudi.util.enums import SamplingOutputMode
 # from qudi.util.helpers import in_range
 from qudi.core.module import Base
+from qudi.hardware.interfuse.scan_trajectory import TrajectoryCompiler
+from qudi.hardware.interfuse.volume_stack import VolumeStackWriter
+from qudi.hardware.interfuse.scan_checkpoint import ScanCheckpoint
+from qudi.hardware.interfuse.drift_tracker import DriftTracker, locate_peak
+from qudi.hardware.interfuse.scan_planner import ScanOverheadStatistics, estimate_scan_time, fit_to_budget
+import os
+import threading
 import time
+from datetime import datetime
+
+
+def _estimate_line_shift(reference, line, max_shift):
+    """ Shift in pixels of line against reference from the peak of their cross-correlation.
+
+    @return float: sub-pixel shift k with line[i + k] ~ reference[i], None if either line has no structure
+    """
+    reference = np.asarray(reference, dtype=np.float64) - np.mean(reference)
+    line = np.asarray(line, dtype=np.float64) - np.mean(line)
+    n = reference.size
+    max_shift = int(min(max_shift, n//2))
+    if max_shift < 1 or not np.any(reference) or not np.any(line):
+        return None
+    lags = np.arange(-max_shift, max_shift + 1)
+    correlation = np.empty(lags.size)
+    for i, k in enumerate(lags):
+        overlap_ref = reference[max(0, -k):n - max(0, k)]
+        overlap_line = line[max(0, k):n - max(0, -k)]
+        correlation[i] = np.dot(overlap_ref, overlap_line)/overlap_ref.size
+    peak = int(np.argmax(correlation))
+    shift = float(lags[peak])
+    if 0 < peak < lags.size - 1:
+        # parabola through the peak and its neighbours
+        left, centre, right = correlation[peak - 1:peak + 2]
+        curvature = left - 2*centre + right
+        if curvature < 0:
+            shift += 0.5*(left - right)/curvature
+    return shift
+
+
+def _dilate(mask, radius):
+    """ Grows the True region of a 2D boolean mask by radius cells in every direction (square neighbourhood).
+    """
+    grown = mask.copy()
+    nx, ny = mask.shape
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            grown[max(dx, 0):nx + min(dx, 0), max(dy, 0):ny + min(dy, 0)] |= \
+                mask[max(-dx, 0):nx + min(-dx, 0), max(-dy, 0):ny + min(-dy, 0)]
+    return grown
+
 
 class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
     m=1
@@ -25,6 +74,34 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
     _frequency_ranges = ConfigOption(name='frequency_ranges', missing='error') ##Aka values written/retrieved per second; Check with connected HW for sensible constraints.Reads the maximum frequency ranges, in our case this is limited mostly by the speed at which python can communicate with the DAQ.
     _resolution_ranges = ConfigOption(name='resolution_ranges', missing='error') #The maximum and minimum resolution possible, in our case this would be 
     _input_channel_units = ConfigOption(name='input_channel_units', missing='error')#Stores the different channel inputs, the format is like a dict. ChannelName: Unit, for us that might be SPAD1: "c/s"
+    _scan_channels = ConfigOption(name='scan_channels', default={'APD1': 1, 'APD2': 2, 'SUM': {'sum': ['APD1', 'APD2']}}) #Source of every channel in input_channel_units, either a counter channel number or a derived channel {'sum': [names]}, {'difference': [a, b]} or {'ratio': [a, b]} of counter channels
+    _line_scan_mode = ConfigOption(name='line_scan_mode', default='step') #'step' moves and counts pixel by pixel, 'hardware_timed' writes the whole line to the DAQ in one buffered output and bins the counts from one time tag readout. It needs the DAQ pacer clock or a line start pulse wired to the counter's pixel_clock_channel or sync_channel, see hardware/DAQ.py.
+    _timestamp_owner = 'hardware timed scan' #Name the counter's time tag buffer is reserved under during hardware timed scans
+    _serpentine = ConfigOption(name='serpentine', default=False) #2D scans acquire every odd line backwards instead of flying back to the start of the line
+    _lag_compensation = ConfigOption(name='lag_compensation', default=False) #Shift backward lines onto the preceding forward line, the shift is estimated from their cross-correlation
+    _max_lag_pixels = ConfigOption(name='max_lag_pixels', default=5) #Largest forward/backward shift searched by the lag compensation
+    _adaptive_scan = ConfigOption(name='adaptive_scan', default=False) #2D scans run a coarse pass first and only rescan bright regions at full resolution and dwell
+    _adaptive_coarse_step = ConfigOption(name='adaptive_coarse_step', default=4) #Pixels per coarse pixel along each axis
+    _adaptive_coarse_dwell = ConfigOption(name='adaptive_coarse_dwell', default=0.25) #Coarse dwell time as a fraction of the configured dwell time (1/frequency)
+    _adaptive_threshold = ConfigOption(name='adaptive_threshold', default=None) #c/s summed over the channels above which a coarse pixel is rescanned, median + 3 robust standard deviations of the coarse pass if None
+    _adaptive_neighbourhood = ConfigOption(name='adaptive_neighbourhood', default=1) #Coarse pixels around every bright coarse pixel that are rescanned as well
+    _trajectory_cache_size = ConfigOption(name='trajectory_cache_size', default=16) #Compiled scan trajectories kept for repeated scans with the same settings
+    _checkpoint_dir = ConfigOption(name='checkpoint_dir', default=None) #Directory for scan checkpoints, every dense 1D/2D scan is checkpointed into a new subdirectory, disabled if None
+    _checkpoint_interval = ConfigOption(name='checkpoint_interval', default=30) #s between checkpoint writes, finished lines are also written when the scan ends or stops
+    _settle_times = ConfigOption(name='settle_times', default=dict()) #s per axis, e.g. {'x': 1e-3, 'y': 1e-3, 'z': 20e-3}, waited after a step scan move of that axis before the exposure starts
+    _drift_interval = ConfigOption(name='drift_interval', default=60) #s between two localisations of the drift reference emitter, checked between scan lines, 0 localises before every line
+    _drift_axes = ConfigOption(name='drift_axes', default=['x', 'y']) #Axes the drift is measured and corrected on
+    _drift_range = ConfigOption(name='drift_range', default=1e-6) #m, length of the line scans through the reference emitter
+    _drift_pixels = ConfigOption(name='drift_pixels', default=21) #Pixels of every line scan through the reference emitter
+    _drift_frequency = ConfigOption(name='drift_frequency', default=None) #Pixel frequency of the reference line scans, the scan frequency if None
+    _drift_model_order = ConfigOption(name='drift_model_order', default=1) #Polynomial order of the drift model, 1 is a constant drift velocity
+    _drift_history = ConfigOption(name='drift_history', default=10) #Newest localisations the drift model is fitted to
+    _scan_time_budget = ConfigOption(name='scan_time_budget', default=None) #s, configure_scan reduces the scan settings until the estimated duration fits, no limit if None
+    _budget_adjust = ConfigOption(name='budget_adjust', default='resolution') #'resolution' lowers the resolution of all axes to meet scan_time_budget, 'frequency' raises the frequency first
+    _default_pixel_overhead = ConfigOption(name='default_pixel_overhead', default=2e-3) #s per step scan pixel on top of the dwell and settle time, used until a scan was measured
+    _default_line_overhead = ConfigOption(name='default_line_overhead', default=50e-3) #s per line on top of its pixels, used until a scan was measured
+    _overhead_window = ConfigOption(name='overhead_window', default=50) #Most recent lines the measured overhead is averaged over
+    _stop_timeout = ConfigOption(name='stop_timeout', default=60) #s stop_volume_scan waits for the line or refocus in progress
     
     stage = Connector(interface="MotorInterface")
     counter = Connector(interface='Qutag')
@@ -51,6 +128,44 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         self._thread_lock_data = Mutex() #Locks the data while it updates from hardware
     
         self._scan_data = None #Temporary Container for the ScanData - Should be type ScanData and instantiated in configure_scan
+        self.line_lag = 0.0 #Last forward/backward shift in pixels applied by the lag compensation
+        self._previous_forward_line = None
+
+        # The scan runs on a producer thread that fills _scan_buffer line by line, get_scan_data only publishes
+        # finished lines into _scan_data and never waits for the hardware.
+        self._scan_thread = None
+        self._stop_scan_event = threading.Event()
+        self._scan_buffer = None
+        self._line_updates = [] #Index of every line written to _scan_buffer by the producer, in order
+        self._lines_published = 0 #Entries of _line_updates already copied from _scan_buffer to _scan_data
+        self._scan_finished = False
+        self._release_time_tags = False #The scan thread releases the counter's time tag buffer when it ends
+        self.adaptive_pixel_map = None #Adaptive scans: edge length in pixels of the coarse pixel a value comes from, 1 where scanned at full resolution
+        self._trajectory = None #ScanTrajectory of the current scan
+        self.scan_metadata = dict() #Metadata of the current scan, e.g. the step scan pixel timing
+        self._pixel_timing = [] #(line, np.ndarray (pixels, 4)) move, settle, exposure and total s of every step scan pixel
+
+        # Volume (z-stack) scans run on their own thread, the refocus between planes starts ordinary scans
+        self._volume_thread = None
+        self._stop_volume_event = threading.Event()
+        self._volume_writer = None #VolumeStackWriter of the current or last volume scan, holds the max projection
+        self._volume_scan_data = None #ScanData of the plane scan of the current or last volume scan
+
+        self._checkpoint = None #ScanCheckpoint of the current scan
+        self._checkpoint_pending = [] #Finished lines not written to the checkpoint yet
+        self._last_checkpoint = 0
+        self._resume_checkpoint = None #Checkpoint the next start_scan continues
+        self._skip_lines = set() #Lines of a resumed scan that are already done
+        self._unattended = False #Resumed scans are not polled by the scanning logic, the scan thread ends them
+
+        self._drift_reference = None #Position {axis: m} of the drift reference emitter at the time it was set, drift tracking is off if None
+        self._drift_tracker = None #DriftTracker of the current scan
+        self._drift_offset = {ax: 0.0 for ax in ("x", "y", "z")} #Predicted drift applied to the line in progress
+        self._last_drift_check = 0
+        self._record_timing = True #False while the pixels scanned are not part of the scan image
+
+        self._overhead = None #ScanOverheadStatistics, kept over all scans since activation
+        self.scan_estimate = None #Estimated duration of the configured scan, see estimate_scan_time
 
     def on_activate(self):
         self._opm = self.OPM()
@@ -60,6 +175,8 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         self._counter = self.counter()
         
         self._opm.camera_mode()
+        self._trajectory_compiler = TrajectoryCompiler(self._trajectory_cache_size)
+        self._overhead = ScanOverheadStatistics(self._overhead_window)
         
         #Set Constraints
         self._target_pos = self.get_position()  # get the initalize position
@@ -81,6 +198,8 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
                                            unit=unit,
                                            dtype=np.float64)) 
 
+        self._configure_channels()
+
         self._constraints = ScanConstraints(axes=axes,
                                             channels=channels,
                                             backscan_configurable=False, #TODO, this has not been incorporated into the toolchain at the QUDI version level yet, will need to be updated
@@ -88,8 +207,71 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
                                             square_px_only=False #TODO this has not been incorporated into the tool chain at the QUDI version level yet, will need to be updated
                                             )
 
+        if self._line_scan_mode not in ('step', 'hardware_timed'):
+            self.log.error(f'Unknown line_scan_mode "{self._line_scan_mode}", using "step"')
+            self._line_scan_mode = 'step'
+        if self._line_scan_mode == 'hardware_timed' and not (hasattr(self._stage, 'scan_trajectory') and
+                                                             hasattr(self._counter, 'get_line_counts_async')):
+            self.log.warning('Connected stage or counter does not support hardware timed line scans, '
+                             'falling back to step scanning')
+            self._line_scan_mode = 'step'
+        if self._line_scan_mode == 'hardware_timed' and not getattr(self._counter, 'line_sync_configured', True):
+            self.log.warning('Hardware timed line scans need a line start trigger or pixel clock input on the '
+                             'counter (sync_channel or pixel_clock_channel), falling back to step scanning')
+            self._line_scan_mode = 'step'
+
         self.move_absolute(self._target_pos)
 
+    def _configure_channels(self):
+        """ Splits scan_channels into the counter channels read for every pixel and the derived channels.
+        """
+        self._counter_channels = [] #counter channel numbers, all read together in one call per pixel
+        self._channel_rows = dict() #channel name: row of the counter channel in the raw count array
+        self._derived_channels = [] #(name, operation, [channel names]) in definition order
+        for name in self._input_channel_units:
+            if name not in self._scan_channels:
+                raise ValueError(f'Scan channel "{name}" in input_channel_units has no entry in scan_channels')
+        for name, source in self._scan_channels.items():
+            if isinstance(source, dict):
+                (operation, operands), = source.items()
+                if operation not in ('sum', 'difference', 'ratio'):
+                    raise ValueError(f'Unknown operation "{operation}" of derived scan channel "{name}"')
+                if operation != 'sum' and len(operands) != 2:
+                    raise ValueError(f'Derived scan channel "{name}" needs two operands for "{operation}"')
+                self._derived_channels.append((name, operation, list(operands)))
+            else:
+                if source not in self._counter_channels:
+                    self._counter_channels.append(source)
+                self._channel_rows[name] = self._counter_channels.index(source)
+        for name, operation, operands in self._derived_channels:
+            for operand in operands:
+                if operand not in self._channel_rows:
+                    raise ValueError(f'Derived scan channel "{name}" uses "{operand}", which is not a counter channel')
+
+    def _channels_from_counts(self, raw_counts):
+        """ Builds every scan channel from the raw counts.
+
+        @param np.ndarray raw_counts: shape (counter channels, pixels) in the order of _counter_channels
+        @return dict: {channel name: np.ndarray} for every channel in scan_channels
+        """
+        raw_counts = np.asarray(raw_counts, dtype=np.float64)
+        channels = {name: raw_counts[row] for name, row in self._channel_rows.items()}
+        for name, operation, operands in self._derived_channels:
+            if operation == 'sum':
+                channels[name] = np.sum([channels[operand] for operand in operands], axis=0)
+            elif operation == 'difference':
+                channels[name] = channels[operands[0]] - channels[operands[1]]
+            else:
+                denominator = channels[operands[1]]
+                channels[name] = np.divide(channels[operands[0]], denominator,
+                                           out=np.full(denominator.shape, np.nan), where=denominator != 0)
+        return channels
+
+    def _total_counts(self, line_data):
+        """ Counts summed over all counter channels, used for the lag and adaptive scan estimates.
+        """
+        return np.sum([np.asarray(line_data[name], dtype=np.float64) for name in self._channel_rows], axis=0)
+
     @property
     def is_scan_running(self):
         """
@@ -126,11 +308,12 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         """
         pass
 
-    def configure_scan(self, scan_settings):
+    def configure_scan(self, scan_settings, apply_time_budget=True):
         """ Configure the hardware with all parameters needed for a 1D or 2D scan.
 
         @param dict scan_settings: scan_settings dictionary holding all the parameters 'axes', 'resolution', 'ranges'
         #  TODO update docstring in interface
+        @param bool apply_time_budget: reduce the settings to meet scan_time_budget, see plan_scan
 
         @return (bool, ScanSettings): Failure indicator (fail=True),
                                       altered ScanSettings instance (same as "settings")
@@ -176,6 +359,15 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
                     return True, self.scan_settings
         print("configure done sanity check")
 
+        if apply_time_budget and self._scan_time_budget is not None:
+            new_resolution, new_frequency = self.plan_scan({'axes': axes, 'resolution': resolution,
+                                                            'frequency': frequency}, self._scan_time_budget)
+            if tuple(new_resolution) != tuple(resolution) or new_frequency != frequency:
+                self.log.warning("Scan adjusted to the time budget of {0:.0f} s: resolution {1} -> {2}, frequency "
+                                 "{3:.4g} -> {4:.4g} Hz".format(self._scan_time_budget, tuple(resolution),
+                                                                new_resolution, frequency, new_frequency))
+                resolution, frequency = new_resolution, new_frequency
+
         with self._thread_lock_data:
             try:
                 self._scan_data = ScanData(
@@ -197,8 +389,71 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         self._current_scan_ranges = ranges
         self._current_scan_axes = tuple(axes)
         self._current_scan_frequency = frequency                    
+        self.scan_estimate = self.estimate_scan_time()
+        self.log.info("Estimated scan duration {0:.1f} s ({1:.1f} s from the frequency alone), achievable pixel "
+                      "rate {2:.1f} px/s".format(self.scan_estimate['duration_s'],
+                                                 self.scan_estimate['nominal_duration_s'],
+                                                 self.scan_estimate['pixel_rate_hz']))
         return False, self.scan_settings
 
+    def _scan_overhead(self, axes):
+        """ Measured overhead of the configured line_scan_mode, the configured defaults before the first scan.
+        """
+        default_pixel = self._default_pixel_overhead + self._settle_times.get(axes[0], 0)
+        default_line = self._default_line_overhead
+        if len(axes) == 2:
+            default_line += self._settle_times.get(axes[1], 0)
+        return self._overhead.overhead(self._line_scan_mode, default_pixel, default_line)
+
+    def estimate_scan_time(self, scan_settings=None):
+        """ Wall-clock duration of a scan predicted from the overhead measured in the recent scans.
+
+        @param dict scan_settings: 'axes', 'resolution' and 'frequency', the configured scan for missing entries
+        @return dict: 'duration_s', 'nominal_duration_s' (pixels times dwell time), 'pixel_rate_hz' (achievable
+                      pixel rate), 'max_pixel_rate_hz' (pixel rate at zero dwell time), 'overhead' (s per pixel and
+                      line) and 'measured' (False while the overhead is the configured default). Adaptive scans also
+                      hold 'coarse_duration_s', 'duration_s' is then the upper bound of rescanning every pixel.
+        """
+        scan_settings = dict() if scan_settings is None else scan_settings
+        axes = tuple(scan_settings.get('axes', self._current_scan_axes))
+        resolution = tuple(scan_settings.get('resolution', self._current_scan_resolution))
+        frequency = float(scan_settings.get('frequency', self._current_scan_frequency))
+        overhead = self._scan_overhead(axes)
+        lines = resolution[1] if len(axes) == 2 else 1
+        estimate = estimate_scan_time(resolution[0], lines, frequency, overhead)
+        if self._adaptive_scan and len(axes) == 2:
+            step = max(int(self._adaptive_coarse_step), 1)
+            coarse = estimate_scan_time(-(-resolution[0]//step), -(-lines//step),
+                                        frequency/self._adaptive_coarse_dwell, overhead)
+            estimate['coarse_duration_s'] = coarse['duration_s']
+            estimate['duration_s'] += coarse['duration_s']
+        estimate['overhead'] = overhead
+        estimate['measured'] = self._overhead.has_data(self._line_scan_mode)
+        return estimate
+
+    def plan_scan(self, scan_settings, time_budget, adjust=None):
+        """ Resolution and frequency of a scan whose estimated duration fits time_budget, within the constraints.
+
+        @param dict scan_settings: 'axes', 'resolution' and 'frequency' of the requested scan
+        @param float time_budget: s
+        @param str adjust: 'resolution' or 'frequency', budget_adjust if None
+        @return (tuple, float): resolution, frequency; the requested ones if they already fit
+        """
+        axes = tuple(scan_settings['axes'])
+        adjust = self._budget_adjust if adjust is None else adjust
+        if adjust not in ('resolution', 'frequency'):
+            self.log.error(f'Unknown budget adjustment "{adjust}", adjusting the resolution')
+            adjust = 'resolution'
+        overhead = self._scan_overhead(axes)
+        if self._adaptive_scan and len(axes) == 2:
+            # An adaptive scan takes at most its coarse pass plus the dense scan, the coarse pass is spread over the
+            # pixels of the dense scan at the requested frequency.
+            step = max(int(self._adaptive_coarse_step), 1)
+            coarse_pixel = overhead['pixel'] + self._adaptive_coarse_dwell/float(scan_settings['frequency'])
+            overhead = {'pixel': overhead['pixel'] + coarse_pixel/step**2, 'line': overhead['line']*(1 + 1/step)}
+        return fit_to_budget(scan_settings['resolution'], float(scan_settings['frequency']), overhead, time_budget,
+                             self._frequency_ranges[axes[0]], [self._resolution_ranges[ax] for ax in axes], adjust)
+
     def move_absolute(self, position, velocity=None, blocking=False):
         """ Move the scanning probe to an absolute position as fast as possible or with a defined
         velocity.
@@ -275,85 +530,808 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         @return (bool): Failure indicator (fail=True)
         """
         self.log.info("Starting Scan")
-        lin_spaces={}
         self._opm.scanning_mode()
         with self._thread_lock_data:
             if self.module_state() != 'idle':
                 self.log.error('Can not start scan. Scan already in progress.')
                 return -1
+            resume, self._resume_checkpoint = self._resume_checkpoint, None
+            if resume is not None and any(data.shape != tuple(self._current_scan_resolution)
+                                          for data in resume.data.values()):
+                self.log.error('Scan resolution {0} does not match the checkpoint {1}'
+                               ''.format(self._current_scan_resolution, resume.path))
+                return -1
+            reserved = self._reserve_time_tags()
+            if reserved is None:
+                return -1
+            self._release_time_tags = reserved
+            # get_scan_data hands out _scan_data itself, the finished scan keeps its own instance.
+            self._scan_data = self._scan_data.copy()
             self._scan_data.new_scan()
             self._stored_target_pos = self.get_target().copy()
             self.module_state.lock()
             self._old_pos = self._stage.calibrate()
-            i=0
-            for axis in self._current_scan_axes:
-                lin_spaces[axis]=np.linspace(self._current_scan_ranges[i][0],
-                                   self._current_scan_ranges[i][1],
-                                   self._current_scan_resolution[i])
-                i+=1
-            for ax in ["x", "y", "z"]:
-                if ax not in lin_spaces.keys():
-                    lin_spaces[ax]=np.array([self._target_pos[ax]])
-            self.scanner_steps=lin_spaces
-            self.line_to_scan=-1
+            self._trajectory = self.compile_trajectory()
+            self._reset_scan_state()
+            self._setup_drift_tracking()
+            self._setup_checkpoint(resume)
+            self._stop_scan_event.clear()
+            self._scan_thread = threading.Thread(target=self._run_scan, name='ozymandias_scan', daemon=True)
+            self._scan_thread.start()
         return True
 
+    def _reserve_time_tags(self):
+        """ Reserves the time tag buffer of the counter for a hardware timed scan, nothing to do for step scans.
+        A time tag stream recording drains the same buffer, so both can not run at once.
+
+        @return bool: True if the buffer was reserved here and has to be released after the scan, False if it is not
+                      needed or already held by the volume scan around this scan, None if another consumer holds it
+        """
+        if self._line_scan_mode != 'hardware_timed' or self._counter.timestamp_owner == self._timestamp_owner:
+            return False
+        if not self._counter.reserve_timestamps(self._timestamp_owner):
+            self.log.error(f'Can not start a hardware timed scan while the {self._counter.timestamp_owner} reads the '
+                           f'time tags')
+            return None
+        return True
+
+    def _reset_scan_state(self):
+        """ Clears buffers, counters and metadata of the previous scan, needs _thread_lock_data.
+        """
+        self._pixel_timing = []
+        self.scan_metadata = {'line_scan_mode': self._line_scan_mode,
+                              'serpentine': bool(self._serpentine),
+                              'adaptive_scan': bool(self._adaptive_scan),
+                              'settle_times': dict(self._settle_times),
+                              'estimate': self.scan_estimate}
+        self.line_to_scan=-1
+        self.line_lag = 0.0
+        self._previous_forward_line = None
+        self._scan_buffer = {ch: np.full(self._scan_data.data[ch].shape, np.nan)
+                             for ch in self._constraints.channels}
+        self._line_updates = []
+        self._lines_published = 0
+        self.adaptive_pixel_map = None
+        self._scan_finished = False
+        self._drift_tracker = None
+        self._drift_offset = {ax: 0.0 for ax in ("x", "y", "z")}
+
+    def set_drift_reference(self, position=None):
+        """ Sets the emitter the drift of dense and adaptive scans is tracked on.
+
+        Every drift_interval the scan is interrupted between two lines, the reference emitter is localised with one
+        short line scan along each of drift_axes around its predicted position, and a polynomial of time is fitted to
+        the measured offsets. Every following line is shifted by the offset the model predicts for the middle of the
+        line. The localisations and the model are logged in scan_metadata['drift'].
+
+        @param dict position: {axis: m} of a bright, isolated emitter inside the scan range, e.g. a POI position,
+                              None to switch drift tracking off
+        @return bool: Failure indicator (fail=True)
+        """
+        if position is None:
+            self._drift_reference = None
+            return False
+        if not set(position).issubset(self._position_ranges):
+            self.log.error('Invalid axes name in drift reference position')
+            return True
+        if not set(self._drift_axes).issubset(self._position_ranges):
+            self.log.error('Invalid drift_axes {0}'.format(self._drift_axes))
+            return True
+        reference = dict(self.get_target())
+        reference.update({ax: float(pos) for ax, pos in position.items()})
+        self._drift_reference = reference
+        self.log.info("Drift reference set to {0}".format(reference))
+        return False
+
+    def _setup_drift_tracking(self):
+        """ Starts a new drift model if a drift reference is set, needs _thread_lock_data.
+        """
+        if self._drift_reference is None:
+            return
+        self._drift_tracker = DriftTracker(self._drift_axes, self._drift_model_order, self._drift_history)
+        self._last_drift_check = None
+        self.scan_metadata['drift'] = {'reference': dict(self._drift_reference),
+                                       'interval': self._drift_interval,
+                                       'localisations': [],
+                                       'line_offsets': []}
+
+    def _track_drift(self, line):
+        """ Localises the reference emitter if drift_interval passed and sets the drift offset of the next line.
+        """
+        if self._drift_tracker is None:
+            return
+        now = time.monotonic()
+        if self._last_drift_check is None or now - self._last_drift_check >= self._drift_interval:
+            self._localise_drift_reference()
+            self._last_drift_check = time.monotonic()
+            now = self._last_drift_check
+        line_duration = self._current_scan_resolution[0]/self._current_scan_frequency
+        self._drift_offset.update(self._drift_tracker.predict(now + line_duration/2))
+        self.scan_metadata['drift']['line_offsets'].append((int(line), dict(self._drift_offset)))
+
+    def _localise_drift_reference(self):
+        """ Line scans through the predicted position of the reference emitter, one axis after the other, each
+        centred on the peak found along the previous axes. The offset is added to the drift model if the emitter
+        was found along every axis.
+        """
+        predicted = self._drift_tracker.predict(time.monotonic())
+        centre = {ax: self._drift_reference[ax] + predicted.get(ax, 0.0) for ax in ("x", "y", "z")}
+        frequency = self._drift_frequency if self._drift_frequency is not None else self._current_scan_frequency
+        # The pixel timing of the scan is kept free of the reference scans.
+        self._record_timing = False
+        found = True
+        try:
+            for ax in self._drift_axes:
+                positions = np.linspace(centre[ax] - self._drift_range/2, centre[ax] + self._drift_range/2,
+                                        int(self._drift_pixels))
+                path = {a: np.full(positions.size, centre[a]) for a in ("x", "y", "z")}
+                path[ax] = positions
+                peak = locate_peak(positions, self._total_counts(self.scan_pixels(path, frequency)))
+                if peak is None:
+                    found = False
+                    break
+                centre[ax] = peak
+        finally:
+            self._record_timing = True
+        now = time.monotonic()
+        localisation = {'time': datetime.now().isoformat(),
+                        'line': int(self.line_to_scan),
+                        'predicted': predicted}
+        if found:
+            offset = {ax: centre[ax] - self._drift_reference[ax] for ax in self._drift_axes}
+            self._drift_tracker.add(now, offset)
+            localisation['measured'] = offset
+            self.scan_metadata['drift'].update(self._drift_tracker.to_dict())
+        else:
+            self.log.warning('Drift reference emitter not found around {0}, keeping the drift model'.format(centre))
+            localisation['measured'] = None
+        self.scan_metadata['drift']['localisations'].append(localisation)
+
+    def _checkpoint_settings(self):
+        return {'axes': list(self._current_scan_axes),
+                'range': [list(r) for r in self._current_scan_ranges],
+                'resolution': list(self._current_scan_resolution),
+                'frequency': self._current_scan_frequency,
+                'position': {ax: float(pos) for ax, pos in self._target_pos.items()},
+                'channel_units': dict(self._input_channel_units),
+                'scan_channels': self._scan_channels,
+                'line_scan_mode': self._line_scan_mode,
+                'serpentine': bool(self._serpentine),
+                'lag_compensation': bool(self._lag_compensation)}
+
+    def _setup_checkpoint(self, resume=None):
+        """ Creates the checkpoint of a new scan, or fills the scan buffer from the checkpoint of a resumed scan.
+        Needs _thread_lock_data.
+        """
+        self._checkpoint = None
+        self._checkpoint_pending = []
+        self._last_checkpoint = time.monotonic()
+        self._skip_lines = set()
+        self._unattended = False
+        if resume is not None:
+            lines = sorted(resume.lines_done)
+            for ch in self._constraints.channels:
+                if len(self._current_scan_axes) == 2:
+                    self._scan_buffer[ch][:, lines] = resume.data[ch][:, lines]
+                elif lines:
+                    self._scan_buffer[ch][:] = resume.data[ch]
+            self._line_updates = list(lines)
+            self._skip_lines = set(lines)
+            self._checkpoint = resume
+            self._unattended = True
+            self.scan_metadata['resumed_from'] = resume.path
+            self.log.info("Resuming scan {0}, {1} of {2} lines done".format(resume.path, len(lines), self._line_count))
+        elif self._checkpoint_dir is not None and not self._adaptive_scan:
+            path = os.path.join(self._checkpoint_dir, 'scan_' + datetime.now().strftime('%Y%m%d-%H%M%S-%f'))
+            try:
+                self._checkpoint = ScanCheckpoint.create(path, self._checkpoint_settings(),
+                                                         self._scan_buffer[next(iter(self._scan_buffer))].shape)
+                self.scan_metadata['checkpoint'] = path
+            except Exception:
+                self.log.exception('Unable to create the scan checkpoint, scanning without')
+
+    def _write_checkpoint(self, force=False):
+        """ Writes the finished lines to the checkpoint once checkpoint_interval passed, or now if force.
+        """
+        if self._checkpoint is None or not self._checkpoint_pending:
+            return
+        if not force and time.monotonic() - self._last_checkpoint < self._checkpoint_interval:
+            return
+        try:
+            with self._thread_lock_data:
+                lines, self._checkpoint_pending = self._checkpoint_pending, []
+                self._checkpoint.write_lines(self._scan_buffer, lines)
+        except Exception:
+            self.log.exception('Writing the scan checkpoint failed')
+        self._last_checkpoint = time.monotonic()
+
+    def resume_scan(self, path):
+        """ Continues a checkpointed scan at the lines that are missing.
+
+        Configures the scan from the checkpoint without applying scan_time_budget, moves the axes that are not
+        scanned to their position at the scan start and starts the scan. The line acquisition options
+        (line_scan_mode, serpentine, lag_compensation) have to match the ones the scan was started with. Lines already done are loaded instead of scanned, new lines are added to
+        the same checkpoint. The resumed scan ends by itself, the finished data is in the checkpoint and in
+        get_scan_data.
+
+        @param str path: checkpoint directory, see checkpoint_dir
+        @return bool: Failure indicator (fail=True)
+        """
+        try:
+            checkpoint = ScanCheckpoint.open(path)
+        except Exception:
+            self.log.exception('Unable to open scan checkpoint {0}'.format(path))
+            return True
+        if checkpoint.complete:
+            self.log.info('Scan {0} is already complete'.format(path))
+            return True
+        settings = checkpoint.settings
+        if set(settings['channel_units']) != set(self._input_channel_units):
+            self.log.error('Scan channels of the checkpoint {0} do not match the configured channels'
+                           ''.format(list(settings['channel_units'])))
+            return True
+        if self._adaptive_scan:
+            self.log.error('Adaptive scans can not resume checkpointed scans, switch adaptive_scan off')
+            return True
+        options = {key: value for key, value in self._checkpoint_settings().items()
+                   if key in ('line_scan_mode', 'serpentine', 'lag_compensation') and settings.get(key) != value}
+        if options:
+            self.log.error('Line acquisition options {0} differ from the checkpoint {1}'
+                           ''.format(options, {key: settings.get(key) for key in options}))
+            return True
+        fail, configured = self.configure_scan({'axes': tuple(settings['axes']),
+                                                'range': tuple(tuple(r) for r in settings['range']),
+                                                'resolution': tuple(settings['resolution']),
+                                                'frequency': settings['frequency']}, apply_time_budget=False)
+        if fail:
+            return True
+        if tuple(configured['resolution']) != tuple(settings['resolution']) \
+                or not np.allclose(configured['range'], settings['range']) \
+                or not np.isclose(configured['frequency'], settings['frequency']):
+            self.log.error('Scanner configured {0} instead of the checkpoint settings'.format(configured))
+            return True
+        fixed = {ax: pos for ax, pos in settings['position'].items() if ax not in settings['axes']}
+        self.move_absolute(fixed, blocking=True)
+        self._resume_checkpoint = checkpoint
+        if self.start_scan() is not True:
+            self._resume_checkpoint = None
+            return True
+        return False
+
+    def start_volume_scan(self, z_range, z_resolution, path, refocus=None, refocus_every=1):
+        """ Scans the configured x/y plane at every z of z_range and streams each finished plane to disk.
+
+        RAM use is one plane per channel independent of the number of planes. The planes are stored with
+        VolumeStackWriter in path, get_volume_preview returns the maximum projection of the planes done so far.
+
+        @param tuple z_range: (min, max) z in m
+        @param int z_resolution: number of planes
+        @param str path: directory the stack is written to, must not exist
+        @param callable refocus: blocking call that optimizes on a reference emitter and returns the optimal
+                                 position {axis: position}, e.g. ScanningOptimizeLogic.optimize_blocking.
+                                 It is called with the keyword argument abort, a threading.Event set by
+                                 stop_volume_scan, with this module idle and the stage at the drift corrected start
+                                 position. The offset to the start position is applied to all following planes.
+        @param int refocus_every: planes between two refocus runs
+        @return bool: Failure indicator (fail=True)
+        """
+        if self._scan_data is None or len(self._current_scan_axes) != 2 or 'z' in self._current_scan_axes:
+            self.log.error('Volume scans need a configured 2D scan of the x/y plane')
+            return True
+        z_min, z_max = min(z_range), max(z_range)
+        if z_min < min(self._position_ranges['z']) or z_max > max(self._position_ranges['z']):
+            self.log.error('Volume scan z range {0} is out of bounds {1}'.format(z_range, self._position_ranges['z']))
+            return True
+        z_positions = np.linspace(z_range[0], z_range[1], int(z_resolution))
+        with self._thread_lock_data:
+            if self.module_state() != 'idle':
+                self.log.error('Can not start volume scan. Scan already in progress.')
+                return True
+            self._scan_data = self._scan_data.copy()
+            self._scan_data.new_scan()
+            self._volume_scan_data = self._scan_data
+            release_time_tags = self._reserve_time_tags()
+            if release_time_tags is None:
+                return True
+            self._stored_target_pos = self.get_target().copy()
+            self.module_state.lock()
+            self._old_pos = self._stage.calibrate()
+            self._reset_scan_state()
+            self.scan_metadata['volume'] = {'path': path,
+                                            'z_range': (z_range[0], z_range[1]),
+                                            'z_resolution': int(z_resolution),
+                                            'refocus_every': refocus_every if refocus is not None else None,
+                                            'refocus_offsets': []}
+            try:
+                self._volume_writer = VolumeStackWriter(path, self._current_scan_axes, self._current_scan_ranges,
+                                                        self._current_scan_resolution, z_positions,
+                                                        self._input_channel_units,
+                                                        metadata={'frequency': self._current_scan_frequency,
+                                                                  'start_position': self._stored_target_pos})
+            except Exception:
+                self.log.exception('Unable to create the volume stack')
+                if release_time_tags:
+                    self._counter.release_timestamps(self._timestamp_owner)
+                self.module_state.unlock()
+                return True
+            self._stop_volume_event.clear()
+            self._volume_thread = threading.Thread(target=self._run_volume_scan,
+                                                   args=(z_positions, refocus, max(int(refocus_every), 1),
+                                                         release_time_tags),
+                                                   name='ozymandias_volume_scan', daemon=True)
+        self.log.info("Starting volume scan of {0} planes".format(len(z_positions)))
+        self._opm.scanning_mode()
+        self._volume_thread.start()
+        return False
+
+    def stop_volume_scan(self):
+        """ Stops the volume scan after the line in progress and aborts a running refocus, planes finished so
+        far stay on disk.
+
+        @return bool: Failure indicator (fail=True), True if the volume thread did not end within stop_timeout
+        """
+        self._stop_volume_event.set()
+        if self._volume_thread is not None and self._volume_thread is not threading.current_thread():
+            self._volume_thread.join(self._stop_timeout)
+            if self._volume_thread.is_alive():
+                self.log.error('Volume scan did not stop within {0} s'.format(self._stop_timeout))
+                return True
+        return False
+
+    @property
+    def is_volume_scan_running(self):
+        return self._volume_thread is not None and self._volume_thread.is_alive()
+
+    def get_volume_preview(self):
+        """ Maximum projection along z of the planes of the current or last volume scan.
+
+        @return ScanData: copy of the plane ScanData holding the projection, None without volume scan
+        """
+        with self._thread_lock_data:
+            if self._volume_writer is None:
+                return None
+            preview = self._volume_scan_data.copy()
+            for ch, projection in self._volume_writer.max_projection.items():
+                preview.data[ch][:] = projection
+            return preview
+
+    def _run_volume_scan(self, z_positions, refocus, refocus_every, release_time_tags=False):
+        """ Volume thread, acquires plane after plane into _scan_buffer and hands finished planes to the writer.
+        """
+        settings = (self._current_scan_axes, self._current_scan_ranges, self._current_scan_resolution,
+                    self._current_scan_frequency)
+        reference = dict(self._stored_target_pos)
+        offset = {ax: 0.0 for ax in ("x", "y", "z")}
+        planes_done = 0
+        try:
+            for plane, z in enumerate(z_positions):
+                if self._stop_volume_event.is_set():
+                    break
+                if refocus is not None and plane > 0 and plane % refocus_every == 0:
+                    offset = self._refocus_volume(refocus, reference, offset, settings)
+                    self.scan_metadata['volume']['refocus_offsets'].append((plane, dict(offset)))
+                self._current_scan_ranges = tuple((low + offset[ax], high + offset[ax])
+                                                  for ax, (low, high) in zip(settings[0], settings[1]))
+                self._target_pos["z"] = z + offset["z"]
+                self._trajectory = self.compile_trajectory()
+                for line in range(self._line_count):
+                    if self._stop_volume_event.is_set():
+                        break
+                    self.line_to_scan = line
+                    self._write_line(line, self.scan_line(line))
+                else:
+                    with self._thread_lock_data:
+                        plane_data = {ch: self._scan_buffer[ch].copy() for ch in self._input_channel_units}
+                        self._publish_lines()
+                    self._volume_writer.write_plane(plane, z + offset["z"], plane_data)
+                    planes_done = plane + 1
+        except Exception as e:
+            self.log.exception(f"Exception in volume scan\n{e}")
+        finally:
+            if release_time_tags:
+                self._counter.release_timestamps(self._timestamp_owner)
+            self._current_scan_ranges = settings[1]
+            self._volume_writer.close(metadata={'planes_done': planes_done,
+                                                'refocus_offsets': self.scan_metadata['volume']['refocus_offsets']})
+            self.log.info("Volume scan finished after {0} of {1} planes".format(planes_done, len(z_positions)))
+            self._opm.camera_mode()
+            with self._thread_lock_data:
+                self._scan_finished = True
+                if self.module_state() == 'locked':
+                    self.module_state.unlock()
+            self.move_absolute(reference)
+
+    def _refocus_volume(self, refocus, reference, offset, settings):
+        """ Runs refocus with this module idle and restores the volume scan afterwards.
+
+        @return dict: new offset {axis: optimal position - start position}, the old offset if refocus failed
+        """
+        self.move_absolute({ax: reference[ax] + offset[ax] for ax in offset}, blocking=True)
+        # The optimizer configures and runs scans of its own through this module.
+        with self._thread_lock_data:
+            stash = (self._scan_data, self._scan_buffer, self._line_updates, self._lines_published,
+                     self._pixel_timing, self.scan_metadata)
+            self.module_state.unlock()
+        try:
+            optimal = refocus(abort=self._stop_volume_event)
+        except Exception:
+            self.log.exception('Refocus between volume planes failed, keeping the last offset')
+            optimal = None
+        finally:
+            with self._thread_lock_data:
+                if self.module_state() == 'idle':
+                    self.module_state.lock()
+                (self._current_scan_axes, self._current_scan_ranges, self._current_scan_resolution,
+                 self._current_scan_frequency) = settings
+                (self._scan_data, self._scan_buffer, self._line_updates, self._lines_published,
+                 self._pixel_timing, self.scan_metadata) = stash
+                self._scan_finished = False
+        if not optimal:
+            return offset
+        new_offset = {ax: (optimal[ax] - reference[ax]) if ax in optimal else offset[ax] for ax in offset}
+        self.log.info("Volume scan refocus offset: {0}".format(new_offset))
+        return new_offset
+
     def stop_scan(self):
         """
 
         @return bool: Failure indicator (fail=True)
         """
         self.log.info("Stopping Scan")
+        self._stop_scan_event.set()
+        if self._scan_thread is not None and self._scan_thread is not threading.current_thread():
+            # the line in progress is finished first
+            self._scan_thread.join()
         self._opm.camera_mode()
         with self._thread_lock_data:
+            self._publish_lines()
             if self.module_state() == 'locked':
                 self.module_state.unlock()
             if self._old_pos:
                 self.move_absolute(self._old_pos)
             return False
 
+    def compile_trajectory(self):
+        """ Positions, and the stage output values if the stage can precompute them, of every pixel of the
+        configured scan. Repeated scans with the same settings and stage calibration reuse the cached trajectory.
+
+        @return ScanTrajectory: read-only trajectory of the configured scan
+        """
+        fixed_position = {ax: self._target_pos[ax] for ax in ["x", "y", "z"] if ax not in self._current_scan_axes}
+        calibration = None
+        compile_outputs = None
+        if hasattr(self._stage, 'compile_trajectory'):
+            calibration = self._stage.trajectory_calibration()
+            compile_outputs = self._stage.compile_trajectory
+        return self._trajectory_compiler.compile(self._current_scan_axes, self._current_scan_ranges,
+                                                 self._current_scan_resolution, fixed_position,
+                                                 calibration, compile_outputs)
+
+    def get_line_path(self, line_to_scan, backward=False):
+        """ Position arrays of every pixel of a line, read-only views of the compiled trajectory.
+
+        @param int line_to_scan: index of the line along the slow axis
+        @param bool backward: the line is traversed from its last to its first pixel
+        @return dict: {axis: np.ndarray} with one position per pixel for x, y and z in traversal order
+        """
+        line_path = self._trajectory.line(line_to_scan)
+        if any(self._drift_offset.values()):
+            line_path = {ax: path + self._drift_offset.get(ax, 0.0) for ax, path in line_path.items()}
+        if backward:
+            line_path = {ax: path[::-1] for ax, path in line_path.items()}
+        return line_path
+
+    def get_line_outputs(self, line_to_scan, pixels=None):
+        """ Precompiled stage output values of a line (or of the given pixels of it), None if the stage has none
+        or the line is shifted by the drift correction.
+        """
+        if any(self._drift_offset.values()):
+            return None
+        return self._trajectory.line_outputs(line_to_scan, pixels)
+
+    def is_backward_line(self, line_to_scan):
+        """ Odd lines of a serpentine 2D scan are acquired backwards. """
+        return bool(self._serpentine) and len(self._current_scan_axes) == 2 and line_to_scan % 2 == 1
+
     def scan_line(self, line_to_scan):
-        # Find not active axes
-        # Set not active axes position
-        # Set the x, y, z list position
-        line_path={}
-        result={"APD1": [], "APD2":[], "SUM":[]}
-        for ax in ["x", "y", "z"]:
-            if len(self.scanner_steps[ax]==1):
-                line_path[ax]=[self.scanner_steps[ax][0]]*self._current_scan_resolution[0]
-        
-        line_path[self._current_scan_axes[0]]=self.scanner_steps[self._current_scan_axes[0]]
-        if len(self._current_scan_axes)==2:
-            line_path[self._current_scan_axes[1]]=[self.scanner_steps[self._current_scan_axes[1]][line_to_scan]]*self._current_scan_resolution[0]
-        
-        #time.sleep(0.1)
-        stepTimes=[]
-        for k in range(self._current_scan_resolution[0]):
-            if k==0:
-                blocking=True #Blocks for each new line to avoid artifacts in the image.
-            else:
-                blocking=False
-            start=time.perf_counter()
-            self.move_absolute({"x":line_path["x"][k], "y":line_path["y"][k], "z":line_path["z"][k]}, blocking=blocking)
-            #stop=time.perf_counter()
-            #mvTime=stop-start
-            counts=self._counter.get_qutag_counts([1,2], 1/self._current_scan_frequency)
-
-            #ct1Stop=time.perf_counter()
-            result["APD1"].append(counts[0])
-            result["APD2"].append(counts[1])
-            result["SUM"].append(counts[0]+counts[1])
-            totalStop=time.perf_counter()
-            stepTimes.append(totalStop-start)
-            #print("Total Loop Step: " + str(totalStop-start))
-        #print(stepTimes)
-        result["APD1"]=np.array(result['APD1'])
-        result["APD2"]=np.array(result['APD2'])
-        result["SUM"]=np.array(result['SUM'])
-        return result
+        """ Acquires one line of the scan with the configured line_scan_mode.
 
-    def get_scan_data(self):
+        @param int line_to_scan: index of the line along the slow axis
+        @return dict: {channel: np.ndarray} counts of every pixel in the line, always in forward pixel order
+        """
+        backward = self.is_backward_line(line_to_scan)
+        line_path = self.get_line_path(line_to_scan, backward)
+        outputs = self.get_line_outputs(line_to_scan)
+        if outputs is not None and backward:
+            outputs = outputs[::-1]
+        line_data = self.scan_pixels(line_path, outputs=outputs)
+        if backward:
+            line_data = {ch: np.asarray(counts)[::-1] for ch, counts in line_data.items()}
+        if self._lag_compensation and len(self._current_scan_axes) == 2:
+            line_data = self._compensate_lag(line_data, backward)
+        return line_data
+
+    def scan_pixels(self, path, frequency=None, outputs=None):
+        """ Acquires the pixels of path in order with the configured line_scan_mode.
+
+        @param dict path: {axis: np.ndarray} one position per pixel for x, y and z
+        @param float frequency: pixel frequency, the scan frequency if None
+        @param np.ndarray outputs: precompiled stage output values of the pixels in path order, if available
+        @return dict: {channel: np.ndarray} counts of every pixel in path order
+        """
+        if frequency is None:
+            frequency = self._current_scan_frequency
+        if self._line_scan_mode == 'hardware_timed':
+            return self._scan_line_hardware_timed(path, frequency, outputs)
+        return self._scan_line_stepped(path, frequency)
+
+    def _compensate_lag(self, line_data, backward):
+        """ Aligns a backward line with the forward line acquired just before it.
+
+        The shift is estimated on the counts summed over all counter channels. Lines without structure keep the last estimate.
+        """
+        if not backward:
+            self._previous_forward_line = self._total_counts(line_data)
+            return line_data
+        if self._previous_forward_line is not None:
+            shift = _estimate_line_shift(self._previous_forward_line, self._total_counts(line_data),
+                                         self._max_lag_pixels)
+            if shift is not None:
+                self.line_lag = shift
+        if self.line_lag == 0:
+            return line_data
+        pixels = np.arange(self._current_scan_resolution[0], dtype=np.float64)
+        return {ch: np.interp(pixels + self.line_lag, pixels, counts) for ch, counts in line_data.items()}
+
+    def _scan_line_hardware_timed(self, line_path, frequency, outputs=None):
+        """ Writes the whole line trajectory in one buffered output and bins the counts from the time tags read
+        while it is written.
+
+        A line that lost time tags to a buffer overflow is listed in scan_metadata['data_lost_lines'].
         """
+        pixel_count = len(line_path["x"])
+        line_start = time.perf_counter()
+        # Settle on the first pixel before the line starts to avoid artifacts in the image.
+        self.move_absolute({ax: line_path[ax][0] for ax in line_path}, blocking=True)
+        self._counter.start_line_acquisition()
+        line_counts = self._counter.get_line_counts_async(self._counter_channels, pixel_count, 1/frequency)
+        if outputs is not None:
+            self._stage.scan_trajectory(line_path, frequency, outputs)
+        else:
+            self._stage.scan_trajectory(line_path, frequency)
+        counts, data_lost = line_counts.result()
+        if data_lost and self._record_timing:
+            lost_lines = self.scan_metadata.setdefault('data_lost_lines', [])
+            if self.line_to_scan not in lost_lines:
+                lost_lines.append(self.line_to_scan)
+        for ax in line_path:
+            self._target_pos[ax] = line_path[ax][-1]
+        self._overhead.add_hardware_timed_line(pixel_count, 1/frequency, time.perf_counter() - line_start)
+
+        return self._channels_from_counts(counts)
+
+    def _settle_time(self, previous, target):
+        """ Longest configured settle time of the axes that move between two pixels.
+        """
+        moved = [ax for ax in target if previous is None or target[ax] != previous[ax]]
+        return max((self._settle_times.get(ax, 0) for ax in moved), default=0)
+
+    def _scan_line_stepped(self, line_path, frequency):
+        """ Moves to every pixel and reads the counter.
+
+        The stage has to stand still for the whole exposure, so the move to the next pixel is issued right after
+        the counts of a pixel are read. After a move only the settle time of the axes that actually moved is
+        waited. The per-pixel timing is recorded in the scan metadata.
+        """
+        pixel_count = len(line_path["x"])
+        dwell = 1/frequency
+        raw_counts = np.empty((len(self._counter_channels), pixel_count))
+        timing = np.empty((pixel_count, 4))
+        previous = None
+        line_start = time.perf_counter()
+        for k in range(pixel_count):
+            target = {ax: line_path[ax][k] for ax in ("x", "y", "z")}
+            start = time.perf_counter()
+            # Blocks for each new line to avoid artifacts in the image.
+            self.move_absolute(target, blocking=(k == 0))
+            moved = time.perf_counter()
+            remaining = self._settle_time(previous, target) - (moved - start)
+            if remaining > 0:
+                time.sleep(remaining)
+            settled = time.perf_counter()
+            counts = self._counter.get_qutag_counts(self._counter_channels, dwell)
+            exposed = time.perf_counter()
+            raw_counts[:, k] = counts
+            timing[k] = (moved - start, settled - moved, exposed - settled, exposed - start)
+            previous = target
+        self._record_line_timing(timing, dwell, time.perf_counter() - line_start)
+        return self._channels_from_counts(raw_counts)
+
+    def _record_line_timing(self, timing, dwell, line_time):
+        """ Adds the line to the overhead statistics, appends its pixel timing and updates the timing summary in
+        scan_metadata.
+        """
+        self._overhead.add_step_line(timing, dwell, line_time)
+        if not self._record_timing:
+            return
+        self._pixel_timing.append((self.line_to_scan, timing))
+        all_timing = np.concatenate([line_timing for _, line_timing in self._pixel_timing])
+        mean = all_timing.mean(axis=0)
+        self.scan_metadata['pixel_timing'] = {'pixels': len(all_timing),
+                                              'mean_move_s': mean[0],
+                                              'mean_settle_s': mean[1],
+                                              'mean_exposure_s': mean[2],
+                                              'mean_total_s': mean[3],
+                                              'max_total_s': all_timing[:, 3].max()}
+
+    def get_pixel_timing(self):
+        """ Per-pixel timing of the current or last step scan.
+
+        @return list: [(line index, np.ndarray of shape (pixels, 4)), ...], columns are the move, settle, exposure
+                      and total time in s, pixels in acquisition order
+        """
+        return list(self._pixel_timing)
+
+    def get_scan_metadata(self):
+        """ Settings and timing summary of the current or last scan.
+        """
+        return dict(self.scan_metadata)
+
+    @property
+    def _line_count(self):
+        if len(self._current_scan_axes) == 2:
+            return self._current_scan_resolution[1]
+        return 1
+
+    def _run_scan(self):
+        """ Producer thread, acquires every line of the scan into _scan_buffer.
+        """
+        scan_start = time.monotonic()
+        try:
+            if self._adaptive_scan and len(self._current_scan_axes) == 2:
+                self._run_adaptive_scan()
+                return
+            for line in range(self._line_count):
+                if self._stop_scan_event.is_set():
+                    break
+                if line in self._skip_lines:
+                    continue
+                self.line_to_scan = line
+                self._track_drift(line)
+                line_data = self.scan_line(line)
+                self._write_line(line, line_data)
+                if self._checkpoint is not None:
+                    self._checkpoint_pending.append(line)
+                    self._write_checkpoint()
+        except Exception as e:
+            self.log.exception(f"Exception in scan line acquisition\n{e}")
+        finally:
+            if self._release_time_tags:
+                self._counter.release_timestamps(self._timestamp_owner)
+            self.scan_metadata['duration_s'] = time.monotonic() - scan_start
+            self._write_checkpoint(force=True)
+            if self._checkpoint is not None and len(self._checkpoint.lines_done) >= self._line_count:
+                self._checkpoint.mark_complete()
+            self._scan_finished = True
+            if self._unattended:
+                with self._thread_lock_data:
+                    self._publish_lines()
+                    if self.module_state() == 'locked':
+                        self.log.info("Resumed scan complete" if self._checkpoint.complete else "Resumed scan stopped")
+                        self._opm.camera_mode()
+                        self.module_state.unlock()
+
+    def _run_adaptive_scan(self):
+        """ Coarse pass over every adaptive_coarse_step-th pixel and line at a fraction of the dwell time, then a
+        full resolution, full dwell pass over the bright coarse pixels and their neighbourhood.
+
+        Coarse counts are scaled to the full dwell time and fill the whole block of their coarse pixel, so the
+        merged image has a single scale. adaptive_pixel_map records which resolution every pixel comes from.
+        """
+        step = max(int(self._adaptive_coarse_step), 1)
+        nx, ny = self._current_scan_resolution[0], self._current_scan_resolution[1]
+        coarse_x = np.arange(0, nx, step)
+        coarse_y = np.arange(0, ny, step)
+        coarse_frequency = self._current_scan_frequency/self._adaptive_coarse_dwell
+        coarse_sum = np.zeros((coarse_x.size, coarse_y.size))
+        pixel_map = np.full((nx, ny), step, dtype=np.int64)
+
+        for j, line in enumerate(coarse_y):
+            if self._stop_scan_event.is_set():
+                return
+            self.line_to_scan = line
+            self._track_drift(line)
+            backward = bool(self._serpentine) and j % 2 == 1
+            pixels = coarse_x[::-1] if backward else coarse_x
+            path = {ax: positions[pixels] for ax, positions in self.get_line_path(line).items()}
+            counts = self.scan_pixels(path, coarse_frequency, self.get_line_outputs(line, pixels))
+            if backward:
+                counts = {ch: np.asarray(values)[::-1] for ch, values in counts.items()}
+            ratios = {name for name, operation, _ in self._derived_channels if operation == 'ratio'}
+            counts = {ch: np.asarray(values, dtype=np.float64)/(1 if ch in ratios else self._adaptive_coarse_dwell)
+                      for ch, values in counts.items()}
+            coarse_sum[:, j] = self._total_counts(counts)
+            block = {ch: np.repeat(values, step)[:nx] for ch, values in counts.items()}
+            for block_line in range(line, min(line + step, ny)):
+                self._write_line(block_line, block)
+
+        rates = coarse_sum*self._current_scan_frequency
+        threshold = self._adaptive_threshold
+        if threshold is None:
+            median = np.median(rates)
+            threshold = median + 3*1.4826*np.median(np.abs(rates - median))
+        bright = _dilate(rates > threshold, int(self._adaptive_neighbourhood))
+        fine = np.repeat(np.repeat(bright, step, axis=0), step, axis=1)[:nx, :ny]
+        self.log.info(f"Adaptive scan: {int(fine.sum())} of {nx*ny} pixels above {threshold:.3g} c/s "
+                      f"are rescanned at full resolution")
+
+        fine_lines = np.flatnonzero(fine.any(axis=0))
+        for j, line in enumerate(fine_lines):
+            if self._stop_scan_event.is_set():
+                break
+            self.line_to_scan = line
+            self._track_drift(line)
+            backward = bool(self._serpentine) and j % 2 == 1
+            pixels = np.flatnonzero(fine[:, line])
+            if backward:
+                pixels = pixels[::-1]
+            path = {ax: positions[pixels] for ax, positions in self.get_line_path(line).items()}
+            counts = self.scan_pixels(path, outputs=self.get_line_outputs(line, pixels))
+            self._write_line(line, counts, pixels)
+            pixel_map[pixels, line] = 1
+        self.adaptive_pixel_map = pixel_map
+
+    def _write_line(self, line, line_data, pixels=None):
+        """ Stores acquired counts of one line in _scan_buffer, all pixels or only the given pixel indices.
+        """
+        with self._thread_lock_data:
+            for ch in self._constraints.channels:
+                if len(self._current_scan_axes) != 2:
+                    self._scan_buffer[ch][:] = line_data[ch]
+                elif pixels is None:
+                    self._scan_buffer[ch][:, line] = line_data[ch]
+                else:
+                    self._scan_buffer[ch][pixels, line] = line_data[ch]
+            self._line_updates.append(int(line))
+
+    def _publish_lines(self):
+        """ Copies lines updated since the last call from _scan_buffer into _scan_data, needs _thread_lock_data.
+
+        @return list: indices of the published lines
+        """
+        new_lines = sorted(set(self._line_updates[self._lines_published:]))
+        if new_lines:
+            for ch in self._constraints.channels:
+                if len(self._current_scan_axes) == 2:
+                    self._scan_data.data[ch][:, new_lines] = self._scan_buffer[ch][:, new_lines]
+                else:
+                    self._scan_data.data[ch][:] = self._scan_buffer[ch]
+            self._lines_published = len(self._line_updates)
+        return new_lines
+
+    def get_scan_update(self, since_line=0):
+        """ Lines updated since since_line, without copying the image.
+
+        Lines of dense scans are updated once and in order, so since_line is the number of lines the caller
+        already has. Adaptive scans update lines twice (coarse and fine pass) and out of order.
+
+        @param int since_line: number of line updates the caller already has
+        @return (list, dict): line index of every new update, {channel: read-only view of the whole scan buffer}
+        """
+        with self._thread_lock_data:
+            lines = self._line_updates[since_line:]
+            views = {}
+            if self._scan_buffer is not None:
+                for ch, buffer in self._scan_buffer.items():
+                    views[ch] = buffer.view()
+                    views[ch].flags.writeable = False
+            return lines, views
+
+    def get_scan_data(self):
+        """ Publishes the lines finished by the scan thread and returns the ScanData of the current scan.
+
+        Returns the instance used in the scan instead of a copy, only lines that are not published yet are
+        written to it. Each scan starts with a new instance.
 
         @return (bool, ScanData): Failure indicator (fail=True), ScanData instance used in the scan
         """
@@ -361,22 +1339,12 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
             raise RuntimeError('ScanData is not yet configured, please call "configure_scan" first')
         try:
             with self._thread_lock_data:
-                if self.module_state() != 'idle':
-                    self.line_to_scan+=1
-                    num_lines_to_scan=0
-                    if self._scan_data.scan_dimension == 2: 
-                        num_lines_to_scan=self._current_scan_resolution[1]-1   
-                        for ch in self._constraints.channels:
-                            self._scan_data.data[ch][:, self.line_to_scan] = self.scan_line(self.line_to_scan)[ch]
-                    else: 
-                        for ch in self._constraints.channels:
-                            self._scan_data.data[ch] = self.scan_line(self.line_to_scan)[ch]
-                        
-                    if self.line_to_scan >= num_lines_to_scan:
-                        self.log.info("Scan Complete")
-                        self._opm.camera_mode()
-                        self.module_state.unlock()
-                return self._scan_data.copy()
+                self._publish_lines()
+                if self.module_state() != 'idle' and self._scan_finished:
+                    self.log.info("Scan Complete")
+                    self._opm.camera_mode()
+                    self.module_state.unlock()
+                return self._scan_data
         except Exception as e:
              self.log.exception(f"Exception in get_scan_data\n{e}")
 
@@ -388,5 +1356,5 @@ class OzymandiasScanningProbeInterfuse(ScanningProbeInterface):
         pass
     
     def on_deactivate(self):
-        pass
+        self.stop_volume_scan()
     
\ No newline at end of file
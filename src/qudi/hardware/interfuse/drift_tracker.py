@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+"""
+Drift model of a sample from repeated localisations of a reference emitter.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+
+
+def locate_peak(positions, counts, min_contrast=3):
+    """ Position of the emitter along a line scan through it.
+
+    The maximum and its neighbours are interpolated with a parabola through the log counts, which is exact for a
+    Gaussian spot.
+
+    @param np.ndarray positions: equally spaced positions of the line in m
+    @param np.ndarray counts: counts of every position
+    @param float min_contrast: standard deviations (Poisson, of the median) the maximum has to exceed the median by
+    @return float: peak position in m, None if the line shows no emitter or the maximum is at the edge
+    """
+    positions = np.asarray(positions, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    background = float(np.median(counts))
+    peak = int(np.argmax(counts))
+    if counts[peak] - background < min_contrast*np.sqrt(max(background, 1)):
+        return None
+    if peak == 0 or peak == counts.size - 1:
+        return None
+    left, centre, right = np.log(np.maximum(counts[peak - 1:peak + 2], 1))
+    curvature = left - 2*centre + right
+    shift = 0.5*(left - right)/curvature if curvature < 0 else 0
+    return float(positions[peak] + shift*(positions[1] - positions[0]))
+
+
+class DriftTracker:
+    """ Polynomial fit of the offset of a reference emitter against time, per axis.
+
+    @param tuple axes: axes the drift is tracked on
+    @param int order: polynomial order of the model, 1 for a constant drift velocity
+    @param int history: newest samples the model is fitted to, all if None
+    """
+
+    def __init__(self, axes=('x', 'y'), order=1, history=None):
+        self.axes = tuple(axes)
+        self.order = int(order)
+        self.history = history
+        self.samples = [] #(t, {axis: offset}) of every localisation, t in s since the first one
+        self.coefficients = {ax: np.zeros(1) for ax in self.axes}
+        self._t0 = None
+
+    def add(self, t, offset):
+        """ Adds a measured offset and refits the model.
+
+        @param float t: time.monotonic() of the measurement
+        @param dict offset: {axis: measured position - reference position} in m
+        """
+        if self._t0 is None:
+            self._t0 = t
+        self.samples.append((t - self._t0, {ax: float(offset[ax]) for ax in self.axes}))
+        used = self.samples if self.history is None else self.samples[-int(self.history):]
+        times = np.array([sample_t for sample_t, _ in used])
+        # Never more free parameters than distinct samples, so the first samples give a constant offset.
+        order = min(self.order, len(used) - 1)
+        for ax in self.axes:
+            values = np.array([sample[ax] for _, sample in used])
+            self.coefficients[ax] = np.polyfit(times, values, order) if order > 0 else values[-1:]
+
+    def predict(self, t):
+        """ Offset {axis: m} of the model at time.monotonic() t, zero before the first sample.
+        """
+        if self._t0 is None:
+            return {ax: 0.0 for ax in self.axes}
+        return {ax: float(np.polyval(coefficients, t - self._t0)) for ax, coefficients in self.coefficients.items()}
+
+    def to_dict(self):
+        return {'axes': list(self.axes),
+                'order': self.order,
+                'samples': [(t, offset) for t, offset in self.samples],
+                'coefficients': {ax: list(coefficients) for ax, coefficients in self.coefficients.items()}}
@@ -79,6 +79,52 @@ class GalvoInterfuse(Base):
         # self.set_diff_voltage(2,3,position[1])
 
 
+    def positions_to_voltages(self, positions):
+        """Convert an array of positions to galvo differential voltages, same mapping as set_position
+
+        Args:
+            positions (np.ndarray): shape (points, 2) x and y positions in micrometers
+
+        Returns:
+            np.ndarray: shape (points, 2) theta and phi differential voltages
+        """
+        positions = np.atleast_2d(np.asarray(positions, dtype=np.float64))
+        scale = np.array([self.Sx, self.Sy])
+        angles = np.degrees(np.arctan(positions * scale * self.um / self.projection_distance))
+        return angles / (scale * self.VToA)
+
+
+    def set_position_trajectory(self, positions, rate):
+        """Write a whole trajectory to the galvo in one buffered DAQ output scan
+
+        Args:
+            positions (np.ndarray): shape (points, 2) x and y positions in micrometers
+            rate (float): points per second
+        """
+        self.set_voltage_trajectory(self.positions_to_voltages(positions), rate)
+
+
+    def set_voltage_trajectory(self, voltages, rate):
+        """Write precomputed galvo voltages in one buffered DAQ output scan
+
+        Args:
+            voltages (np.ndarray): shape (points, 2) theta and phi differential voltages, see positions_to_voltages
+            rate (float): points per second
+        """
+        self._daq.set_diff_voltage_scan([(self.theta_high, self.theta_low), (self.phi_high, self.phi_low)],
+                                        voltages, rate)
+
+
+    @property
+    def calibration(self):
+        """Parameters of the position to voltage mapping
+
+        Returns:
+            tuple: (Sx, Sy, VToA, projection_distance)
+        """
+        return (self.Sx, self.Sy, self.VToA, self.projection_distance)
+
+
     def set_voltage_scaled(self, voltage):
         """Set the scaled voltage
 
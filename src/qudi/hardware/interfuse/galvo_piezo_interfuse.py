@@ -1,4 +1,5 @@
 from typing import Any, Callable, Mapping, Optional
+import numpy as np
 from qudi.interface.motor_interface import MotorInterface
 from qudi.core.configoption import ConfigOption
 from qudi.core.connector import Connector
@@ -29,6 +30,34 @@ class GalvoPiezoInterfuse(MotorInterface):
             self._galvo.set_position((param_dict['x']/self.um, param_dict["y"]/self.um))
             self._piezo.set_position(position=param_dict["z"]/self.um)
 
+    def scan_trajectory(self, trajectory, rate, voltages=None):
+        """ Runs a precomputed line trajectory as one buffered galvo output, z is held at its first value.
+
+        @param dict trajectory: {'x': np.ndarray, 'y': np.ndarray, 'z': np.ndarray} positions in m
+        @param float rate: points per second
+        @param np.ndarray voltages: shape (points, 2) galvo voltages from compile_trajectory, computed if None
+        """
+        self._piezo.set_position(position=trajectory["z"][0]/self.um)
+        if voltages is not None:
+            self._galvo.set_voltage_trajectory(voltages, rate)
+            return
+        positions = np.column_stack((trajectory['x'], trajectory['y']))/self.um
+        self._galvo.set_position_trajectory(positions, rate)
+
+    def trajectory_calibration(self):
+        """ Galvo calibration that compiled trajectories depend on. """
+        return self._galvo.calibration
+
+    def compile_trajectory(self, positions):
+        """ Galvo voltages of every point of a trajectory.
+
+        @param dict positions: {'x': np.ndarray, 'y': np.ndarray, ...} positions in m, all of the same shape
+        @return np.ndarray: voltages with shape positions['x'].shape + (2,)
+        """
+        shape = np.shape(positions['x'])
+        xy = np.column_stack((np.ravel(positions['x']), np.ravel(positions['y'])))/self.um
+        return self._galvo.positions_to_voltages(xy).reshape(shape + (2,))
+
     def move_rel(self, param_dict):
         current_position = self.get_pos()
         end_pos = {ax: current_position[ax] + param_dict[ax] for ax in param_dict}
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Checkpoints of running scans, so an interrupted scan can be resumed at the first line that is missing.
+
+A checkpoint is a directory holding
+    checkpoint.json  scan settings, the indices of the finished lines and whether the scan is complete
+    <channel>.npy    float64 scan data of the channel, NaN where no line was finished
+The .npy files are memory mapped, finished lines are written into them and flushed before checkpoint.json lists
+them, so a line only counts as done once its data is on disk.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+from qudi.logic.atomic_write import atomic_write
+
+_CHECKPOINT_FILE = 'checkpoint.json'
+
+
+def _channel_file(path, channel):
+    return os.path.join(path, '{0}.npy'.format(channel))
+
+
+class ScanCheckpoint:
+    """ Scan data and progress of one scan on disk. Use ScanCheckpoint.create for a new scan and
+    ScanCheckpoint.open to resume one.
+
+    settings holds 'axes', 'range', 'resolution', 'frequency', 'position' (target of every axis at the start),
+    'channel_units' and the line acquisition options of the scanner.
+    """
+
+    def __init__(self, path, state, data):
+        self.path = path
+        self._state = state
+        self.data = data
+        self.lines_done = set(state['lines_done'])
+
+    @classmethod
+    def create(cls, path, settings, shape):
+        """ New checkpoint directory for a scan with data of the given shape per channel.
+        """
+        os.makedirs(path, exist_ok=False)
+        state = {'version': 1,
+                 'start': datetime.now().isoformat(),
+                 'settings': settings,
+                 'lines_done': [],
+                 'complete': False}
+        data = {}
+        for channel in settings['channel_units']:
+            data[channel] = np.lib.format.open_memmap(_channel_file(path, channel), mode='w+', dtype=np.float64,
+                                                      shape=tuple(shape))
+            data[channel][:] = np.nan
+            data[channel].flush()
+        checkpoint = cls(path, state, data)
+        checkpoint._write_state()
+        return checkpoint
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, _CHECKPOINT_FILE), 'r') as file:
+            state = json.load(file)
+        data = {channel: np.load(_channel_file(path, channel), mmap_mode='r+')
+                for channel in state['settings']['channel_units']}
+        return cls(path, state, data)
+
+    @property
+    def settings(self):
+        return self._state['settings']
+
+    @property
+    def complete(self):
+        return self._state['complete']
+
+    def write_lines(self, buffers, lines):
+        """ Copies the given lines of the scan buffers to disk and records them as done.
+
+        @param dict buffers: {channel: np.ndarray} scan data of the whole scan
+        @param list lines: indices of finished lines
+        """
+        lines = sorted(set(lines))
+        if not lines:
+            return
+        for channel, data in self.data.items():
+            if data.ndim == 2:
+                data[:, lines] = buffers[channel][:, lines]
+            else:
+                data[:] = buffers[channel]
+            data.flush()
+        self.lines_done.update(lines)
+        self._write_state()
+
+    def mark_complete(self):
+        self._state['complete'] = True
+        self._write_state()
+
+    def _write_state(self):
+        self._state['lines_done'] = sorted(int(line) for line in self.lines_done)
+        self._state['saved'] = datetime.now().isoformat()
+        atomic_write(os.path.join(self.path, _CHECKPOINT_FILE),
+                     lambda file: json.dump(self._state, file, indent=2, default=str))
@@ -0,0 +1,128 @@
+# -*- coding: utf-8 -*-
+"""
+Wall-clock duration estimates of scans from measured per-pixel and per-line overhead, and scan settings that fit a
+time budget.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from collections import deque
+
+import numpy as np
+
+
+class ScanOverheadStatistics:
+    """ Overhead of the most recent scan lines per line scan mode.
+
+    A step scan pixel costs its dwell time plus the move, settle and counter latency (measured exposure minus
+    dwell time), a line costs its pixels plus the time spent outside of them. A hardware timed line costs its
+    pixels plus a fixed overhead (first move, output setup, readout).
+
+    @param int window: lines per mode the means are taken over
+    """
+
+    def __init__(self, window=50):
+        self._lines = {'step': deque(maxlen=int(window)), 'hardware_timed': deque(maxlen=int(window))}
+
+    def add_step_line(self, timing, dwell, line_time):
+        """ @param np.ndarray timing: (pixels, 4) move, settle, exposure and total s of every pixel
+            @param float dwell: configured dwell time of the pixels in s
+            @param float line_time: wall-clock time of the whole line in s
+        """
+        timing = np.asarray(timing)
+        move = float(timing[:, 0].mean())
+        settle = float(timing[:, 1].mean())
+        counter = float(np.maximum(timing[:, 2] - dwell, 0).mean())
+        line = max(line_time - float(timing[:, 3].sum()), 0)
+        self._lines['step'].append((move, settle, counter, line))
+
+    def add_hardware_timed_line(self, pixels, dwell, line_time):
+        self._lines['hardware_timed'].append((0, 0, 0, max(line_time - pixels*dwell, 0)))
+
+    def has_data(self, mode):
+        return len(self._lines[mode]) > 0
+
+    def overhead(self, mode, default_pixel, default_line):
+        """ Mean overhead of mode, the defaults if no line of that mode was measured yet.
+
+        @return dict: {'move', 'settle', 'counter', 'pixel', 'line'} in s, 'pixel' is the sum of the first three
+        """
+        if not self._lines[mode]:
+            pixel = default_pixel if mode == 'step' else 0
+            return {'move': pixel, 'settle': 0, 'counter': 0, 'pixel': pixel, 'line': default_line}
+        move, settle, counter, line = np.mean(self._lines[mode], axis=0)
+        return {'move': move, 'settle': settle, 'counter': counter, 'pixel': move + settle + counter, 'line': line}
+
+
+def estimate_scan_time(pixels, lines, frequency, overhead):
+    """ Wall-clock estimate of a dense scan.
+
+    @param int pixels: pixels per line
+    @param int lines: lines of the scan, 1 for 1D scans
+    @param float frequency: pixel frequency (1/dwell time)
+    @param dict overhead: {'pixel': s, 'line': s}, see ScanOverheadStatistics.overhead
+    @return dict: {'duration_s', 'nominal_duration_s', 'pixel_rate_hz', 'max_pixel_rate_hz'}, the pixel rate is
+                  the achievable rate at this frequency, the maximum one the rate at zero dwell time
+    """
+    line_time = pixels*(1/frequency + overhead['pixel']) + overhead['line']
+    dead_time = pixels*overhead['pixel'] + overhead['line']
+    return {'duration_s': lines*line_time,
+            'nominal_duration_s': lines*pixels/frequency,
+            'pixel_rate_hz': pixels/line_time,
+            'max_pixel_rate_hz': pixels/dead_time if dead_time > 0 else np.inf}
+
+
+def fit_to_budget(resolution, frequency, overhead, budget, frequency_range, resolution_ranges, adjust='resolution'):
+    """ Scan settings whose estimated duration is at most budget.
+
+    adjust='frequency' raises the pixel frequency up to the top of frequency_range and reduces the resolution if
+    that is not enough. adjust='resolution' keeps the frequency and reduces the resolution of all axes by the same
+    factor. Settings that already fit are returned unchanged, neither is ever lowered below what fits.
+
+    @param tuple resolution: pixels per scan axis, fast axis first
+    @param float frequency: pixel frequency
+    @param dict overhead: {'pixel': s, 'line': s}
+    @param float budget: s
+    @param tuple frequency_range: (min, max) pixel frequency of the fast axis
+    @param tuple resolution_ranges: ((min, max), ...) per scan axis
+    @param str adjust: 'resolution' or 'frequency'
+    @return (tuple, float): resolution, frequency
+    """
+    resolution = tuple(int(res) for res in resolution)
+    pixels = resolution[0]
+    lines = resolution[1] if len(resolution) == 2 else 1
+    if estimate_scan_time(pixels, lines, frequency, overhead)['duration_s'] <= budget:
+        return resolution, frequency
+
+    if adjust == 'frequency':
+        dwell = (budget/lines - overhead['line'])/pixels - overhead['pixel']
+        if dwell > 0 and 1/dwell <= max(frequency_range):
+            return resolution, max(1/dwell, min(frequency_range))
+        frequency = max(frequency_range)
+
+    # Largest scale s <= 1 of all axes with a*s**2 + b*s <= budget (2D) or a*s + b <= budget (1D)
+    pixel_time = 1/frequency + overhead['pixel']
+    if len(resolution) == 2:
+        a = lines*pixels*pixel_time
+        b = lines*overhead['line']
+        scale = (-b + np.sqrt(b**2 + 4*a*budget))/(2*a)
+    else:
+        scale = (budget - overhead['line'])/(pixels*pixel_time)
+    scale = min(max(scale, 0), 1)
+    resolution = tuple(int(np.clip(np.floor(res*scale), min(limits), max(limits)))
+                       for res, limits in zip(resolution, resolution_ranges))
+    return resolution, frequency
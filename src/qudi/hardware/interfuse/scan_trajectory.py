@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+Precompiled scan trajectories, cached by scan settings and stage calibration.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+from collections import OrderedDict
+
+import numpy as np
+
+
+class ScanTrajectory:
+    """ Positions of every pixel of a 1D or 2D scan, and optionally the stage output values of every pixel.
+
+    @param dict positions: {axis: np.ndarray of shape (lines, pixels)} for x, y and z in m, forward pixel order
+    @param np.ndarray outputs: shape (lines, pixels, ...) stage specific output values (e.g. galvo voltages) or None
+    """
+
+    def __init__(self, positions, outputs=None):
+        self.positions = positions
+        self.outputs = outputs
+        for array in positions.values():
+            array.flags.writeable = False
+        if outputs is not None:
+            outputs.flags.writeable = False
+
+    @property
+    def line_count(self):
+        return next(iter(self.positions.values())).shape[0]
+
+    def line(self, line, pixels=None):
+        """ Positions of one line.
+
+        @param int line: line index
+        @param np.ndarray pixels: pixel indices in traversal order, all pixels in forward order if None
+        @return dict: {axis: np.ndarray}
+        """
+        if pixels is None:
+            return {ax: positions[line] for ax, positions in self.positions.items()}
+        return {ax: positions[line][pixels] for ax, positions in self.positions.items()}
+
+    def line_outputs(self, line, pixels=None):
+        """ Stage output values of one line, None if the stage did not compile any.
+        """
+        if self.outputs is None:
+            return None
+        if pixels is None:
+            return self.outputs[line]
+        return self.outputs[line][pixels]
+
+
+class TrajectoryCompiler:
+    """ Builds ScanTrajectory objects with vectorized numpy and keeps the max_entries most recently used ones.
+
+    The cache key holds the scan axes, ranges, resolution, the position of the axes that are not scanned and the
+    stage calibration, so a changed calibration never reuses stale output values.
+    """
+
+    def __init__(self, max_entries=16):
+        self.max_entries = max_entries
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self._cache.clear()
+
+    def compile(self, axes, ranges, resolution, fixed_position, calibration=None, compile_outputs=None):
+        """ Returns the trajectory of a scan, from the cache if it was compiled before.
+
+        @param tuple axes: scanned axes, fast axis first
+        @param tuple ranges: ((min, max), ...) per scanned axis in m
+        @param tuple resolution: pixels per scanned axis
+        @param dict fixed_position: {axis: position} of the x, y and z axes that are not scanned
+        @param tuple calibration: hashable stage calibration the output values depend on
+        @param callable compile_outputs: maps {axis: np.ndarray} positions to the stage output values,
+                                         positions only if None
+        @return ScanTrajectory: read-only trajectory
+        """
+        axes = tuple(axes)
+        ranges = tuple((float(low), float(high)) for low, high in ranges)
+        resolution = tuple(int(res) for res in resolution)
+        fixed = tuple(sorted((ax, float(pos)) for ax, pos in fixed_position.items() if ax not in axes))
+        key = (axes, ranges, resolution, fixed, calibration, compile_outputs is not None)
+
+        trajectory = self._cache.get(key)
+        if trajectory is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return trajectory
+        self.misses += 1
+
+        steps = {ax: np.linspace(low, high, res) for ax, (low, high), res in zip(axes, ranges, resolution)}
+        pixels = resolution[0]
+        lines = resolution[1] if len(axes) == 2 else 1
+        positions = {}
+        for ax, pos in fixed:
+            positions[ax] = np.full((lines, pixels), pos)
+        positions[axes[0]] = np.broadcast_to(steps[axes[0]], (lines, pixels)).copy()
+        if len(axes) == 2:
+            positions[axes[1]] = np.repeat(steps[axes[1]][:, np.newaxis], pixels, axis=1)
+        outputs = compile_outputs(positions) if compile_outputs is not None else None
+        trajectory = ScanTrajectory(positions, outputs)
+
+        self._cache[key] = trajectory
+        while len(self._cache) > self.max_entries:
+            self._cache.popitem(last=False)
+        return trajectory
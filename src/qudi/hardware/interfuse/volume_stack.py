@@ -0,0 +1,130 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk storage of volumetric (z-stack) scans, written one plane at a time.
+
+A stack is stored as a directory holding
+    header.json     scan axes, ranges, resolution, z positions, channel units and the number of finished planes
+    <channel>.npy   float64 array of shape (planes, fast axis pixels, slow axis pixels), NaN until written
+The .npy files are memory mapped, so neither writing nor reading a stack needs more RAM than one plane per
+channel, independent of the stack depth.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+from datetime import datetime
+
+import numpy as np
+
+from qudi.logic.atomic_write import atomic_write
+
+_HEADER_FILE = 'header.json'
+
+
+def _channel_file(path, channel):
+    return os.path.join(path, '{0}.npy'.format(channel))
+
+
+class VolumeStackWriter:
+    """ Writes finished planes of a z-stack and keeps a running maximum projection per channel.
+
+    @param str path: new directory of the stack
+    @param tuple axes: scanned plane axes, fast axis first
+    @param tuple ranges: ((min, max), (min, max)) of the plane axes in m
+    @param tuple resolution: (fast axis pixels, slow axis pixels)
+    @param np.ndarray z_positions: nominal z of every plane in m
+    @param dict channel_units: {channel: unit}
+    @param dict metadata: free metadata stored in the header
+    """
+
+    def __init__(self, path, axes, ranges, resolution, z_positions, channel_units, metadata=None):
+        os.makedirs(path, exist_ok=False)
+        self.path = path
+        self.shape = (len(z_positions), int(resolution[0]), int(resolution[1]))
+        self.header = {'version': 1,
+                       'start': datetime.now().isoformat(),
+                       'axes': list(axes),
+                       'ranges': [list(r) for r in ranges],
+                       'resolution': list(self.shape[1:]),
+                       'z_positions': [float(z) for z in z_positions],
+                       'channel_units': dict(channel_units),
+                       'planes_done': 0,
+                       'plane_z': [],
+                       'metadata': metadata if metadata is not None else {}}
+        self._planes = {}
+        self.max_projection = {}
+        for channel in channel_units:
+            self._planes[channel] = np.lib.format.open_memmap(_channel_file(path, channel), mode='w+',
+                                                              dtype=np.float64, shape=self.shape)
+            self._planes[channel][:] = np.nan
+            self.max_projection[channel] = np.full(self.shape[1:], np.nan)
+        self._write_header()
+
+    def write_plane(self, index, z, plane_data):
+        """ Stores one finished plane and flushes it to disk.
+
+        @param int index: plane index
+        @param float z: z the plane was actually acquired at in m (nominal z plus refocus offset)
+        @param dict plane_data: {channel: np.ndarray of shape (fast axis pixels, slow axis pixels)}
+        """
+        for channel, planes in self._planes.items():
+            planes[index] = plane_data[channel]
+            planes.flush()
+            self.max_projection[channel] = np.fmax(self.max_projection[channel], plane_data[channel])
+        self.header['planes_done'] = max(self.header['planes_done'], index + 1)
+        self.header['plane_z'].append([int(index), float(z)])
+        self._write_header()
+
+    def close(self, metadata=None):
+        if metadata is not None:
+            self.header['metadata'].update(metadata)
+            self._write_header()
+        for planes in self._planes.values():
+            planes.flush()
+        self._planes = {}
+
+    def _write_header(self):
+        atomic_write(os.path.join(self.path, _HEADER_FILE),
+                     lambda file: json.dump(self.header, file, indent=2, default=str))
+
+
+class VolumeStackReader:
+    """ Memory mapped read access to a stack written by VolumeStackWriter.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _HEADER_FILE), 'r') as file:
+            self.header = json.load(file)
+        self.z_positions = np.asarray(self.header['z_positions'])
+        self.planes_done = self.header['planes_done']
+        self.channels = list(self.header['channel_units'])
+        self.data = {channel: np.load(_channel_file(path, channel), mmap_mode='r') for channel in self.channels}
+
+    def plane(self, index):
+        """ {channel: np.ndarray} of one plane.
+        """
+        return {channel: planes[index] for channel, planes in self.data.items()}
+
+    def max_projection(self, channel):
+        """ Maximum along z of the finished planes, computed plane by plane.
+        """
+        projection = np.full(self.data[channel].shape[1:], np.nan)
+        for index in range(self.planes_done):
+            projection = np.fmax(projection, self.data[channel][index])
+        return projection
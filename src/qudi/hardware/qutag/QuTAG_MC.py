@@ -97,6 +97,12 @@ class QuTAG():
         # Find and connect to quTAG device
         print("Initialize and Start with quTAG device: ", self.err_dict[self.Initialize()] )#TODO move this to qutag qudi wrapper 
         
+        # Persistent result buffers, reused by every readout instead of allocating new arrays per call.
+        # Arrays returned from the getters are views into these buffers and are overwritten by the next call,
+        # copy them or pass into= to keep the data.
+        self._coincBuffer = np.zeros(59, dtype=np.int32)
+        self._coincPtr = self._coincBuffer.ctypes.data_as(ctypes.POINTER(ctypes.c_int32))
+
         self._bufferSize = 1000000
         self.setBufferSize(self._bufferSize)
         
@@ -104,12 +110,39 @@ class QuTAG():
         self._timebase = self.getTimebase()
 
         self._StartStopBinCount = 100000
+        self._allocateHistogramBuffer()
         
         self._featureHBT = self.checkFeatureHBT()
         self._featureLifetime = self.checkFeatureLifetime()
         
         self._HBTBufferSize = 256
         self._LFTBufferSize = 256
+        self._allocateLFTBuffer()
+        self._allocateHBTBuffer()
+
+    def _allocateTimestampBuffers(self):
+        self._timestampBuffer = np.zeros(int(self._bufferSize), dtype=np.int64)
+        self._channelBuffer = np.zeros(int(self._bufferSize), dtype=np.int8)
+        self._timestampPtr = self._timestampBuffer.ctypes.data_as(ctypes.POINTER(ctypes.c_int64))
+        self._channelPtr = self._channelBuffer.ctypes.data_as(ctypes.POINTER(ctypes.c_int8))
+
+    def _allocateHistogramBuffer(self):
+        self._histogramBuffer = np.zeros(int(self._StartStopBinCount), dtype=np.int32)
+        self._histogramPtr = self._histogramBuffer.ctypes.data_as(ctypes.POINTER(ctypes.c_int32))
+
+    def _allocateLFTBuffer(self):
+        self._LFTValues = np.zeros(int(self._LFTBufferSize), dtype=np.double)
+        self._LFTValuesPtr = self._LFTValues.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+
+    def _allocateHBTBuffer(self):
+        self._HBTValues = np.zeros(int(self._HBTBufferSize), dtype=np.double)
+        self._HBTValuesPtr = self._HBTValues.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+
+    @staticmethod
+    def _checkInto(array, dtype, size, name):
+        """Validate a caller supplied output array for the into= arguments"""
+        if array.dtype != dtype or array.size < size or not array.flags['C_CONTIGUOUS']:
+            raise ValueError("%s must be a contiguous %s array with at least %d entries" % (name, np.dtype(dtype).name, size))
 
     def __declareAPI(self):
         """Declare the API of the DLL. Should not be executed from the user."""
@@ -716,6 +749,7 @@ class QuTAG():
     
     def setBufferSize(self, size):
         self._bufferSize = size
+        self._allocateTimestampBuffers()
         ans = self.qutools_dll.TDC_setTimestampBufferSize(size)
         if ans != 0:
             print("Error in TDC_setTimestampBufferSize: "+self.err_dict[ans])
@@ -740,16 +774,26 @@ class QuTAG():
             
         return ans
     
-    def getLastTimestamps(self,reset):
-        timestamps = np.zeros(int(self._bufferSize), dtype=np.int64)
-        channels = np.zeros(int(self._bufferSize), dtype=np.int8)
+    def getLastTimestamps(self,reset,into=None):
+        """Returns (timestamps, channels, valid), the arrays are views of length valid.
+        Without into= the views point into the wrapper's persistent buffers and are overwritten by the next call,
+        into=(timestamps, channels) fills caller owned int64/int8 arrays of at least the buffer size instead."""
+        if into is None:
+            timestamps, channels = self._timestampBuffer, self._channelBuffer
+            timestampPtr, channelPtr = self._timestampPtr, self._channelPtr
+        else:
+            timestamps, channels = into
+            self._checkInto(timestamps, np.int64, self._bufferSize, "timestamps")
+            self._checkInto(channels, np.int8, self._bufferSize, "channels")
+            timestampPtr = timestamps.ctypes.data_as(ctypes.POINTER(ctypes.c_int64))
+            channelPtr = channels.ctypes.data_as(ctypes.POINTER(ctypes.c_int8))
         valid = ctypes.c_int32()
 
-        ans = self.qutools_dll.TDC_getLastTimestamps(reset,timestamps.ctypes.data_as(ctypes.POINTER(ctypes.c_int64)),channels.ctypes.data_as(ctypes.POINTER(ctypes.c_int8)),ctypes.byref(valid))
+        ans = self.qutools_dll.TDC_getLastTimestamps(reset,timestampPtr,channelPtr,ctypes.byref(valid))
         if ans != 0: # "never fails"
             print("Error in TDC_getLastTimestamps: "+self.err_dict[ans])
             
-        return (timestamps,channels, valid.value)
+        return (timestamps[:valid.value],channels[:valid.value], valid.value)
     
 # File IO -------------------------------------------
     def writeTimestamps(self, filename, fileformat):
@@ -760,7 +804,9 @@ class QuTAG():
         return ans
         
     def inputTimestamps(self, timestamps,channels,count):
-        ans = self.qutools_dll.TDC_inputTimestamps(ctypes.byref(timestamps),ctypes.byref(channels),count)
+        timestamps = np.ascontiguousarray(timestamps, dtype=np.int64)
+        channels = np.ascontiguousarray(channels, dtype=np.int8)
+        ans = self.qutools_dll.TDC_inputTimestamps(timestamps.ctypes.data_as(ctypes.POINTER(ctypes.c_int64)),channels.ctypes.data_as(ctypes.POINTER(ctypes.c_int8)),count)
         if ans != 0:
             print("Error in TDC_inputTimestamps: "+self.err_dict[ans])
         return ans
@@ -773,10 +819,15 @@ class QuTAG():
         return ans
         
 # Counting --------------------------------------------
-    def getCoincCounters(self):
-        data = np.zeros(int(59),dtype=np.int32)
+    def getCoincCounters(self,into=None):
+        if into is None:
+            data, dataPtr = self._coincBuffer, self._coincPtr
+        else:
+            data = into
+            self._checkInto(data, np.int32, 59, "data")
+            dataPtr = data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32))
         update = ctypes.c_int32()
-        ans = self.qutools_dll.TDC_getCoincCounters(data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),ctypes.byref(update))
+        ans = self.qutools_dll.TDC_getCoincCounters(dataPtr,ctypes.byref(update))
         if ans != 0: # "never fails"
             print("Error in TDC_getCoincCounters: "+self.err_dict[ans])
         return (data,update.value)
@@ -807,6 +858,7 @@ class QuTAG():
     
     def setHistogramParams(self, binWidth, binCount):
         self._StartStopBinCount = binCount
+        self._allocateHistogramBuffer()
         ans = self.qutools_dll.TDC_setHistogramParams(binWidth,binCount)
         if ans != 0:
             print("Error in TDC_setHistogramParams: "+self.err_dict[ans])
@@ -826,23 +878,28 @@ class QuTAG():
             print("Error in TDC_clearAllHistograms: "+self.err_dict[ans])
         return ans
         
-    def getHistogram(self, chanA, chanB, reset):
+    def getHistogram(self, chanA, chanB, reset, into=None):
         if reset:
             reset_value = 1
         else:
             reset_value = 0
-        data = np.zeros(self._StartStopBinCount, dtype=np.int32)
+        if into is None:
+            data, dataPtr = self._histogramBuffer, self._histogramPtr
+        else:
+            data = into
+            self._checkInto(data, np.int32, self._StartStopBinCount, "data")
+            dataPtr = data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32))
         count = ctypes.c_int32()
         tooSmall = ctypes.c_int32()
         tooLarge = ctypes.c_int32()
         starts = ctypes.c_int32()
         stops = ctypes.c_int32()
         expTime = ctypes.c_int64()
-        ans = self.qutools_dll.TDC_getHistogram(chanA,chanB,reset_value,data.ctypes.data_as(ctypes.POINTER(ctypes.c_int32)),ctypes.byref(count),ctypes.byref(tooSmall),ctypes.byref(tooLarge),ctypes.byref(starts),ctypes.byref(stops),ctypes.byref(expTime))
+        ans = self.qutools_dll.TDC_getHistogram(chanA,chanB,reset_value,dataPtr,ctypes.byref(count),ctypes.byref(tooSmall),ctypes.byref(tooLarge),ctypes.byref(starts),ctypes.byref(stops),ctypes.byref(expTime))
         if ans != 0:
             print("Error in TDC_getHistogram: "+self.err_dict[ans])
         
-        return (data,count.value,tooSmall.value,tooLarge.value,starts.value,stops.value,expTime.value)
+        return (data[:self._StartStopBinCount],count.value,tooSmall.value,tooLarge.value,starts.value,stops.value,expTime.value)
         
 # Lifetime ----------------------------------------------------------
     def enableLFT(self,enable):
@@ -857,6 +914,7 @@ class QuTAG():
         
     def setLFTParams(self,binWidth,binCount):
         self._LFTBufferSize = binCount
+        self._allocateLFTBuffer()
         ans = self.qutools_dll.TDC_setLftParams(binWidth, binCount)
         if ans != 0:
             print("Error in TDC_setLftParams: "+self.err_dict[ans])
@@ -908,14 +966,19 @@ class QuTAG():
             print("Error in TDC_addLftHistogram: "+self.err_dict[ans])
         return ans
         
-    def analyseLFTFunction(self,lft):
+    def analyseLFTFunction(self,lft,into=None):
         capacity = ctypes.c_int32()
         size = ctypes.c_int32()
         binWidth = ctypes.c_int32()
-        values = np.zeros(self._LFTBufferSize, dtype=np.double)
+        if into is None:
+            values, valuesPtr = self._LFTValues, self._LFTValuesPtr
+        else:
+            values = into
+            self._checkInto(values, np.double, self._LFTBufferSize, "values")
+            valuesPtr = values.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
         
-        self.qutools_dll.TDC_analyseLftFunction (lft, ctypes.byref(capacity), ctypes.byref(size), ctypes.byref(binWidth), values.ctypes.data_as(ctypes.POINTER(ctypes.c_double)), self._LFTBufferSize)
-        return (capacity.value, size.value, binWidth.value, values)
+        self.qutools_dll.TDC_analyseLftFunction (lft, ctypes.byref(capacity), ctypes.byref(size), ctypes.byref(binWidth), valuesPtr, self._LFTBufferSize)
+        return (capacity.value, size.value, binWidth.value, values[:self._LFTBufferSize])
 
     def getLFTHistogram(self,channel,reset, lft):
         print("getLFTHistogram")
@@ -986,6 +1049,7 @@ class QuTAG():
     def setHBTParams(self, binWidth, binCount):
         ans = self.qutools_dll.TDC_setHbtParams(binWidth,binCount)
         self._HBTBufferSize = binCount * 2 - 1
+        self._allocateHBTBuffer()
         if ans != 0:
             print("Error in TDC_setHbtParams: "+self.err_dict[ans])
         return ans
@@ -1114,12 +1178,17 @@ class QuTAG():
         self.qutools_dll.TDC_releaseHbtFunction(hbtfunction)
         return 0
     
-    def analyzeHBTFunction(self, hbtfunction):
+    def analyzeHBTFunction(self, hbtfunction, into=None):
         capacity = ctypes.c_int32()
         size = ctypes.c_int32()
         binWidth = ctypes.c_int32()
         iOffset = ctypes.c_int32()
-        values = np.zeros(self._HBTBufferSize,dtype=np.double)
-        self.qutools_dll.TDC_analyseHbtFunction(hbtfunction,ctypes.byref(capacity),ctypes.byref(size),ctypes.byref(binWidth),ctypes.byref(iOffset),values.ctypes.data_as(ctypes.POINTER(ctypes.c_double)),self._HBTBufferSize)
+        if into is None:
+            values, valuesPtr = self._HBTValues, self._HBTValuesPtr
+        else:
+            values = into
+            self._checkInto(values, np.double, self._HBTBufferSize, "values")
+            valuesPtr = values.ctypes.data_as(ctypes.POINTER(ctypes.c_double))
+        self.qutools_dll.TDC_analyseHbtFunction(hbtfunction,ctypes.byref(capacity),ctypes.byref(size),ctypes.byref(binWidth),ctypes.byref(iOffset),valuesPtr,self._HBTBufferSize)
         
-        return (capacity.value,size.value,binWidth.value,iOffset.value,values)
+        return (capacity.value,size.value,binWidth.value,iOffset.value,values[:self._HBTBufferSize])
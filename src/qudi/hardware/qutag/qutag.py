@@ -1,8 +1,10 @@
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from typing import Any, Callable, Mapping, Optional
 import numpy as np
 from qudi.interface.counter import Counter
 from qudi.core.configoption import ConfigOption
+from qudi.util.mutex import RecursiveMutex
 
 sys.path.append("C:\\Users\\Ozymandias\\qudi-Purdue-modules\\src\\qudi\\hardware\\qutag")
 
@@ -12,6 +14,7 @@ try:
 except:
         Exception("Time Tagger wrapper QuTAG.py is not in the search path.")
 
+from qudi.hardware.qutag.timestamp_binning import TimestampBinner
 from PyQt5.QtCore import QObject
 from qtpy import QtCore
 import time
@@ -20,18 +23,44 @@ from qudi.core.module import Base
 
 class Qutag(Counter, Base):
     ns=1e-9
+    _sync_channel = ConfigOption(name='sync_channel', default=None) #Input that receives the DAQ line start trigger, used to align hardware timed line scans. Hardware timed lines need this or pixel_clock_channel.
+    _pixel_clock_channel = ConfigOption(name='pixel_clock_channel', default=None) #Input that receives one DAQ marker per pixel, takes precedence over sync_channel.
+    _count_acquisition = ConfigOption(name='count_acquisition', default='event') #'event' sleeps until the next exposure boundary and polls with backoff, 'busy' spins on getCoincCounters.
+    _count_timeout = ConfigOption(name='count_timeout', default=1) #s, added to two exposures before a count readout is given up.
+    _line_timeout = ConfigOption(name='line_timeout', default=0.1) #s, a hardware timed line is read until a tag after its end arrives, at most this long after the line duration.
+
+    _min_poll_interval = 1e-3
+    _max_poll_interval = 20e-3
+
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self._count_lock = RecursiveMutex()
+        self._timestamp_lock = RecursiveMutex() # getLastTimestamps fills buffers shared by all callers
+        self._timestamp_owner = None
+        self._count_executor = None
+        self._exposure_time = None
+        self._last_counter_update = None
+        self._lifetime_snapshot = None
+        self._hbt_snapshot = None
+        self._binner = None
 
     def on_activate(self):
         self.qutag = QuTAG_MC.QuTAG()
+        self.timeBase = self.qutag.getTimebase()
+        self._exposure_time = self.get_exposure_time()/1000
+        self._last_counter_update = None
+        self._count_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='qutag_counts')
     
     def on_deactivate(self):
+        self._count_executor.shutdown(wait=True)
         self.qutag.deInitialize()
         return 0
     
-    def set_exposure_time(self, exposureTime):#exposure time is in ms
-        self.qutag.setExposureTime(int(exposureTime*1000))
+    def set_exposure_time(self, exposureTime):#exposure time is in s, the qutag takes ms
+        with self._count_lock:
+            self.qutag.setExposureTime(int(exposureTime*1000))
+            self._exposure_time = exposureTime
+            self._last_counter_update = None
 
     def get_exposure_time(self):
         return self.qutag.getDeviceParams()[2]
@@ -40,27 +69,220 @@ class Qutag(Counter, Base):
         return self.get_qutag_counts([counter_channel], dt)
 
     def get_qutag_counts(self, channels, exposureTime=None):
-        #print(exposureTime)
-        if exposureTime is not None:
-            self.qutag.setExposureTime(int(exposureTime*1000))
-        counts=0
-        t=0
-        #while t <= exposureTime:
-        #    t_start= time.perf_counter()
-        #    t = (time.perf_counter() - t_start) + t
-        #time.sleep(exposureTime)
-        updates=0
-        while updates==0:
-            data,updates = self.qutag.getCoincCounters()
-        
-        counts=[]
-        for chan in channels:
-            counts.append(data[chan])
-        return counts
-    
+        """ Returns the counts of the next completed exposure.
+
+        Args:
+            channels (list): qutag channels to read
+            exposureTime (float): exposure in s, the current exposure is kept if None
+        Returns:
+            list: counts per channel
+        """
+        with self._count_lock:
+            if exposureTime is not None and exposureTime != self._exposure_time:
+                self.set_exposure_time(exposureTime)
+            if self._count_acquisition == 'busy':
+                updates=0
+                while updates==0:
+                    data,updates = self.qutag.getCoincCounters()
+            else:
+                data = self._wait_for_counter_update(self._exposure_time)
+
+            counts=[]
+            for chan in channels:
+                counts.append(data[chan])
+            return counts
+
+    def get_qutag_counts_async(self, channels, exposureTime=None, callback=None):
+        """ Runs get_qutag_counts on the counter worker thread.
+
+        Args:
+            channels (list): qutag channels to read
+            exposureTime (float): exposure in s, the current exposure is kept if None
+            callback (callable): called with the finished future, from the worker thread
+        Returns:
+            concurrent.futures.Future: resolves to the counts per channel
+        """
+        future = self._count_executor.submit(self.get_qutag_counts, channels, exposureTime)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def get_counts_async(self, dt, counter_channel, callback=None):
+        return self.get_qutag_counts_async([counter_channel], dt, callback)
+
+    def get_count_rates_async(self, channels, callback=None):
+        future = self._count_executor.submit(self.get_count_rates, channels)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def _wait_for_counter_update(self, exposure_time):
+        """ Sleeps until the next expected exposure boundary, then polls getCoincCounters with backoff.
+        """
+        self.qutag.getCoincCounters() # Discards updates that completed before this readout was requested.
+        now = time.perf_counter()
+        if self._last_counter_update is not None and exposure_time > 0:
+            periods = max(np.ceil((now - self._last_counter_update)/exposure_time), 1)
+            next_update = self._last_counter_update + periods*exposure_time
+        else:
+            next_update = now + exposure_time
+        time.sleep(max(next_update - now - self._min_poll_interval, 0))
+
+        deadline = now + 2*exposure_time + self._count_timeout
+        poll_interval = self._min_poll_interval
+        max_poll_interval = min(max(exposure_time/10, self._min_poll_interval), self._max_poll_interval)
+        while True:
+            data, updates = self.qutag.getCoincCounters()
+            if updates != 0:
+                self._last_counter_update = time.perf_counter()
+                return data
+            if time.perf_counter() > deadline:
+                raise TimeoutError('No quTAG counter update within {0:.3f} s'.format(deadline - now))
+            time.sleep(poll_interval)
+            poll_interval = min(2*poll_interval, max_poll_interval)
+
+    def benchmark_count_readout(self, channels=(1, 2), exposure_time=0.01, repetitions=20):
+        """ Measures the CPU and wall time per count readout for the busy and the event driven acquisition.
+
+        Returns:
+            dict: {mode: {'cpu_time': s per readout, 'wall_time': s per readout}}
+        """
+        results = {}
+        configured_mode = self._count_acquisition
+        try:
+            for mode in ('busy', 'event'):
+                self._count_acquisition = mode
+                self.get_qutag_counts(list(channels), exposure_time)
+                cpu_start = time.process_time()
+                wall_start = time.perf_counter()
+                for _ in range(repetitions):
+                    self.get_qutag_counts(list(channels), exposure_time)
+                results[mode] = {'cpu_time': (time.process_time() - cpu_start)/repetitions,
+                                 'wall_time': (time.perf_counter() - wall_start)/repetitions}
+                self.log.info('Count readout ({0}): {1:.2f} ms CPU, {2:.2f} ms wall per readout'.format(
+                    mode, results[mode]['cpu_time']*1e3, results[mode]['wall_time']*1e3))
+        finally:
+            self._count_acquisition = configured_mode
+        return results
+
+    @property
+    def line_sync_configured(self):
+        """ True if hardware timed lines can be aligned, i.e. a line start trigger or pixel clock input is configured.
+        """
+        return self._sync_channel is not None or self._pixel_clock_channel is not None
+
+    @property
+    def timestamp_owner(self):
+        """ Consumer the time tag buffer is reserved for, None if it is free. """
+        return self._timestamp_owner
+
+    def reserve_timestamps(self, owner):
+        """ Reserves the time tag buffer for one consumer. Every read clears the buffer, so two consumers reading
+        at the same time would each lose the other's tags.
+
+        Args:
+            owner (str): name of the consumer, e.g. 'hardware timed scan'
+        Returns:
+            bool: True if the buffer is reserved for owner, False if another consumer holds it
+        """
+        with self._timestamp_lock:
+            if self._timestamp_owner not in (None, owner):
+                return False
+            self._timestamp_owner = owner
+            return True
+
+    def release_timestamps(self, owner):
+        with self._timestamp_lock:
+            if self._timestamp_owner == owner:
+                self._timestamp_owner = None
+
+    def start_line_acquisition(self):
+        """ Discards all buffered timestamps so the next get_line_counts only sees the upcoming line.
+        """
+        with self._timestamp_lock:
+            self.qutag.getLastTimestamps(True)
+
+    def read_timestamps(self):
+        """ Reads and clears the timestamp buffer.
+
+        The wrapper returns views of buffers that the next read overwrites, so the reads are serialized and the
+        caller gets its own copies.
+
+        Returns:
+            tuple: (np.ndarray timestamps, np.ndarray channels, int valid, bool data_lost)
+        """
+        with self._timestamp_lock:
+            data_lost = bool(self.qutag.getDataLost())
+            timestamps, tag_channels, valid = self.qutag.getLastTimestamps(True)
+            timestamps = timestamps[:valid].copy()
+            tag_channels = tag_channels[:valid].copy()
+        if data_lost:
+            self.log.warning('quTAG timestamp buffer overflowed, counts of this readout are incomplete')
+        return timestamps, tag_channels, valid, data_lost
+
+    def get_line_counts(self, channels, pixel_count, dwell_time):
+        """ Bins the timestamps acquired since start_line_acquisition into the pixels of one line.
+
+        The buffer is read until a tag after the end of the line arrives, so the line can be read while it is
+        written and may hold more tags than one read returns. Tags whose pixel clock marker has not been read yet
+        are kept for the next read. Reading stops line_timeout after the line duration at the latest.
+
+        Args:
+            channels (list): qutag channels to count
+            pixel_count (int): number of pixels in the line
+            dwell_time (float): time per pixel in s
+        Returns:
+            tuple: (np.ndarray counts with shape (len(channels), pixel_count),
+                    bool data_lost, True if the buffer overflowed while the line was read and the counts are incomplete)
+        Raises:
+            RuntimeError: neither sync_channel nor pixel_clock_channel is configured, or no line start trigger
+                          was recorded
+        """
+        if not self.line_sync_configured:
+            raise RuntimeError('Hardware timed lines need the sync_channel or pixel_clock_channel option')
+        deadline = time.perf_counter() + pixel_count*dwell_time + self._line_timeout
+
+        # One binner serves all lines of a scan, it is only rebuilt when the channels or the resolution change.
+        if self._binner is None or not self._binner.matches(channels, pixel_count):
+            self._binner = TimestampBinner(channels, pixel_count)
+        self._binner.start_line(dwell_time/self.timeBase, self._pixel_clock_channel, self._sync_channel)
+        poll_interval = self._min_poll_interval
+        while True:
+            timestamps, tag_channels, valid, data_lost = self.read_timestamps()
+            self._binner.add_block(timestamps, tag_channels, data_lost)
+            if self._binner.complete or time.perf_counter() > deadline:
+                break
+            time.sleep(poll_interval)
+            poll_interval = min(2*poll_interval, self._max_poll_interval)
+
+        if self._binner.line_end is None:
+            if self._pixel_clock_channel is None:
+                raise RuntimeError('No line start trigger on sync channel {0}, check the DAQ trigger '
+                                   'wiring'.format(self._sync_channel))
+            self.log.warning('Only {0:d} of {1:d} pixel clock markers recorded in this line'.format(
+                self._binner.marker_count, pixel_count))
+        return self._binner.finish(), self._binner.data_lost
+
+    def get_line_counts_async(self, channels, pixel_count, dwell_time, callback=None):
+        """ Runs get_line_counts on the counter worker thread, so the time tags are drained while the line is
+        written.
+
+        Returns:
+            concurrent.futures.Future: resolves to (counts, data_lost) of get_line_counts
+        """
+        future = self._count_executor.submit(self.get_line_counts, channels, pixel_count, dwell_time)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def input_timestamps(self, timestamps, channels):
+        """ Feeds timestamps into the DLL analysis (HBT, lifetime) as if they were measured.
+        """
+        return self.qutag.inputTimestamps(timestamps, channels, len(timestamps))
+
     def get_count_rates(self, channels):
         rates=self.get_qutag_counts(channels)
-        exposureTime=self.get_exposure_time()/1000
+        exposureTime=self._exposure_time
         for i in range(len(rates)):
             rates[i]=rates[i]/exposureTime
         return rates
@@ -73,7 +295,10 @@ class Qutag(Counter, Base):
          
         binWidth=histWidth*self.ns/binCount #histWidth should be in nanoseconds
         self.qutag.setHBTParams(int(binWidth/self.timeBase), binCount)
+        if getattr(self, 'fct', None) is not None:
+            self.qutag.releaseHBTFunction(self.fct)
         self.fct=self.qutag.createHBTFunction()
+        self._hbt_snapshot = None
 
     def configLifetime(self, histWidth, bincount, lifetime_channels, lifetime_delays):
         #histwidth in ns
@@ -84,39 +309,68 @@ class Qutag(Counter, Base):
         binWidth = histWidth*self.ns/bincount
         self.lifetime_start_channel = self.lifetime_channels[0]
         self.lifetime_stop_channel = self.lifetime_channels[1]
+        self.lifetime_stop_channels = list(self.lifetime_channels[1:])
         for i in range(len(self.lifetime_channels)-1):
             self.qutag.setChannelDelay(lifetime_channels[i+1], lifetime_delays[i])
         self.qutag.setLFTStartInput(self.lifetime_channels[0])
         self.qutag.setLFTParams(int(binWidth/self.timeBase), bincount)
-        self.qutag.addLFTHistogram(self.lifetime_stop_channel,True)
-        self.lft=self.qutag.createLFTFunction()
+        for lft in getattr(self, 'lfts', {}).values():
+            self.qutag.releaseLFTFunction(lft)
+        # One LFT function and value buffer per stop channel so a snapshot holds every histogram at once.
+        self.lfts = {}
+        self._lft_values = {}
+        for channel in self.lifetime_stop_channels:
+            self.qutag.addLFTHistogram(channel,True)
+            self.lfts[channel] = self.qutag.createLFTFunction()
+            self._lft_values[channel] = np.zeros(bincount, dtype=np.double)
+        self.lft = self.lfts[self.lifetime_stop_channel]
+        self._lifetime_snapshot = None
+
+    def get_lifetime_snapshot(self, max_age=0):
+        """ Fetches the histograms and statistics of all lifetime stop channels in one pass.
 
-    def getLifetime(self):
-        self.qutag.getLFTHistogram(self.lifetime_stop_channel,False,self.lft)
-        analyse = self.qutag.analyseLFTFunction(self.lft)
+        Args:
+            max_age (float): s, a cached snapshot younger than this is returned without touching the hardware
+        Returns:
+            dict: {'time': bin times in ns,
+                   'histograms': {stop channel: histogram},
+                   'stats': {stop channel: (too big, start events, stop events, exposure time)},
+                   'acquired': time.perf_counter() of the fetch}
+        """
+        snapshot = self._lifetime_snapshot
+        if snapshot is not None and time.perf_counter() - snapshot['acquired'] <= max_age:
+            return snapshot
+
+        histograms = {}
+        stats = {}
+        for channel in self.lifetime_stop_channels:
+            histo = self.qutag.getLFTHistogram(channel, False, self.lfts[channel])
+            analyse = self.qutag.analyseLFTFunction(self.lfts[channel], into=self._lft_values[channel])
+            histograms[channel] = analyse[3].copy()
+            stats[channel] = histo[1:]
         binCount = analyse[1]
         binWidth = analyse[2]*self.timeBase/self.ns
-        return [np.linspace(0, binCount*binWidth, binCount), analyse[3]]
+        self._lifetime_snapshot = {'time': np.linspace(0, binCount*binWidth, binCount),
+                                   'histograms': histograms,
+                                   'stats': stats,
+                                   'acquired': time.perf_counter()}
+        return self._lifetime_snapshot
+
+    def getLifetime(self, max_age=0):
+        snapshot = self.get_lifetime_snapshot(max_age)
+        return [snapshot['time'], snapshot['histograms'][self.lifetime_stop_channel]]
     
-    def getLFTStartEvents(self):
-        #self.qutag.getLFTHistogram(self.lifetime_stop_channel,True,self.lft)
-        histo = self.qutag.getLFTHistogram(self.lifetime_stop_channel, False, self.lft)
-        return histo[2]
+    def getLFTStartEvents(self, max_age=0):
+        return self.getLFTStats(max_age)[1]
     
-    def getLFTStopEvents(self):
-        #self.qutag.getLFTHistogram(self.lifetime_stop_channel,True,self.lft)
-        histo = self.qutag.getLFTHistogram(self.lifetime_stop_channel, False, self.lft)
-        return histo[3]
+    def getLFTStopEvents(self, max_age=0):
+        return self.getLFTStats(max_age)[2]
     
-    def getLFTExposureTime(self):
-        #self.qutag.getLFTHistogram(self.lifetime_stop_channel,True,self.lft)
-        histo = self.qutag.getLFTHistogram(self.lifetime_stop_channel, False, self.lft)
-        return histo[4]
+    def getLFTExposureTime(self, max_age=0):
+        return self.getLFTStats(max_age)[3]
     
-    def getLFTStats(self):
-        #self.qutag.getLFTHistogram(self.lifetime_stop_channel,True,self.lft)
-        histo = self.qutag.getLFTHistogram(self.lifetime_stop_channel, False, self.lft)
-        return histo[1:]
+    def getLFTStats(self, max_age=0):
+        return self.get_lifetime_snapshot(max_age)['stats'][self.lifetime_stop_channel]
 
     def getG2(self):
         self.qutag.getHBTCorrelations(0, self.fct)
@@ -126,6 +380,27 @@ class Qutag(Counter, Base):
         binWidth=analyse[2]*self.timeBase/self.ns
         return [np.linspace(-binCount*binWidth, binCount*binWidth, binCount), analyse[4]]
     
+    def get_hbt_snapshot(self, max_age=0):
+        """ Fetches the g2 curve, event counts and integration time of the HBT measurement together.
+
+        Args:
+            max_age (float): s, a cached snapshot younger than this is returned without touching the hardware
+        Returns:
+            dict: {'time': bin times in ns, 'g2': g2 values,
+                   'event_count': (total count, last count, last rate),
+                   'integration_time': s, 'acquired': time.perf_counter() of the fetch}
+        """
+        snapshot = self._hbt_snapshot
+        if snapshot is not None and time.perf_counter() - snapshot['acquired'] <= max_age:
+            return snapshot
+        g2_time, g2 = self.getG2()
+        self._hbt_snapshot = {'time': g2_time,
+                              'g2': g2.copy(),
+                              'event_count': self.qutag.getHBTEventCount(),
+                              'integration_time': self.qutag.getHBTIntegrationTime(),
+                              'acquired': time.perf_counter()}
+        return self._hbt_snapshot
+
     def getHBTEventCount(self):
         return self.qutag.getHBTEventCount()
     
@@ -140,9 +415,11 @@ class Qutag(Counter, Base):
     
     def resetG2(self):
         self.qutag.resetHBTCorrelations()
+        self._hbt_snapshot = None
 
     def resetLFT(self):
         self.qutag.resetLFTHistograms()
+        self._lifetime_snapshot = None
 
     def getHBTIntegrationTime(self):
          return self.qutag.getHBTIntegrationTime()
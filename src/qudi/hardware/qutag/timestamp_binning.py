@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Vectorized binning of quTAG time tag streams into per-pixel, per-channel counts.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import numpy as np
+
+
+class TimestampBinner:
+    """ Bins the time tags of one line into a (channels, pixels) count array.
+
+    A line is accumulated from successive buffer reads: start_line, add_block for every read until complete, then
+    finish. Pixel boundaries are either a regular grid that starts at the first tag of a line start input, or taken
+    from the tags of a pixel clock input, where every marker tag starts a new pixel. All times are in units of the
+    quTAG timebase.
+
+    Reads may overlap (reads without reset return tags that were already seen), tags that are not newer than the
+    last processed tag are dropped. Tags that can not be assigned yet because their pixel clock marker or the line
+    start has not arrived are kept until the next read or finish.
+
+    The channel lookup is built once, so one binner serves every line of a scan with the same channels and pixel
+    count.
+    """
+
+    def __init__(self, channels, pixel_count):
+        self.channels = list(channels)
+        self.pixel_count = int(pixel_count)
+        self.counts = np.zeros((len(self.channels), self.pixel_count), dtype=np.int64)
+        self.data_lost = False
+
+        # Lookup table from the (uint8 viewed) quTAG channel number to the row in counts, -1 is not counted.
+        self._channel_lookup = np.full(256, -1, dtype=np.int64)
+        for i, chan in enumerate(self.channels):
+            self._channel_lookup[np.uint8(chan)] = i
+
+        self._pixel_width = None
+        self._clock_channel = None
+        self._sync_channel = None
+        self._markers = np.empty(0, dtype=np.int64)
+        self._grid = None
+        self._last_timestamp = np.iinfo(np.int64).min
+        self._pending_timestamps = np.empty(0, dtype=np.int64)
+        self._pending_channels = np.empty(0, dtype=np.int8)
+
+    def matches(self, channels, pixel_count):
+        return self.channels == list(channels) and self.pixel_count == int(pixel_count)
+
+    def grid_edges(self, start, pixel_width):
+        """ Edges of regular pixels of pixel_width starting at start.
+        """
+        return start + pixel_width*np.arange(self.pixel_count + 1, dtype=np.float64)
+
+    def start_line(self, pixel_width, clock_channel=None, sync_channel=None):
+        """ Clears the counts and the kept tags for a new line.
+
+        Args:
+            pixel_width (float): pixel duration, closes the last pixel of a pixel clock line
+            clock_channel (int): every tag on this channel starts a new pixel, takes precedence over sync_channel
+            sync_channel (int): the first tag on this channel starts a regular grid of pixel_width pixels
+        """
+        if clock_channel is None and sync_channel is None:
+            raise ValueError('A pixel clock or a line start channel is needed to place the pixels')
+        self.counts = np.zeros((len(self.channels), self.pixel_count), dtype=np.int64)
+        self.data_lost = False
+        self._pixel_width = pixel_width
+        self._clock_channel = clock_channel
+        self._sync_channel = sync_channel
+        self._markers = np.empty(0, dtype=np.int64)
+        self._grid = None
+        self._last_timestamp = np.iinfo(np.int64).min
+        self._pending_timestamps = np.empty(0, dtype=np.int64)
+        self._pending_channels = np.empty(0, dtype=np.int8)
+
+    @property
+    def marker_count(self):
+        """ Number of pixel clock markers read in this line. """
+        return self._markers.size
+
+    @property
+    def line_end(self):
+        """ End of the last pixel, None while the line start or the markers of every pixel have not been read.
+        """
+        edges = self._edges()
+        if edges is None or edges.size < self.pixel_count + 1:
+            return None
+        return edges[-1]
+
+    @property
+    def complete(self):
+        """ True once a tag at or after the end of the line has been read, later reads can not add counts.
+        """
+        end = self.line_end
+        return end is not None and self._last_timestamp >= end
+
+    def add_block(self, timestamps, tag_channels, data_lost=False):
+        """ Adds one buffer read to the counts of the line.
+
+        Args:
+            timestamps (np.ndarray): int64 timestamps as returned by QuTAG.getLastTimestamps
+            tag_channels (np.ndarray): int8 channel numbers of the timestamps
+            data_lost (bool): the quTAG reported a buffer overflow with this read
+        """
+        self.data_lost = self.data_lost or bool(data_lost)
+        new = timestamps > self._last_timestamp
+        if not new.all():
+            timestamps = timestamps[new]
+            tag_channels = tag_channels[new]
+        if timestamps.size == 0:
+            return
+        self._last_timestamp = timestamps[-1]
+
+        if self._clock_channel is not None:
+            free_edges = self.pixel_count + 1 - self._markers.size
+            if free_edges > 0:
+                markers = timestamps[tag_channels == self._clock_channel][:free_edges]
+                self._markers = np.concatenate((self._markers, markers))
+        elif self._grid is None:
+            sync_tags = timestamps[tag_channels == self._sync_channel]
+            if sync_tags.size > 0:
+                self._grid = self.grid_edges(sync_tags[0], self._pixel_width)
+
+        counted = self._channel_lookup[np.asarray(tag_channels, dtype=np.int8).view(np.uint8)] >= 0
+        self._pending_timestamps = np.concatenate((self._pending_timestamps, timestamps[counted]))
+        self._pending_channels = np.concatenate((self._pending_channels, tag_channels[counted]))
+        self._bin_pending(self._edges(), final=False)
+
+    def finish(self):
+        """ Bins the tags that are still kept and returns the counts of the line.
+
+        A pixel clock line with missing markers is closed pixel_width after the last marker, the pixels without a
+        marker stay empty.
+        """
+        self._bin_pending(self._edges(final=True), final=True)
+        return self.counts
+
+    def _edges(self, final=False):
+        """ Pixel edges known so far, None before the line start.
+        """
+        if self._clock_channel is None:
+            return self._grid
+        edges = self._markers
+        if edges.size == self.pixel_count or (final and 0 < edges.size < self.pixel_count):
+            edges = np.append(edges, edges[-1] + self._pixel_width)
+        return edges
+
+    def _bin_pending(self, edges, final):
+        """ Counts the kept tags before the last known edge. Later tags wait for the next markers, unless the line
+        is finished or its end is known.
+        """
+        timestamps = self._pending_timestamps
+        if edges is None or edges.size < 2:
+            if final:
+                self._pending_timestamps = timestamps[:0]
+                self._pending_channels = self._pending_channels[:0]
+            return
+        known = timestamps < edges[-1]
+        self.counts += self.bin_line(timestamps[known], self._pending_channels[known], edges)
+        if final or edges.size == self.pixel_count + 1:
+            known[:] = True
+        self._pending_timestamps = timestamps[~known]
+        self._pending_channels = self._pending_channels[~known]
+
+    def bin_line(self, timestamps, tag_channels, edges):
+        """ Counts per channel and pixel of one block of tags.
+
+        Args:
+            timestamps (np.ndarray): int64 timestamps as returned by QuTAG.getLastTimestamps
+            tag_channels (np.ndarray): int8 channel numbers of the timestamps
+            edges (np.ndarray): pixel i covers [edges[i], edges[i+1]), at most pixel_count + 1 edges
+        Returns:
+            np.ndarray: shape (len(channels), pixel_count) int64 counts
+        """
+        counts = np.zeros((len(self.channels), self.pixel_count), dtype=np.int64)
+        edges = np.asarray(edges)
+        if edges.size < 2:
+            return counts
+        rows = self._channel_lookup[np.asarray(tag_channels, dtype=np.int8).view(np.uint8)]
+        counted = rows >= 0
+        pixels = np.searchsorted(edges, timestamps[counted], side='right') - 1
+        rows = rows[counted]
+        in_line = (pixels >= 0) & (pixels < edges.size - 1)
+        flat = rows[in_line]*self.pixel_count + pixels[in_line]
+        counts += np.bincount(flat, minlength=counts.size).reshape(counts.shape)
+        return counts
@@ -1,3 +1,4 @@
+from concurrent.futures import Future
 from abc import abstractmethod
 from qudi.core.module import Base
 
@@ -25,4 +26,27 @@ class Counter(Base):
     def get_count_rates(self, channels):
         """ A read-only data structure containing all hardware parameter limitations.
         """
-        raise NotImplementedError
\ No newline at end of file
+        raise NotImplementedError
+
+    def get_counts_async(self, dt, counter_channel, callback=None):
+        """ Non blocking get_counts, returns a concurrent.futures.Future resolving to the counts.
+        Hardware that can wait for its exposure without blocking should override this, the default
+        reads synchronously and returns an already finished future.
+        """
+        return self._finished_future(self.get_counts, callback, dt, counter_channel)
+
+    def get_count_rates_async(self, channels, callback=None):
+        """ Non blocking get_count_rates, returns a concurrent.futures.Future resolving to the rates.
+        """
+        return self._finished_future(self.get_count_rates, callback, channels)
+
+    @staticmethod
+    def _finished_future(func, callback, *args):
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
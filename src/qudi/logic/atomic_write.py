@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+"""
+Replace-on-success file writes for checkpoints, headers and containers that a crash must not leave truncated.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+
+
+def atomic_write(path, writer, binary=False):
+    """ Writes a file through a temporary file next to it, which replaces path once writer returned.
+
+    Readers see either the previous file or the complete new one. If writer raises, path is left unchanged and the
+    temporary file is removed.
+
+    @param str path: file to write
+    @param callable writer: called with the open temporary file
+    @param bool binary: open the temporary file in binary instead of text mode
+    """
+    temporary = path + '.tmp'
+    try:
+        with open(temporary, 'wb' if binary else 'w') as file:
+            writer(file)
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
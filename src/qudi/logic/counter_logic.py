@@ -25,6 +25,7 @@ class counter_logic(LogicBase):
     
     # signals
     sig_update_display = QtCore.Signal()
+    _sig_count_rates_ready = QtCore.Signal(object)
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -37,7 +38,9 @@ class counter_logic(LogicBase):
 
         self.stop_request = False
         self.buffer_length = 100
+        self._latest_rates = dict()
         self.set_exposure_time(self.dt)
+        self._sig_count_rates_ready.connect(self._on_count_rates_ready, QtCore.Qt.QueuedConnection)
 
         # delay timer for querying hardware
         self.query_timer = QtCore.QTimer()
@@ -88,21 +91,34 @@ class counter_logic(LogicBase):
 
     @QtCore.Slot()
     def check_loop(self):
-        """ Get counts and update display. """
+        """ Request the count rates, the display is updated once the counter hands them back. """
         if self.stop_request:
             if self.module_state.can('stop'):
                 self.module_state.stop()
             self.stop_request = False
             return
-        qi = self.query_interval
         try:
-            self.counts = self.get_counts(self.get_counter_channels().values())
+            channels = self.channel_input_converter(self.get_counter_channels().values())
+            future = self._counter.get_count_rates_async(channels)
+            future.add_done_callback(lambda f: self._sig_count_rates_ready.emit((channels, f)))
+        except:
+            self.log.exception("Exception in counter status loop, throttling refresh rate.")
+            self.query_timer.start(3000)
 
+    @QtCore.Slot(object)
+    def _on_count_rates_ready(self, result):
+        """ Store the finished count rates, restart the loop and update the display. """
+        channels, future = result
+        qi = self.query_interval
+        try:
+            self.counts = future.result()
+            self._latest_rates.update(zip(channels, self.counts))
         except:
             qi = 3000
             self.log.exception("Exception in counter status loop, throttling refresh rate.")
 
-        self.query_timer.start(qi)
+        if self.module_state() == 'locked':
+            self.query_timer.start(qi)
         self.sig_update_display.emit()
 
     def set_exposure_time(self,dt):
@@ -135,7 +151,7 @@ class counter_logic(LogicBase):
         return channel_address
 
     def get_counts(self, channels):
-        self._counter.get_counts(self.dt, self.channel_input_converter(channels))
+        return self._counter.get_counts(self.dt, self.channel_input_converter(channels))
 
     def get_count_rates(self, channels):
         '''
@@ -145,6 +161,18 @@ class counter_logic(LogicBase):
         Return number of counts
         '''
         return self._counter.get_count_rates(self.channel_input_converter(channels))
+
+    def get_count_rates_async(self, channels):
+        '''
+        Same as get_count_rates but returns a concurrent.futures.Future instead of waiting for the exposure
+        '''
+        return self._counter.get_count_rates_async(self.channel_input_converter(channels))
+
+    def get_latest_count_rates(self, channels):
+        '''
+        Returns the rates of the last finished readout of the query loop without touching the hardware
+        '''
+        return [self._latest_rates.get(channel, 0) for channel in self.channel_input_converter(channels)]
     
     def get_counter_channels(self):
         return self.counter_channels
\ No newline at end of file
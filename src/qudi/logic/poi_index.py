@@ -0,0 +1,189 @@
+# -*- coding: utf-8 -*-
+"""
+Uniform grid index of POI positions for nearest neighbour and radius queries.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import itertools
+import numpy as np
+
+
+class PoiGridIndex:
+    """ POI names hashed into cubic cells of edge cell_size.
+
+    Inserting, moving and removing a POI touches one cell. Radius queries only visit the cells overlapping the
+    query sphere, nearest neighbour queries search shells of cells outwards from the query position, so both cost
+    O(1) for POIs spread over the sample with a cell size around their typical spacing. Queries that would visit
+    more cells than there are POIs compare against all POIs at once instead.
+
+    @param float cell_size: cell edge in m, e.g. the POI diameter
+    """
+
+    def __init__(self, cell_size=100e-9):
+        self.cell_size = float(cell_size)
+        self._cells = dict()
+        self._positions = dict()
+        self._low = None #Smallest and largest occupied cell per axis, may be larger than needed after removals
+        self._high = None
+
+    def __len__(self):
+        return len(self._positions)
+
+    def __contains__(self, name):
+        return name in self._positions
+
+    def _cell(self, position):
+        return tuple(np.floor(np.asarray(position, dtype=float)/self.cell_size).astype(int))
+
+    def insert(self, name, position):
+        if name in self._positions:
+            self.remove(name)
+        position = np.array(position, dtype=float)
+        self._positions[name] = position
+        cell = self._cell(position)
+        self._cells.setdefault(cell, set()).add(name)
+        self._low = cell if self._low is None else tuple(min(a, b) for a, b in zip(self._low, cell))
+        self._high = cell if self._high is None else tuple(max(a, b) for a, b in zip(self._high, cell))
+
+    def remove(self, name):
+        position = self._positions.pop(name, None)
+        if position is None:
+            return
+        cell = self._cell(position)
+        self._cells[cell].discard(name)
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def rename(self, name, new_name):
+        self.insert(new_name, self._positions[name])
+        self.remove(name)
+
+    def rebuild(self, positions, cell_size=None):
+        """ Replaces the index content with {name: position}, optionally with a new cell size.
+        """
+        if cell_size is not None:
+            self.cell_size = float(cell_size)
+        self._cells = dict()
+        self._positions = dict()
+        self._low = None
+        self._high = None
+        for name, position in positions.items():
+            self.insert(name, position)
+
+    def _cube(self, centre, radius):
+        """ Cell ranges per axis inside the occupied range at Chebyshev distance up to radius from centre.
+        """
+        return [range(max(c - radius, lo), min(c + radius, hi) + 1) for c, lo, hi in zip(centre, self._low, self._high)]
+
+    @staticmethod
+    def _shell(centre, radius, cube):
+        """ Cells of cube at Chebyshev distance radius (in cells) from centre.
+        """
+        for cell in itertools.product(*cube):
+            if max(abs(a - c) for a, c in zip(cell, centre)) == radius:
+                yield cell
+
+    def _distances(self, position):
+        """ (names, distances) of all POIs, for queries that would visit more cells than there are POIs.
+        """
+        names = list(self._positions)
+        positions = np.array([self._positions[name] for name in names])
+        return names, np.linalg.norm(positions - position, axis=1)
+
+    def within(self, position, radius):
+        """ POIs at most radius away from position.
+
+        @return list: [(name, distance), ...] nearest first
+        """
+        if not self._positions:
+            return []
+        position = np.asarray(position, dtype=float)
+        low = [max(a, b) for a, b in zip(self._cell(position - radius), self._low)]
+        high = [min(a, b) for a, b in zip(self._cell(position + radius), self._high)]
+        if np.prod([max(hi - lo + 1, 0) for lo, hi in zip(low, high)]) > len(self._positions):
+            names, distances = self._distances(position)
+            inside = np.flatnonzero(distances <= radius)
+            return sorted(((names[i], float(distances[i])) for i in inside), key=lambda item: item[1])
+        found = []
+        for cell in itertools.product(*(range(lo, hi + 1) for lo, hi in zip(low, high))):
+            for name in self._cells.get(cell, ()):
+                distance = float(np.linalg.norm(self._positions[name] - position))
+                if distance <= radius:
+                    found.append((name, distance))
+        return sorted(found, key=lambda item: item[1])
+
+    def nearest(self, position, max_distance=None):
+        """ POI closest to position.
+
+        @param float max_distance: ignore POIs further away, search the whole index if None
+        @return (str, float): name and distance, (None, inf) if there is no POI (within max_distance)
+        """
+        if not self._positions:
+            return None, np.inf
+        position = np.asarray(position, dtype=float)
+        centre = self._cell(position)
+        # Occupied cells are only found from the first to the last shell
+        first_shell = max(max(lo - c, c - hi, 0) for c, lo, hi in zip(centre, self._low, self._high))
+        last_shell = max(max(abs(c - lo), abs(hi - c)) for c, lo, hi in zip(centre, self._low, self._high))
+        if max_distance is not None:
+            last_shell = min(last_shell, int(np.ceil(max_distance/self.cell_size)))
+        best_name, best_distance = None, np.inf
+        visited = 0
+        for shell in range(first_shell, last_shell + 1):
+            # Every POI in shell k or further is at least (k - 1) cells away
+            if (shell - 1)*self.cell_size > best_distance:
+                break
+            # A shell is searched by walking its cube, give up on cells once that costs more than all POIs
+            cube = self._cube(centre, shell)
+            visited += int(np.prod([len(r) for r in cube]))
+            if visited > len(self._positions):
+                names, distances = self._distances(position)
+                best = int(np.argmin(distances))
+                best_name, best_distance = names[best], float(distances[best])
+                break
+            for cell in self._shell(centre, shell, cube):
+                for name in self._cells.get(cell, ()):
+                    distance = float(np.linalg.norm(self._positions[name] - position))
+                    if distance < best_distance:
+                        best_name, best_distance = name, distance
+        if max_distance is not None and best_distance > max_distance:
+            return None, np.inf
+        return best_name, best_distance
+
+    def clusters(self, radius):
+        """ Groups of POIs connected by distances of at most radius, only groups of two or more POIs.
+
+        @return list: [[name, ...], ...]
+        """
+        parent = {name: name for name in self._positions}
+
+        def root(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for name, position in self._positions.items():
+            for other, _ in self.within(position, radius):
+                a, b = root(name), root(other)
+                if a != b:
+                    parent[b] = a
+        groups = dict()
+        for name in self._positions:
+            groups.setdefault(root(name), []).append(name)
+        return [group for group in groups.values() if len(group) > 1]
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+"""
+Batch survey over the POIs of the current ROI: the POIs are visited in a short travel order, optionally refocused,
+and a configurable measurement recipe is run at each of them. Progress is checkpointed after every measurement,
+so an interrupted survey can be resumed.
+
+A survey is stored as a directory holding
+    survey.json     recipe, visit order, finished measurements per POI and whether the survey is complete
+    <nnnn>_<poi>_<step>.npy   data of one measurement step at one POI
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+import time
+import threading
+from datetime import datetime
+
+import numpy as np
+from PySide2 import QtCore
+
+from qudi.core.module import LogicBase
+from qudi.core.connector import Connector
+from qudi.core.configoption import ConfigOption
+from qudi.logic.atomic_write import atomic_write
+from qudi.logic.poi_tour import order_tour, tour_length
+
+_SURVEY_FILE = 'survey.json'
+
+
+class SurveyCheckpoint:
+    """ Recipe, visit order and progress of a survey on disk, see the module docstring.
+    """
+
+    def __init__(self, path, state):
+        self.path = path
+        self.state = state
+
+    @classmethod
+    def create(cls, path, recipe, order, refocus):
+        os.makedirs(path, exist_ok=False)
+        state = {'version': 1,
+                 'start': datetime.now().isoformat(),
+                 'recipe': recipe,
+                 'order': list(order),
+                 'refocus': bool(refocus),
+                 'done': {},
+                 'visits': {},
+                 'complete': False}
+        checkpoint = cls(path, state)
+        checkpoint.write()
+        return checkpoint
+
+    @classmethod
+    def open(cls, path):
+        with open(os.path.join(path, _SURVEY_FILE), 'r') as file:
+            return cls(path, json.load(file))
+
+    @property
+    def complete(self):
+        return self.state['complete']
+
+    def is_done(self, poi, step):
+        return step in self.state['done'].get(poi, {})
+
+    def add_visit(self, poi, visit):
+        self.state['visits'].setdefault(poi, []).append(visit)
+        self.write()
+
+    def add_result(self, index, poi, step, data):
+        """ Saves the data of one measurement step and records it as done.
+        """
+        filename = '{0:04d}_{1}_{2}.npy'.format(index, poi.replace(' ', '_'), step)
+        np.save(os.path.join(self.path, filename), np.asarray(data))
+        self.state['done'].setdefault(poi, {})[step] = {'file': filename, 'time': datetime.now().isoformat()}
+        self.write()
+
+    def mark_complete(self):
+        self.state['complete'] = True
+        self.write()
+
+    def write(self):
+        self.state['saved'] = datetime.now().isoformat()
+        atomic_write(os.path.join(self.path, _SURVEY_FILE),
+                     lambda file: json.dump(self.state, file, indent=2, default=str))
+
+
+class PoiSurveyLogic(LogicBase):
+    """
+    Visits every POI of the current ROI in a short travel order and runs a measurement recipe at each one.
+
+    A recipe is a list of steps, each a dict with a 'measurement' and its parameters:
+        {'measurement': 'spectrum', 'integration_time': 20000, 'frames': 1}         # integration time in us
+        {'measurement': 'g2', 'max_time': 300, 'precision': 0.05}                   # auto stop of the qutag logic
+        {'measurement': 'lifetime', 'max_time': 120, 'precision': 0.02}
+        {'measurement': 'saturation', 'start_power': 1, 'stop_power': 100, 'num_points': 10,
+         'integration_time': 100, 'num_to_average': 3}                             # powers in uW, time in ms
+    An optional 'name' distinguishes two steps of the same measurement.
+
+    example config for copy-paste:
+
+    poi_survey_logic:
+        module.Class: 'poi_survey_logic.PoiSurveyLogic'
+        options:
+            recipe:
+                - {measurement: spectrum, integration_time: 20000}
+                - {measurement: g2, max_time: 300, precision: 0.05}
+            refocus: True
+        connect:
+            poi_manager_logic: poi_manager_logic
+            optimize_logic: scanning_optimize_logic
+            qutag_logic: qutagLogic
+            spectrometer_logic: spectrometer_logic
+            saturation_logic: saturation_logic
+    """
+
+    _poi_manager_logic = Connector(name='poi_manager_logic', interface='PoiManagerLogic')
+    _optimize_logic = Connector(name='optimize_logic', interface='ScanningOptimizeLogic', optional=True)
+    _qutag_logic = Connector(name='qutag_logic', interface='QuTagLogic', optional=True)
+    _spectrometer_logic = Connector(name='spectrometer_logic', interface='SpectrometerLogic', optional=True)
+    _saturation_logic = Connector(name='saturation_logic', interface='SaturationLogic', optional=True)
+
+    _recipe = ConfigOption(name='recipe', default=[{'measurement': 'spectrum', 'integration_time': 20000}])
+    _refocus = ConfigOption(name='refocus', default=True) #Optimize on every POI before its measurements, needs optimize_logic
+    _refocus_timeout = ConfigOption(name='refocus_timeout', default=120) #s
+    _settle_time = ConfigOption(name='settle_time', default=0.5) #s waited after moving to a POI
+    _axis_weights = ConfigOption(name='axis_weights', default=[1, 1, 1]) #Travel cost per m along x, y and z for the visit order
+    _measurement_timeout = ConfigOption(name='measurement_timeout', default=3600) #s, a step that does not finish in time is skipped
+    _stop_timeout = ConfigOption(name='stop_timeout', default=30) #s stop_survey waits for the measurement or refocus in progress to abort
+    _survey_dir = ConfigOption(name='survey_dir', default=None) #Directory the surveys are stored in, the module data directory if None
+
+    sigSurveyStateChanged = QtCore.Signal(bool)  # is_running
+    sigSurveyProgress = QtCore.Signal(int, int, str)  # POIs done, POIs total, current POI
+
+    _measurements = ('spectrum', 'g2', 'lifetime', 'saturation')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._thread = None
+        self._stop_event = threading.Event()
+        self._checkpoint = None
+
+    def on_activate(self):
+        pass
+
+    def on_deactivate(self):
+        self.stop_survey()
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def survey_path(self):
+        """ Directory of the current or last survey, None before the first survey. """
+        return None if self._checkpoint is None else self._checkpoint.path
+
+    def plan_survey(self, names=None):
+        """
+        Visit order of POIs starting at the current scanner position.
+
+        @param list names: POIs to visit, all POIs of the ROI if None
+        @return (list, float, float): POI names in visit order, travel in m of that order and of the given order
+        """
+        poi_manager = self._poi_manager_logic()
+        positions = poi_manager.poi_positions
+        names = list(positions) if names is None else [name for name in names if name in positions]
+        if not names:
+            return [], 0.0, 0.0
+        points = np.array([positions[name] for name in names])
+        start = poi_manager.scanner_position
+        order = order_tour(points, start, self._axis_weights)
+        travel = tour_length(points, order, start, self._axis_weights)
+        given = tour_length(points, np.arange(len(names)), start, self._axis_weights)
+        return [names[i] for i in order], travel, given
+
+    def start_survey(self, names=None, recipe=None, refocus=None):
+        """
+        Starts a survey over POIs in a new survey directory.
+
+        @param list names: POIs to visit, all POIs of the ROI if None
+        @param list recipe: Measurement steps, the configured recipe if None
+        @param bool refocus: Optimize on every POI first, the configured refocus if None
+        @return bool: Failure indicator (fail=True)
+        """
+        if self.is_running:
+            self.log.error('Survey already running.')
+            return True
+        recipe = list(self._recipe if recipe is None else recipe)
+        if not self._check_recipe(recipe):
+            return True
+        order, travel, given = self.plan_survey(names)
+        if not order:
+            self.log.error('No POIs to survey.')
+            return True
+        refocus = self._refocus if refocus is None else refocus
+        directory = self.module_default_data_dir if self._survey_dir is None else self._survey_dir
+        path = os.path.join(directory, 'survey_' + datetime.now().strftime('%Y%m%d-%H%M%S'))
+        try:
+            checkpoint = SurveyCheckpoint.create(path, recipe, order, refocus)
+        except OSError:
+            self.log.exception('Unable to create survey directory {0}'.format(path))
+            return True
+        self.log.info('Survey of {0:d} POIs, travel {1:.3g} m instead of {2:.3g} m in list order'
+                      ''.format(len(order), travel, given))
+        return self._start(checkpoint)
+
+    def resume_survey(self, path):
+        """
+        Continues an interrupted survey with the measurements that are missing.
+
+        @param str path: Survey directory
+        @return bool: Failure indicator (fail=True)
+        """
+        if self.is_running:
+            self.log.error('Survey already running.')
+            return True
+        try:
+            checkpoint = SurveyCheckpoint.open(path)
+        except (OSError, ValueError):
+            self.log.exception('Unable to open survey {0}'.format(path))
+            return True
+        if checkpoint.complete:
+            self.log.info('Survey {0} is already complete'.format(path))
+            return True
+        if not self._check_recipe(checkpoint.state['recipe']):
+            return True
+        return self._start(checkpoint)
+
+    def stop_survey(self):
+        """ Stops the survey, the measurement or refocus in progress is aborted and repeated on resume.
+
+        @return bool: Failure indicator (fail=True), True if the survey thread did not end within stop_timeout
+        """
+        self._stop_event.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(self._stop_timeout)
+            if self._thread.is_alive():
+                self.log.error('Survey did not stop within {0} s'.format(self._stop_timeout))
+                return True
+        return False
+
+    def _start(self, checkpoint):
+        self._checkpoint = checkpoint
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_survey, args=(checkpoint,), name='poi_survey',
+                                        daemon=True)
+        self._thread.start()
+        self.sigSurveyStateChanged.emit(True)
+        return False
+
+    def _check_recipe(self, recipe):
+        for step in recipe:
+            measurement = step.get('measurement')
+            if measurement not in self._measurements:
+                self.log.error('Unknown survey measurement "{0}", valid are {1}'.format(measurement,
+                                                                                         self._measurements))
+                return False
+            module = {'spectrum': self._spectrometer_logic, 'saturation': self._saturation_logic}.get(
+                measurement, self._qutag_logic)
+            if module() is None:
+                self.log.error('Survey measurement "{0}" needs a connected {1}'.format(measurement, module.name))
+                return False
+        return True
+
+    @staticmethod
+    def _step_name(step, index):
+        return step.get('name', '{0}{1:d}'.format(step['measurement'], index))
+
+    def _run_survey(self, checkpoint):
+        """ Survey thread, visits the POIs in order and runs the missing steps of the recipe at each.
+        """
+        recipe = checkpoint.state['recipe']
+        order = checkpoint.state['order']
+        steps = [(self._step_name(step, i), step) for i, step in enumerate(recipe)]
+        try:
+            for index, poi in enumerate(order):
+                if self._stop_event.is_set():
+                    break
+                self.sigSurveyProgress.emit(index, len(order), poi)
+                missing = [(name, step) for name, step in steps if not checkpoint.is_done(poi, name)]
+                if not missing:
+                    continue
+                if poi not in self._poi_manager_logic().poi_names:
+                    self.log.warning('POI "{0}" no longer exists, skipped in survey'.format(poi))
+                    continue
+                checkpoint.add_visit(poi, self._visit(poi, checkpoint.state['refocus']))
+                for name, step in missing:
+                    if self._stop_event.is_set():
+                        break
+                    data = self._measure(step)
+                    if data is not None:
+                        checkpoint.add_result(index, poi, name, data)
+            # Skipped POIs and failed steps stay missing, resuming the survey retries them
+            if not self._stop_event.is_set() and all(checkpoint.is_done(poi, name)
+                                                     for poi in order for name, _ in steps):
+                checkpoint.mark_complete()
+                self.sigSurveyProgress.emit(len(order), len(order), '')
+        except Exception:
+            self.log.exception('Survey aborted')
+        finally:
+            if checkpoint.complete:
+                self.log.info('Survey {0} complete'.format(checkpoint.path))
+            elif self._stop_event.is_set():
+                self.log.info('Survey {0} stopped'.format(checkpoint.path))
+            else:
+                self.log.warning('Survey {0} ended with missing steps, resume it to retry them'
+                                 ''.format(checkpoint.path))
+            self.sigSurveyStateChanged.emit(False)
+
+    def _visit(self, poi, refocus):
+        """ Moves to a POI and optionally refocuses on it, the ROI is shifted by the refocus offset.
+
+        @return dict: time, POI position and refocused position of the visit
+        """
+        poi_manager = self._poi_manager_logic()
+        poi_manager.set_active_poi(poi)
+        poi_manager.go_to_poi(poi)
+        time.sleep(self._settle_time)
+        position = np.array(poi_manager.get_poi_position(poi), dtype=float)
+        visit = {'time': datetime.now().isoformat(), 'position': position.tolist(), 'refocused': None}
+        if refocus and self._optimize_logic() is not None:
+            optimal = self._optimize_logic().optimize_blocking(self._refocus_timeout, abort=self._stop_event)
+            if optimal:
+                refocused = position.copy()
+                for i, ax in enumerate(('x', 'y', 'z')):
+                    if ax in optimal:
+                        refocused[i] = optimal[ax]
+                poi_manager.move_roi_from_poi_position(name=poi, position=refocused)
+                poi_manager.go_to_poi(poi)
+                time.sleep(self._settle_time)
+                visit['refocused'] = refocused.tolist()
+            elif not self._stop_event.is_set():
+                self.log.warning('Refocus on POI "{0}" failed, measuring at the stored position'.format(poi))
+        return visit
+
+    def _wait_for(self, signal, start, finished=None):
+        """ Calls start and waits until signal is emitted (and finished(*args) is True) or the survey is stopped.
+
+        @return bool: True if the signal arrived, False on timeout or stop
+        """
+        done = threading.Event()
+
+        def on_signal(*args):
+            if finished is None or finished(*args):
+                done.set()
+
+        signal.connect(on_signal, QtCore.Qt.DirectConnection)
+        try:
+            start()
+            deadline = time.monotonic() + self._measurement_timeout
+            while not done.wait(0.5):
+                if self._stop_event.is_set() or time.monotonic() > deadline:
+                    return False
+            return True
+        finally:
+            signal.disconnect(on_signal)
+
+    def _wait_until(self, condition):
+        """ Polls condition until it is True or the survey is stopped.
+
+        @return bool: True if condition became True, False on timeout or stop
+        """
+        deadline = time.monotonic() + self._measurement_timeout
+        while not condition():
+            if self._stop_event.wait(0.05) or time.monotonic() > deadline:
+                return False
+        return True
+
+    def _measure(self, step):
+        """ Runs one recipe step at the current position.
+
+        @return np.ndarray: data of the step, None if it did not finish
+        """
+        measurement = step['measurement']
+        if measurement == 'spectrum':
+            return self._measure_spectrum(step)
+        if measurement == 'saturation':
+            return self._measure_saturation(step)
+        return self._measure_qutag(step)
+
+    def _measure_spectrum(self, step):
+        spectrometer = self._spectrometer_logic()
+        previous = spectrometer.integration_time
+        if 'integration_time' in step:
+            spectrometer.set_integration_time(step['integration_time'])
+        try:
+            intensities = None
+            for _ in range(int(step.get('frames', 1))):
+                # A single shot emits sig_update_display more than once and clears isRunning after the last
+                # emission, waiting for isRunning keeps a frame from starting or being read twice.
+                if not (self._wait_until(lambda: not spectrometer.isRunning)
+                        and self._wait_for(spectrometer.sig_update_display, spectrometer.start_singleShotAcquisition)
+                        and self._wait_until(lambda: not spectrometer.isRunning)):
+                    self.log.warning('Spectrum acquisition did not finish')
+                    return None
+                frame = np.array(spectrometer.intensities_counts, dtype=np.float64)
+                intensities = frame if intensities is None else intensities + frame
+            return np.vstack((spectrometer.wavelengths, intensities))
+        finally:
+            if spectrometer.integration_time != previous:
+                spectrometer.set_integration_time(previous)
+
+    def _measure_qutag(self, step):
+        qutag = self._qutag_logic()
+        measurement_type = 'G2' if step['measurement'] == 'g2' else 'LIFETIME'
+        previous = (qutag.auto_stop, qutag.auto_stop_max_time, qutag.auto_stop_save,
+                    qutag.auto_stop_g2_precision if measurement_type == 'G2' else qutag.auto_stop_lifetime_precision)
+        qutag.reset()
+
+        def start():
+            qutag.start(measurement_type)
+            qutag.set_auto_stop(True, step.get('precision'), step.get('max_time'), save=False)
+
+        try:
+            if not self._wait_for(qutag.sigAutoStopped, start):
+                qutag.stop()
+                self.log.warning('{0} acquisition did not finish'.format(measurement_type))
+                return None
+        finally:
+            qutag.set_auto_stop(previous[0], previous[3], previous[1], previous[2])
+        time_axis, counts = qutag.get_G2() if measurement_type == 'G2' else qutag.get_Lifetime()
+        return np.vstack((time_axis, counts))
+
+    def _measure_saturation(self, step):
+        saturation = self._saturation_logic()
+        saturation.configure_scan(step['start_power'], step['stop_power'], step['num_points'],
+                                  step['integration_time'], step['num_to_average'])
+        if not self._wait_for(saturation.sigMeasurementComplete, saturation.initiate_measurement):
+            saturation.halt_measurement()
+            self.log.warning('Saturation measurement did not finish')
+            return None
+        return np.array(saturation.data, dtype=np.float64)
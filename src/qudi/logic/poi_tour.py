@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+Visit order of POIs with a short travel path, used by the POI survey.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import time
+
+import numpy as np
+
+
+def tour_length(positions, order, start=None, weights=(1, 1, 1)):
+    """ Travel distance of visiting positions in order, starting at start if given.
+    """
+    points = np.asarray(positions, dtype=np.float64)[np.asarray(order, dtype=int)]*np.asarray(weights)
+    if start is not None:
+        points = np.vstack((np.asarray(start, dtype=np.float64)*np.asarray(weights), points))
+    return float(np.linalg.norm(np.diff(points, axis=0), axis=1).sum())
+
+
+def order_tour(positions, start=None, weights=(1, 1, 1), max_passes=50, time_limit=10):
+    """ Visit order of positions with a short total travel, an open path from start (or the first position).
+
+    A nearest neighbour tour is refined with 2-opt moves (reversing the segment between two edges if that
+    shortens the path) until no move improves it, max_passes passes were done or time_limit s passed. The gain
+    of all moves of one edge is computed at once.
+
+    @param np.ndarray positions: (n, 3) positions in m
+    @param np.ndarray start: position the path starts at, e.g. the scanner position
+    @param tuple weights: travel cost per m along each axis, e.g. a higher z weight for a slow z stage
+    @return np.ndarray: int indices into positions in visit order
+    """
+    points = np.asarray(positions, dtype=np.float64).reshape(-1, 3)*np.asarray(weights, dtype=np.float64)
+    n = len(points)
+    if n < 2:
+        return np.arange(n)
+    # node 0 is the fixed start of the path
+    start = points[0] if start is None else np.asarray(start, dtype=np.float64)*np.asarray(weights)
+    nodes = np.vstack((start, points))
+
+    unvisited = np.ones(n + 1, dtype=bool)
+    unvisited[0] = False
+    tour = [0]
+    for _ in range(n):
+        distances = np.linalg.norm(nodes - nodes[tour[-1]], axis=1)
+        distances[~unvisited] = np.inf
+        nearest = int(np.argmin(distances))
+        unvisited[nearest] = False
+        tour.append(nearest)
+    tour = np.array(tour)
+
+    deadline = time.monotonic() + time_limit
+    for _ in range(int(max_passes)):
+        improved = False
+        for i in range(n - 1):
+            if time.monotonic() > deadline:
+                break
+            a, b = nodes[tour[i]], nodes[tour[i + 1]]
+            j = np.arange(i + 2, n + 1)
+            c = nodes[tour[j]]
+            removed = np.linalg.norm(a - b)
+            gain = np.linalg.norm(c - a, axis=1) - removed
+            # Inner edges (c, d) are replaced by (b, d), the path end has no edge after c
+            inner = j < n
+            d = nodes[tour[j[inner] + 1]]
+            gain[inner] += np.linalg.norm(d - b, axis=1) - np.linalg.norm(d - c[inner], axis=1)
+            best = int(np.argmin(gain))
+            if gain[best] < -1e-12:
+                tour[i + 1:j[best] + 1] = tour[i + 1:j[best] + 1][::-1].copy()
+                improved = True
+        if not improved or time.monotonic() > deadline:
+            break
+    return tour[1:] - 1
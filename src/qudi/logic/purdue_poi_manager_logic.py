@@ -38,6 +38,9 @@ from qudi.core.configoption import ConfigOption
 from qudi.core.statusvariable import StatusVar
 from qudi.util.mutex import RecursiveMutex
 from qudi.util.datastorage import TextDataStorage
+from qudi.logic.poi_index import PoiGridIndex
+from qudi.logic.roi_container import RoiContainer, save_roi_container
+from qudi.logic.poi_detection import detect_spots, localise_spots, rank_spots, spot_filter_size
 
 
 class RegionOfInterest:
@@ -68,6 +71,8 @@ class RegionOfInterest:
         self._poi_tag = None
         # dictionary of POIs contained in this ROI with keys being the name
         self._pois = dict()
+        # Spatial index of the POI anchors for nearest neighbour and radius queries
+        self._index = PoiGridIndex()
 
         self.creation_time = creation_time
         self.name = name
@@ -187,6 +192,7 @@ class RegionOfInterest:
             raise KeyError('POI with name "{0}" not found in ROI "{1}".\n'
                            'Unable to change POI position.'.format(name, self.name))
         self._pois[name].position = np.array(new_pos, dtype=float) - self.origin
+        self._index.insert(name, self._pois[name].position)
         return
 
     def set_poi_anchor(self, name, new_pos):
@@ -194,6 +200,7 @@ class RegionOfInterest:
             raise KeyError('POI with name "{0}" not found in ROI "{1}".\n'
                            'Unable to change POI position.'.format(name, self.name))
         self._pois[name].position = new_pos
+        self._index.insert(name, self._pois[name].position)
         return
 
     def rename_poi(self, name, new_name=None):
@@ -205,9 +212,15 @@ class RegionOfInterest:
             raise NameError('New POI name "{0}" already present in current POI list.')
         self._pois[name].name = new_name
         self._pois[new_name] = self._pois.pop(name)
+        self._index.rename(name, new_name)
         return
 
-    def add_poi(self, position, name=None):
+    def get_poi_properties(self, name):
+        if name not in self._pois:
+            raise KeyError('No POI with name "{0}" found in POI list.'.format(name))
+        return self._pois[name].properties
+
+    def add_poi(self, position, name=None, properties=None):
         if isinstance(position, PointOfInterest):
             poi_inst = position
         else:
@@ -220,12 +233,13 @@ class RegionOfInterest:
                     name = '{0}{1:d}'.format(self._poi_tag, tag_index)
                     if name not in self._pois:
                         break
-            poi_inst = PointOfInterest(position=position, name=name)
+            poi_inst = PointOfInterest(position=position, name=name, properties=properties)
         if poi_inst.name in self._pois:
             raise ValueError('POI with name "{0}" already present in ROI "{1}".\n'
                              'Could not add POI to ROI'.format(poi_inst.name, self.name))
         self._pois[poi_inst.name] = poi_inst
-        return
+        self._index.insert(poi_inst.name, poi_inst.position)
+        return poi_inst.name
 
     def delete_poi(self, name):
         if not isinstance(name, str):
@@ -233,8 +247,42 @@ class RegionOfInterest:
         if name not in self._pois:
             raise KeyError('Name "{0}" not found in POI list.'.format(name))
         del self._pois[name]
+        self._index.remove(name)
         return
 
+    def set_index_cell_size(self, cell_size):
+        """
+        Sets the cell edge of the spatial POI index, queries are fastest for cells around the POI size.
+
+        @param float cell_size: Cell edge in m
+        """
+        if cell_size > 0 and cell_size != self._index.cell_size:
+            self._index.rebuild(self.poi_anchors, cell_size)
+        return
+
+    def nearest_poi(self, position, max_distance=None):
+        """
+        @param float[3] position: Absolute position (x, y, z)
+        @param float max_distance: Ignore POIs further away than this, no limit if None
+        @return (str, float): Name of and distance to the closest POI, (None, inf) if there is none
+        """
+        return self._index.nearest(np.asarray(position, dtype=float) - self.origin, max_distance)
+
+    def pois_within(self, position, radius):
+        """
+        @param float[3] position: Absolute position (x, y, z)
+        @param float radius: Search radius in m
+        @return list: (name, distance) of every POI within radius, nearest first
+        """
+        return self._index.within(np.asarray(position, dtype=float) - self.origin, radius)
+
+    def duplicate_groups(self, radius):
+        """
+        @param float radius: POIs at most this far apart are duplicates (chained)
+        @return list: Lists of names of POIs that are duplicates of each other
+        """
+        return self._index.clusters(radius)
+
     def set_scan_image(self, image_arr, image_extent):
         """
 
@@ -313,11 +361,13 @@ class PointOfInterest:
     The actual individual poi is saved in this generic object.
     """
 
-    def __init__(self, position, name=None):
+    def __init__(self, position, name=None, properties=None):
         # Name of the POI
         self._name = ''
         # Relative POI position within the ROI (x,y,z)
         self._position = np.zeros(3)
+        # Emitter parameters of the POI, e.g. the fit results of the auto detection
+        self.properties = dict() if properties is None else dict(properties)
         # Initialize properties
         self.position = position
         self.name = name
@@ -348,6 +398,8 @@ class PointOfInterest:
         return
 
     def to_dict(self):
+        if self.properties:
+            return {'name': self.name, 'position': tuple(self.position), 'properties': dict(self.properties)}
         return {'name': self.name, 'position': tuple(self.position)}
 
     @classmethod
@@ -378,6 +430,8 @@ class PoiManagerLogic(LogicBase):
 
     # config options
     _scan_axes = tuple(str(ConfigOption('data_scan_axes', default='xy', missing='info')))
+    _roi_file_format = ConfigOption('roi_file_format', default='container') #'container' for one .npz file, 'text' for the legacy POI list with separate .npy files
+    _merge_duplicates_on_save = ConfigOption('merge_duplicates_on_save', default=False) #Merge POIs closer than the POI diameter before the ROI is saved, see merge_duplicate_pois
 
     # status vars
     _roi = StatusVar(default=RegionOfInterest())  # Notice constructor and representer further below
@@ -599,7 +653,7 @@ class PoiManagerLogic(LogicBase):
 
     @QtCore.Slot()
     @QtCore.Slot(np.ndarray)
-    def add_poi(self, position=None, name=None, emit_change=True):
+    def add_poi(self, position=None, name=None, emit_change=True, properties=None, skip_duplicate=False):
         """
         Creates a new POI and adds it to the current ROI.
         POI can be optionally initialized with position and name.
@@ -610,19 +664,26 @@ class PoiManagerLogic(LogicBase):
                                    respect to the ROI origin. None (default) causes the current
                                    scanner crosshair position to be used.
         @param bool emit_change: Flag indicating if the changed POI set should be signaled.
+        @param dict properties: Optional emitter parameters stored with the POI (e.g. fit results).
+        @param bool skip_duplicate: Do not add the POI if another one is closer than the POI diameter.
+
+        @return str: Name of the new POI, None if it was skipped as duplicate
         """
         with self._thread_lock:
             # Get current scanner position from  if no position is provided.
             if position is None:
                 position = self.scanner_position
 
-            current_poi_set = set(self.poi_names)
+            # Check for an existing POI at this position
+            self._roi.set_index_cell_size(self._poi_diameter)
+            duplicate, distance = self._roi.nearest_poi(position, self._poi_diameter)
+            if duplicate is not None:
+                if skip_duplicate:
+                    return None
+                self.log.warning('New POI is only {0:.3g} m away from POI "{1}".'.format(distance, duplicate))
 
             # Add POI to current ROI
-            self._roi.add_poi(position=position, name=name)
-
-            # Get newly added POI name from comparing POI names before and after addition of new POI
-            poi_name = set(self.poi_names).difference(current_poi_set).pop()
+            poi_name = self._roi.add_poi(position=position, name=name, properties=properties)
 
             # Notify about a changed set of POIs if necessary
             if emit_change:
@@ -630,7 +691,7 @@ class PoiManagerLogic(LogicBase):
 
             # Set newly created POI as active poi
             self.set_active_poi(poi_name)
-            return
+            return poi_name
 
     @QtCore.Slot()
     def delete_poi(self, name=None):
@@ -731,6 +792,98 @@ class PoiManagerLogic(LogicBase):
                 name = self.active_poi
             return self._roi.get_poi_position(name)
 
+    def get_poi_properties(self, name=None):
+        """
+        Returns the emitter parameters stored with a POI, e.g. the localisation of the auto detection.
+
+        @param str name: Name of the POI, the active POI if None
+        @return dict: POI properties, empty if none were stored
+        """
+        if name is None:
+            if self.active_poi is None:
+                self.log.error('No POI name given and no active POI set.')
+                return dict()
+            name = self.active_poi
+        return self._roi.get_poi_properties(name)
+
+    def rank_pois(self, key='amplitude', descending=True):
+        """
+        POI names ordered by one of their properties, POIs without that property are left out.
+
+        @param str key: Property to sort by, e.g. 'amplitude', 'sigma' or 'background'
+        @param bool descending: Largest value first
+        @return list: POI names
+        """
+        with self._thread_lock:
+            values = {name: self._roi.get_poi_properties(name).get(key) for name in self.poi_names}
+            ranked = [name for name in values if values[name] is not None]
+            return sorted(ranked, key=lambda name: values[name], reverse=descending)
+
+    def nearest_poi(self, position=None, max_distance=None):
+        """
+        Name of the POI closest to a position.
+
+        @param float[3] position: Absolute position (x, y, z), the scanner position if None
+        @param float max_distance: Ignore POIs further away than this, no limit if None
+        @return (str, float): Name of and distance to the closest POI, (None, inf) if there is none
+        """
+        with self._thread_lock:
+            if position is None:
+                position = self.scanner_position
+            self._roi.set_index_cell_size(self._poi_diameter)
+            return self._roi.nearest_poi(position, max_distance)
+
+    def pois_within(self, position=None, radius=None):
+        """
+        POIs within a radius around a position.
+
+        @param float[3] position: Absolute position (x, y, z), the scanner position if None
+        @param float radius: Search radius in m, the POI diameter if None
+        @return list: (name, distance) of every POI within radius, nearest first
+        """
+        with self._thread_lock:
+            if position is None:
+                position = self.scanner_position
+            self._roi.set_index_cell_size(self._poi_diameter)
+            return self._roi.pois_within(position, self._poi_diameter if radius is None else radius)
+
+    def poi_at_position(self, position=None):
+        """
+        The POI a position is at, i.e. the closest POI within half the POI diameter.
+
+        @param float[3] position: Absolute position (x, y, z), the scanner position if None
+        @return str: POI name, None if the position is at no POI
+        """
+        name, _ = self.nearest_poi(position, self._poi_diameter / 2)
+        return name
+
+    @QtCore.Slot()
+    def merge_duplicate_pois(self, radius=None):
+        """
+        Merges POIs closer than radius into one. The brightest POI of each group (largest 'amplitude' property,
+        the first added one without amplitudes) is kept, the others are deleted.
+
+        @param float radius: Merge distance in m, the POI diameter if None
+        @return list: Names of the deleted POIs
+        """
+        with self._thread_lock:
+            self._roi.set_index_cell_size(self._poi_diameter)
+            names = self.poi_names
+            deleted = list()
+            for group in self._roi.duplicate_groups(self._poi_diameter if radius is None else radius):
+                group.sort(key=names.index)
+                amplitudes = [self._roi.get_poi_properties(name).get('amplitude', -np.inf) for name in group]
+                keep = group[int(np.argmax(amplitudes))]
+                deleted.extend(name for name in group if name != keep)
+            if self.active_poi in deleted:
+                self.active_poi = None
+            for name in deleted:
+                self._roi.delete_poi(name)
+                self.sigPoiUpdated.emit(name, '', np.zeros(3))
+            if deleted:
+                self.log.info('Merged {0:d} duplicate POIs'.format(len(deleted)))
+            return deleted
+
     def get_poi_anchor(self, name=None):
         """
         Returns the POI anchor position (excluding sample movement) of the specified POI or the
@@ -1063,6 +1216,27 @@ class PoiManagerLogic(LogicBase):
         return
 
     def save_roi(self):
+        """
+        Save the ROI with its POIs, history, scan image and POI properties to a single container file
+        (see qudi.logic.roi_container), or in the legacy text format if configured by roi_file_format.
+        Duplicate POIs are merged first if merge_duplicates_on_save is set.
+
+        @return str: path of the container file, None for the legacy text format
+        """
+        if self._merge_duplicates_on_save:
+            self.merge_duplicate_pois()
+        if self._roi_file_format == 'text':
+            self._save_roi_text()
+            return None
+        with self._thread_lock:
+            filename = '{0}_{1}_roi.npz'.format(datetime.now().strftime('%Y%m%d-%H%M-%S'),
+                                                self.roi_name.replace(' ', '_'))
+            path = os.path.join(self.module_default_data_dir, filename)
+            save_roi_container(path, self._roi.to_dict(), self.active_poi)
+            self.log.info('ROI saved to {0}'.format(path))
+        return path
+
+    def _save_roi_text(self):
         """
         Save all current absolute POI coordinates to a file.
         Save ROI history to a second file.
@@ -1120,8 +1294,25 @@ class PoiManagerLogic(LogicBase):
         return
 
     def load_roi(self, complete_path=None):
+        """
+        Replaces the current ROI with one from file, either a container (.npz) or the legacy text format.
+
+        @param str complete_path: container file or POI list (.dat) file
+        """
         if complete_path is None:
             return
+        if complete_path.endswith('.npz'):
+            try:
+                with RoiContainer(complete_path) as container:
+                    roi = RegionOfInterest.from_dict(container.to_dict())
+                    active_poi = container.active_poi
+            except (OSError, KeyError, ValueError):
+                self.log.exception('Unable to load ROI from file {0}'.format(complete_path))
+                return
+            if active_poi not in roi.poi_names:
+                active_poi = None if len(roi.poi_names) == 0 else roi.poi_names[0]
+            self._replace_roi(roi, active_poi)
+            return
         filepath, filename = os.path.split(complete_path)
 
         # Try to detect legacy file format
@@ -1197,22 +1388,27 @@ class PoiManagerLogic(LogicBase):
         except FileNotFoundError:
             roi_scan_image = None
 
-        # Reset current ROI and initialize new one from loaded data
+        roi = RegionOfInterest(name=roi_name,
+                               creation_time=roi_creation_time,
+                               history=roi_history,
+                               scan_image=roi_scan_image,
+                               scan_image_extent=scan_extent,
+                               poi_list=poi_list,
+                               poi_nametag=poi_nametag)
+        self._replace_roi(roi, None if len(poi_names) == 0 else poi_names[0])
+        return
+
+    def _replace_roi(self, roi, active_poi):
+        """ Reset current ROI and use a loaded one instead. """
         self.reset_roi()
-        self._roi = RegionOfInterest(name=roi_name,
-                                     creation_time=roi_creation_time,
-                                     history=roi_history,
-                                     scan_image=roi_scan_image,
-                                     scan_image_extent=scan_extent,
-                                     poi_list=poi_list,
-                                     poi_nametag=poi_nametag)
+        self._roi = roi
         self.sigRoiUpdated.emit({'name': self.roi_name,
                                  'poi_nametag': self.poi_nametag,
                                  'pois': self.poi_positions,
                                  'history': self.roi_pos_history,
                                  'scan_image': self.roi_scan_image,
                                  'scan_image_extent': self.roi_scan_image_extent})
-        self.set_active_poi(None if len(poi_names) == 0 else poi_names[0])
+        self.set_active_poi(active_poi)
         return
 
     @_roi.constructor
@@ -1234,97 +1430,58 @@ class PoiManagerLogic(LogicBase):
         return
 
     def _spot_filter(self, scan):
-        pixel_num = len(scan)
-        x_range = self.roi_scan_image_extent[0]
-        pixel_size = (x_range[1] - x_range[0]) / pixel_num
-        spot_size = self._poi_diameter
-        arr_size = int(spot_size / pixel_size)
-        return arr_size
-
-    def _is_spot_shape(self, local_arr):
-        unspot_e = 0
-        ensem_e = 0
-        len_arr = len(local_arr)
-        mid_f = int(0.5 * len_arr)
-        hm_local_arr = local_arr[mid_f].mean()
-        vm_local_arr = local_arr[:, mid_f].mean()
-        for i in range(0, len_arr):
-            if local_arr[i].mean() > hm_local_arr:
-                ensem_e += 1
-            if local_arr[:, i].mean() > vm_local_arr:
-                ensem_e += 1
-            if hm_local_arr > vm_local_arr * 1.2:
-                unspot_e += 1
-            if vm_local_arr > hm_local_arr * 1.2:
-                unspot_e += 1
-        if ensem_e > 4:
-            return False
-        elif unspot_e > 1:
-            return False
-        else:
-            return True
-
-    def _local_max(self, scan):
-        scan = np.asarray(scan, order="C")  # scan has to be a 2-D array
-        filter_size = self._spot_filter(scan)
-        scan_m = scan.mean()
-        mid_f = int(filter_size / 2)
-        xc = []
-        yc = []
-        for i in range(0, len(scan) - filter_size):
-            for j in range(0, len(scan[i]) - filter_size):
-                local_arr = scan[i:i + filter_size, j:j + filter_size]
-                local_arr = np.asarray(local_arr)
-                arr_threshold = scan_m * self._poi_threshold * 0.5
-                if scan[i + mid_f][j + mid_f] == local_arr.max() and self._is_spot_shape(
-                        local_arr) and local_arr.mean() > arr_threshold:
-                    xc.append(i + mid_f)
-                    yc.append(j + mid_f)
-        return xc, yc
-
-    def auto_catch_poi(self):
+        return spot_filter_size(len(scan), self.roi_scan_image_extent[0], self._poi_diameter)
+
+    def auto_catch_poi(self, min_amplitude=0, sigma_range=None, max_pois=None):
+        """ Adds a POI at every emitter candidate of the ROI scan image.
+
+        Candidates are found with qudi.logic.poi_detection.detect_spots and localised to sub-pixel precision with a
+        batched 2D Gaussian fit. Fitted centre, amplitude, width and background are stored as POI properties, POIs
+        are added brightest first.
+
+        @param float min_amplitude: Smallest fitted amplitude above background (image units) of a POI
+        @param tuple sigma_range: (min, max) fitted Gaussian width in m of a POI, no width filter if None
+        @param int max_pois: Add only the brightest max_pois candidates, all if None
+        """
         with self._thread_lock:
             scan_image = self.roi_scan_image
             x_range = self.roi_scan_image_extent[0]
             y_range = self.roi_scan_image_extent[1]
-            x_axis = np.arange(x_range[0], x_range[1], (x_range[1] - x_range[0]) / len(scan_image))
-            y_axis = np.arange(y_range[0], y_range[1], (y_range[1] - y_range[0]) / len(scan_image[0]))
-
-            scan_image_copy=np.copy(scan_image)
-            for i in range(0, len(scan_image)):
-                for j in range(0, len(scan_image[i])):
-                    scan_image[i][j] = int(scan_image[i][j])  # data here somehow needs to be reset, otherwise shit happens.
-
-            threshold = scan_image.mean() * self._poi_threshold
+            x_step = (x_range[1] - x_range[0]) / len(scan_image)
+            y_step = (y_range[1] - y_range[0]) / len(scan_image[0])
+            pixel_size = (x_step + y_step) / 2
+
+            filter_size = self._spot_filter(scan_image)
+            xc, yc = detect_spots(scan_image, filter_size, self._poi_threshold)
+            spots = localise_spots(scan_image, xc, yc, radius=max(filter_size, 2))
+            if sigma_range is not None:
+                sigma_range = (min(sigma_range) / pixel_size, max(sigma_range) / pixel_size)
+            order = rank_spots(spots, min_amplitude, sigma_range)
+            if max_pois is not None:
+                order = order[:int(max_pois)]
 
-            xc1, yc1 = self._local_max(scan_image)
-            xc2 = []
-            yc2 = []
-            for i in range(0, len(xc1)):
-                if scan_image[xc1[i], yc1[i]] > threshold:
-                    xc2.append(xc1[i])
-                    yc2.append(yc1[i])
-
-            pois = np.zeros((len(xc2), 3))
             z = self.scanner_position[2]
-            for i in range(0, len(pois)):
-                pois[i] = [x_axis[xc2[i]], y_axis[yc2[i]], z]
-                self.add_poi(pois[i])
-                print(self.poi_nametag)
-                if self.poi_nametag is None:
-                    time.sleep(0.1)
+            # Without a nametag, POIs are named by time, a common stamp plus index keeps the names unique.
+            stamp = datetime.now().strftime('poi_%Y%m%d%H%M%S%f')
+            added = 0
+            for rank, i in enumerate(order):
+                position = np.array([x_range[0] + spots['row'][i] * x_step, y_range[0] + spots['col'][i] * y_step, z])
+                properties = {'amplitude': float(spots['amplitude'][i]),
+                              'sigma': float(spots['sigma'][i] * pixel_size),
+                              'background': float(spots['background'][i]),
+                              'gaussian_fit': bool(spots['gaussian'][i]),
+                              'rank': rank}
+                name = None if self.poi_nametag is not None else '{0}_{1:d}'.format(stamp, rank)
+                # Candidates at an existing POI (e.g. from an earlier detection) are skipped
+                if self.add_poi(position, name=name, properties=properties, skip_duplicate=True) is not None:
+                    added += 1
+            self.log.info('Auto detection added {0:d} of {1:d} candidates as POIs'.format(added, len(xc)))
 
     def active_POI_Visible(self):
-        print("activePOIVisible")
-        print(self.active_poi)
-        if self.active_poi is not None:
-            poi_position=self.get_poi_position()
-            scanner_position=self._scanninglogic().scanner_position
-            err=np.sqrt((poi_position[0]-scanner_position["x"])**2 + (poi_position[1]-scanner_position["y"])**2 + (poi_position[2]-scanner_position["z"])**2 )
-            if err>10*1E-9:
-                return False
-            else:
-                return True
-        else:
+        """
+        Whether the scanner is at the active POI, i.e. the active POI is the closest POI within half the POI
+        diameter around the scanner position.
 
-            return False
\ No newline at end of file
+        @return bool: True if the scanner is at the active POI
+        """
+        return self.active_poi is not None and self.poi_at_position() == self.active_poi
\ No newline at end of file
@@ -24,6 +24,8 @@ If not, see <https://www.gnu.org/licenses/>.
 import numpy as np
 from PySide2 import QtCore
 import itertools
+import threading
+import time
 import copy as cp
 
 from qudi.core.module import LogicBase
@@ -67,6 +69,8 @@ class ScanningOptimizeLogic(LogicBase):
     sigOptimizeSettingsChanged = QtCore.Signal(dict)
 
     _sigNextSequenceStep = QtCore.Signal()
+    _sigStartOptimize = QtCore.Signal()
+    _sigStopOptimize = QtCore.Signal()
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -116,6 +120,8 @@ class ScanningOptimizeLogic(LogicBase):
         self._last_fits = list()
 
         self._sigNextSequenceStep.connect(self._next_sequence_step, QtCore.Qt.QueuedConnection)
+        self._sigStartOptimize.connect(self.start_optimize, QtCore.Qt.QueuedConnection)
+        self._sigStopOptimize.connect(self.stop_optimize, QtCore.Qt.QueuedConnection)
         self._scan_logic().sigScanStateChanged.connect(
             self._scan_state_changed, QtCore.Qt.QueuedConnection
         )
@@ -125,6 +131,8 @@ class ScanningOptimizeLogic(LogicBase):
         """
         self._scan_logic().sigScanStateChanged.disconnect(self._scan_state_changed)
         self._sigNextSequenceStep.disconnect()
+        self._sigStartOptimize.disconnect()
+        self._sigStopOptimize.disconnect()
         self.stop_optimize()
         return
 
@@ -336,6 +344,41 @@ class ScanningOptimizeLogic(LogicBase):
             self._sigNextSequenceStep.emit()
             return 0
 
+    def optimize_blocking(self, timeout=120, abort=None):
+        """ Runs one optimize sequence and waits for it to finish, for callers on threads other than the
+        logic thread (e.g. the refocus between the planes of a volume scan).
+
+        The optimization is stopped if it does not finish in time or abort is set.
+
+        @param float timeout: s to wait for the sequence
+        @param threading.Event abort: stops the optimization and returns None when set
+        @return dict: optimal position {axis: position}, None if the optimization did not finish
+        """
+        if QtCore.QThread.currentThread() == self.thread():
+            raise RuntimeError('optimize_blocking would deadlock when called from the optimize logic thread')
+        finished = threading.Event()
+
+        def state_changed(is_running, *args):
+            if not is_running:
+                finished.set()
+
+        self.sigOptimizeStateChanged.connect(state_changed, QtCore.Qt.DirectConnection)
+        try:
+            self._sigStartOptimize.emit()
+            deadline = time.monotonic() + timeout
+            while not finished.wait(0.1):
+                if abort is not None and abort.is_set():
+                    self.log.info('Optimization aborted')
+                elif time.monotonic() > deadline:
+                    self.log.warning('Optimization did not finish within {0} s'.format(timeout))
+                else:
+                    continue
+                self._sigStopOptimize.emit()
+                return None
+            return self.optimal_position
+        finally:
+            self.sigOptimizeStateChanged.disconnect(state_changed)
+
     def _next_sequence_step(self):
         with self._thread_lock:
 
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""
+This module extends the qudi scanning probe logic with line by line live updates of running scans.
+
+Copyright (c) 2021, the qudi developers. See the AUTHORS.md file at the top-level directory of this
+distribution and on <https://github.com/Ulm-IQO/qudi-iqo-modules/>
+
+This file is part of qudi.
+
+Qudi is free software: you can redistribute it and/or modify it under the terms of
+the GNU Lesser General Public License as published by the Free Software Foundation,
+either version 3 of the License, or (at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful, but WITHOUT ANY WARRANTY;
+without even the implied warranty of MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.
+See the GNU Lesser General Public License for more details.
+
+You should have received a copy of the GNU Lesser General Public License along with qudi.
+If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from qudi.util.mutex import Mutex
+from qudi.logic.scanning_probe_logic import ScanningProbeLogic as _ScanningProbeLogic
+
+
+class ScanningProbeLogic(_ScanningProbeLogic):
+    """
+    Scanning probe logic that passes on the lines a scanner reports as updated during a scan, so displays
+    only redraw those lines.
+
+    Example config for copy-paste:
+
+    scanning_probe_logic:
+        module.Class: 'purdue_scanning_probe_logic.ScanningProbeLogic'
+        options:
+            max_history_length: 20
+            max_scan_update_interval: 2
+            position_update_interval: 1
+        connect:
+            scanner: scanner_dummy
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._scan_update_lock = Mutex()
+        self._scan_id = 0
+
+    def start_scan(self, *args, **kwargs):
+        # Every started scan gets a new id, so callers of get_scan_update know when to redraw in full.
+        with self._scan_update_lock:
+            self._scan_id += 1
+            return super().start_scan(*args, **kwargs)
+
+    def get_scan_update(self, scan_id=None, since_line=0):
+        """ Lines of the current scan updated since since_line, without copying the image.
+
+        @param int scan_id: id of the scan the caller has lines of, since_line is ignored for any other scan
+        @param int since_line: number of line updates the caller already has
+        @return (int, list, dict): id of the current scan, line index of every new update,
+                                   {channel: read-only view of the scan image}.
+                                   None if the scanner does not report line updates.
+        """
+        scanner = self._scanner()
+        if not hasattr(scanner, 'get_scan_update'):
+            return None
+        with self._scan_update_lock:
+            if scan_id != self._scan_id:
+                since_line = 0
+            lines, line_data = scanner.get_scan_update(since_line)
+            return self._scan_id, lines, line_data
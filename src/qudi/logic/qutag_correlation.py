@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Software g2 / cross-correlation of quTAG time tags.
+
+Works on sorted int64 timestamps in units of the quTAG timebase, e.g. a recording opened with
+qudi.logic.qutag_stream.TagStreamReader. Any channel pair and bin width can be correlated after the
+measurement, memory use is bounded by block_size and max_pairs independent of the stream length.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import time
+import numpy as np
+
+
+def correlation_histogram(start_tags, stop_tags, bin_width, bin_count, max_pairs=20_000_000):
+    """ Histogram of stop - start time differences within +-bin_width*bin_count/2.
+
+    Both tag arrays have to be sorted. The window of every start tag is found with searchsorted and all
+    pairs are expanded at once, start tags are processed in slices so that at most max_pairs differences
+    exist at a time.
+
+    Returns:
+        np.ndarray: int64 histogram of length bin_count, bin i covers
+                    [-bin_width*bin_count/2 + i*bin_width, ... + bin_width)
+    """
+    histogram = np.zeros(bin_count, dtype=np.int64)
+    if len(start_tags) == 0 or len(stop_tags) == 0:
+        return histogram
+    half_window = bin_width*bin_count/2
+    first = np.searchsorted(stop_tags, start_tags - half_window, side='left')
+    last = np.searchsorted(stop_tags, start_tags + half_window, side='left')
+    pairs = last - first
+    cumulative = np.cumsum(pairs)
+
+    begin = 0
+    while begin < len(start_tags):
+        done = cumulative[begin - 1] if begin > 0 else 0
+        end = int(np.searchsorted(cumulative, done + max_pairs, side='right'))
+        end = max(end, begin + 1)
+        slice_pairs = pairs[begin:end]
+        total = int(slice_pairs.sum())
+        if total > 0:
+            start_index = np.repeat(np.arange(begin, end), slice_pairs)
+            pair_offsets = np.arange(total) - np.repeat(np.cumsum(slice_pairs) - slice_pairs, slice_pairs)
+            stop_index = np.repeat(first[begin:end], slice_pairs) + pair_offsets
+            differences = stop_tags[stop_index] - start_tags[start_index]
+            bins = np.floor((differences + half_window)/bin_width).astype(np.int64)
+            bins = bins[(bins >= 0) & (bins < bin_count)]
+            histogram += np.bincount(bins, minlength=bin_count)
+        begin = end
+    return histogram
+
+
+class TagCorrelator:
+    """ Accumulates g2 histograms for several channel pairs over consecutive blocks of a tag stream.
+
+    Tags of the previous block that are closer than half a window to its end are carried over, so pairs
+    straddling a block border are counted exactly once.
+
+    @param list channel_pairs: [(start channel, stop channel), ...]
+    @param float bin_width: in units of the timebase
+    @param int bin_count: number of bins, centred on zero delay
+    """
+
+    def __init__(self, channel_pairs, bin_width, bin_count, max_pairs=20_000_000):
+        self.channel_pairs = [tuple(pair) for pair in channel_pairs]
+        self.bin_width = bin_width
+        self.bin_count = int(bin_count)
+        self.max_pairs = max_pairs
+        self.histograms = {pair: np.zeros(self.bin_count, dtype=np.int64) for pair in self.channel_pairs}
+        channels = {chan for pair in self.channel_pairs for chan in pair}
+        self.singles = {chan: 0 for chan in channels}
+        self._tails = {chan: np.empty(0, dtype=np.int64) for chan in channels}
+        self.first_tag = None
+        self.last_tag = None
+
+    @property
+    def half_window(self):
+        return self.bin_width*self.bin_count/2
+
+    @property
+    def tau(self):
+        """ Bin centres in units of the timebase.
+        """
+        return (np.arange(self.bin_count) + 0.5)*self.bin_width - self.half_window
+
+    def add_block(self, timestamps, channels):
+        if len(timestamps) == 0:
+            return
+        timestamps = np.asarray(timestamps)
+        channels = np.asarray(channels)
+        if self.first_tag is None:
+            self.first_tag = int(timestamps[0])
+        self.last_tag = int(timestamps[-1])
+
+        new_tags = {}
+        for chan in self.singles:
+            new_tags[chan] = np.asarray(timestamps[channels == chan], dtype=np.int64)
+            self.singles[chan] += new_tags[chan].size
+
+        for pair in self.channel_pairs:
+            start_chan, stop_chan = pair
+            # new starts against old and new stops, then old starts against new stops
+            stops = np.concatenate((self._tails[stop_chan], new_tags[stop_chan]))
+            self.histograms[pair] += correlation_histogram(new_tags[start_chan], stops, self.bin_width,
+                                                           self.bin_count, self.max_pairs)
+            self.histograms[pair] += correlation_histogram(self._tails[start_chan], new_tags[stop_chan],
+                                                           self.bin_width, self.bin_count, self.max_pairs)
+
+        border = self.last_tag - self.half_window
+        for chan in self._tails:
+            tags = np.concatenate((self._tails[chan], new_tags[chan]))
+            self._tails[chan] = tags[tags >= border]
+
+    def g2(self, pair):
+        """ Histogram of pair normalised to uncorrelated (Poissonian) coincidences.
+        """
+        histogram = self.histograms[tuple(pair)]
+        if self.first_tag is None or self.last_tag == self.first_tag:
+            return np.zeros(self.bin_count)
+        duration = self.last_tag - self.first_tag
+        expected = self.singles[pair[0]]*self.singles[pair[1]]*self.bin_width/duration
+        if expected == 0:
+            return np.zeros(self.bin_count)
+        return histogram/expected
+
+
+def correlate_stream(reader, channel_pairs, bin_width, bin_count, block_size=10_000_000):
+    """ g2 of every channel pair of a recorded TagStreamReader stream.
+
+    Args:
+        reader (TagStreamReader): recorded stream
+        channel_pairs (list): [(start channel, stop channel), ...]
+        bin_width (float): bin width in s
+        bin_count (int): number of bins centred on zero delay
+        block_size (int): tags read from disk at a time
+    Returns:
+        tuple: (np.ndarray tau in s, {pair: np.ndarray g2})
+    """
+    correlator = TagCorrelator(channel_pairs, bin_width/reader.timebase, bin_count)
+    for timestamps, channels in reader.iter_blocks(block_size):
+        correlator.add_block(timestamps, channels)
+    return correlator.tau*reader.timebase, {pair: correlator.g2(pair) for pair in correlator.channel_pairs}
+
+
+def synthetic_tags(rate, duration, timebase=1e-12, dead_time=0, channels=(1, 2), seed=None):
+    """ Time tags of an HBT setup, photons are split 50:50 onto the two channels.
+
+    With dead_time=0 the source is Poissonian (g2(0)=1). A dead time after every emission gives an
+    antibunched source with g2(0)=0 and a recovery time of about dead_time.
+
+    Returns:
+        tuple: (np.ndarray int64 timestamps, np.ndarray uint8 channels), sorted
+    """
+    rng = np.random.default_rng(seed)
+    mean_interval = 1/rate
+    count = int(rate*duration)
+    intervals = dead_time + rng.exponential(max(mean_interval - dead_time, 0), count)
+    timestamps = np.cumsum(intervals/timebase).astype(np.int64)
+    detector = rng.integers(0, 2, count)
+    tag_channels = np.where(detector == 0, channels[0], channels[1]).astype(np.uint8)
+    return timestamps, tag_channels
+
+
+def benchmark_correlator(rate=1e6, duration=10, bin_width=100e-12, bin_count=1024, timebase=1e-12,
+                         dead_time=5e-9, block_size=10_000_000):
+    """ Times the software correlator on synthetic Poisson and antibunched streams.
+
+    Returns:
+        dict: {'poisson'/'antibunched': {'tags': int, 'seconds': float, 'tags_per_second': float, 'g2_0': float}}
+    """
+    results = {}
+    for name, source_dead_time in (('poisson', 0), ('antibunched', dead_time)):
+        timestamps, tag_channels = synthetic_tags(rate, duration, timebase, source_dead_time, seed=0)
+        correlator = TagCorrelator([(1, 2)], bin_width/timebase, bin_count)
+        start = time.perf_counter()
+        for first in range(0, len(timestamps), block_size):
+            correlator.add_block(timestamps[first:first + block_size], tag_channels[first:first + block_size])
+        elapsed = time.perf_counter() - start
+        g2 = correlator.g2((1, 2))
+        results[name] = {'tags': len(timestamps),
+                         'seconds': elapsed,
+                         'tags_per_second': len(timestamps)/elapsed if elapsed > 0 else np.inf,
+                         'g2_0': float(g2[bin_count//2 - 1:bin_count//2 + 1].mean())}
+    return results
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Live fitting of quTAG lifetime and g2 histograms on a worker thread.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import threading
+import numpy as np
+from scipy.optimize import curve_fit
+
+CONFIDENCE_SIGMA = 1.96  # 95 % confidence intervals from the fit covariance
+
+
+def lifetime_model(t, *params):
+    """ Sum of exponential decays starting at t=0 on a constant background.
+    params: amplitude_1, tau_1, amplitude_2, tau_2, ..., offset
+    """
+    result = np.full(np.shape(t), params[-1], dtype=np.float64)
+    for amplitude, tau in zip(params[0:-1:2], params[1:-1:2]):
+        result += amplitude*np.exp(-t/tau)
+    return result
+
+
+def antibunching_model(tau, norm, g2_0, t1, tau0):
+    """ Single emitter g2 with a dip to g2_0 at tau0 that recovers with time constant t1.
+    """
+    return norm*(1 - (1 - g2_0)*np.exp(-np.abs(tau - tau0)/t1))
+
+
+def _confidence(params, covariance):
+    with np.errstate(invalid='ignore'):
+        errors = CONFIDENCE_SIGMA*np.sqrt(np.diag(covariance))
+    return np.where(np.isfinite(errors), errors, np.inf)
+
+
+def fit_lifetime(time, counts, n_exponentials=1, p0=None):
+    """ Fits the decay after the histogram maximum.
+
+    Args:
+        time (np.ndarray): bin times in ns
+        counts (np.ndarray): histogram counts
+        n_exponentials (int): number of decay components
+        p0 (list): start parameters (warm start), estimated from the data if None
+    Returns:
+        dict: {'params', 'confidence', 'tau', 'tau_confidence', 'peak_time'}, taus in ns sorted ascending
+    """
+    time = np.asarray(time, dtype=np.float64)
+    counts = np.asarray(counts, dtype=np.float64)
+    peak = int(np.argmax(counts))
+    t = time[peak:] - time[peak]
+    y = counts[peak:]
+    if p0 is None:
+        offset = max(float(np.median(y[-max(len(y)//10, 1):])), 0)
+        span = t[-1] if t[-1] > 0 else 1
+        p0 = []
+        for i in range(n_exponentials):
+            p0 += [max(y[0] - offset, 0)/n_exponentials, span/(5*(i + 1)**2)]
+        p0 += [offset]
+    sigma = np.sqrt(np.maximum(y, 1))
+    lower = [0, 1e-9]*n_exponentials + [0]
+    params, covariance = curve_fit(lifetime_model, t, y, p0=p0, sigma=sigma, absolute_sigma=True,
+                                   bounds=(lower, np.inf), maxfev=2000)
+    confidence = _confidence(params, covariance)
+    order = np.argsort(params[1:-1:2])
+    return {'params': params,
+            'confidence': confidence,
+            'tau': params[1:-1:2][order],
+            'tau_confidence': confidence[1:-1:2][order],
+            'peak_time': time[peak]}
+
+
+def fit_antibunching(time, g2, p0=None):
+    """ Fits antibunching_model to a g2 curve.
+
+    Args:
+        time (np.ndarray): delays in ns
+        g2 (np.ndarray): g2 values
+        p0 (list): start parameters norm, g2_0, t1, tau0 (warm start), estimated from the data if None
+    Returns:
+        dict: {'params', 'confidence', 'g2_0', 'g2_0_confidence', 't1', 't1_confidence'}
+    """
+    time = np.asarray(time, dtype=np.float64)
+    g2 = np.asarray(g2, dtype=np.float64)
+    if p0 is None:
+        norm = float(np.median(np.concatenate((g2[:len(g2)//10 + 1], g2[-(len(g2)//10 + 1):]))))
+        dip = int(np.argmin(g2))
+        p0 = [norm if norm > 0 else 1, min(max(g2[dip]/norm if norm > 0 else 0, 0), 1),
+              (time[-1] - time[0])/20, time[dip]]
+    params, covariance = curve_fit(antibunching_model, time, g2, p0=p0,
+                                   bounds=([0, 0, 0, time[0]], [np.inf, np.inf, np.inf, time[-1]]), maxfev=2000)
+    confidence = _confidence(params, covariance)
+    return {'params': params,
+            'confidence': confidence,
+            'g2_0': params[1],
+            'g2_0_confidence': confidence[1],
+            't1': params[2],
+            't1_confidence': confidence[2]}
+
+
+class LiveHistogramFitter:
+    """ Refits the newest submitted histogram of each kind ("LIFETIME" or "G2") on a worker thread.
+
+    submit() never blocks, a histogram that arrives while the worker is busy replaces the queued one.
+    A histogram is only refitted once the raw events behind it grew by min_change (relative) since the last fit,
+    the fit uncertainty shrinks with the square root of the events. Each fit starts from the previous solution.
+
+    @param callable callback: called from the worker thread with (kind, result dict)
+    """
+
+    def __init__(self, callback, n_exponentials=1, min_change=0.02, log=None):
+        self._callback = callback
+        self.n_exponentials = n_exponentials
+        self.min_change = min_change
+        self._log = log
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = False
+        self._queued = {}
+        self._last_events = {}
+        self._last_params = {}
+        self._generation = 0 #Incremented by reset, results of fits started before are dropped
+        self._thread = threading.Thread(target=self._run, name='qutag_live_fit', daemon=True)
+        self._thread.start()
+
+    def submit(self, kind, time, counts, events=None):
+        """ Queues a histogram for fitting.
+
+        @param str kind: "LIFETIME" or "G2"
+        @param np.ndarray time: bin times in ns
+        @param np.ndarray counts: histogram, e.g. a normalised g2 curve
+        @param float events: raw events the histogram was built from, the summed counts if None
+        """
+        counts = np.array(counts, dtype=np.float64)
+        events = float(counts.sum() if events is None else events)
+        with self._lock:
+            self._queued[kind] = (np.array(time, dtype=np.float64), counts, events)
+        self._wake.set()
+
+    def reset(self, kind=None):
+        """ Forget previous solutions of kind (all kinds if None), e.g. after the histograms were cleared,
+        reconfigured or a new acquisition started. """
+        with self._lock:
+            self._generation += 1
+            for store in (self._queued, self._last_events, self._last_params):
+                if kind is None:
+                    store.clear()
+                else:
+                    store.pop(kind, None)
+
+    def stop(self):
+        self._stop = True
+        self._wake.set()
+        self._thread.join()
+
+    def _changed(self, kind, events):
+        """ True if enough new events arrived since the last fit, or the histogram was cleared in between. """
+        previous = self._last_events.get(kind)
+        if previous is None or events < previous:
+            return True
+        return events >= previous*(1 + self.min_change) and events > previous
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            if self._stop:
+                return
+            with self._lock:
+                jobs = self._queued
+                self._queued = {}
+                self._wake.clear()
+                generation = self._generation
+            for kind, (time, counts, events) in jobs.items():
+                if not self._changed(kind, events) or not np.any(counts):
+                    continue
+                try:
+                    if kind == 'LIFETIME':
+                        p0 = self._last_params.get(kind)
+                        if p0 is not None and len(p0) != 2*self.n_exponentials + 1:
+                            p0 = None
+                        result = fit_lifetime(time, counts, self.n_exponentials, p0)
+                    else:
+                        result = fit_antibunching(time, counts, self._last_params.get(kind))
+                except (RuntimeError, ValueError) as e:
+                    # Start from the data again next time instead of a solution that stopped converging.
+                    self._last_params.pop(kind, None)
+                    if self._log is not None:
+                        self._log.debug('Live {0} fit did not converge: {1}'.format(kind, e))
+                    continue
+                with self._lock:
+                    if generation != self._generation:
+                        # reset() was called during the fit, the result belongs to the previous data.
+                        break
+                    self._last_events[kind] = events
+                    self._last_params[kind] = result['params']
+                self._callback(kind, result)
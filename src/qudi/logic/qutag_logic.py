@@ -19,6 +19,7 @@ Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
 top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
 """
 
+import os
 import numpy as np
 import time
 from datetime import datetime
@@ -31,6 +32,9 @@ from qudi.core.module import LogicBase
 from qtpy import QtCore
 from qtpy import QtWidgets
 from qudi.util.datastorage import TextDataStorage
+from qudi.logic.qutag_stream import TagStreamWriter, TagStreamRecorder, TagStreamReader
+from qudi.logic.qutag_correlation import correlate_stream, synthetic_tags, benchmark_correlator
+from qudi.logic.qutag_fitting import LiveHistogramFitter
 # from qudi.gui.Lifetime.lifetime_gui import SaveDialog
 
 class QuTagLogic(LogicBase):
@@ -43,7 +47,20 @@ class QuTagLogic(LogicBase):
     lifetime_channels = ConfigOption(name="lifetime_channels", missing="error") #A list of channels to use for the lifetime measurements index 0 is the start channel index 1 - n are all the channels the lifetime is measured on.
     lifetime_delays = ConfigOption(name="lifetime_delays", missing="error") #ps, default value is 140 ps
     OPM = Connector(interface='OpmInterface')
+    stream_drain_interval = ConfigOption('stream_drain_interval', 100) #ms between reads of the quTAG timestamp buffer while recording the raw tag stream
+    _stream_owner = 'time tag stream recording' #Name the quTAG time tag buffer is reserved under while recording
     sigSaveStateChanged = QtCore.Signal(bool)
+    live_fit = ConfigOption('live_fit', True) #Refit the live lifetime/g2 histogram on a worker thread
+    lifetime_exponentials = ConfigOption('lifetime_exponentials', 1) #Number of decay components of the live lifetime fit
+    fit_min_change = ConfigOption('fit_min_change', 0.02) #Relative growth of the raw events behind a histogram below which a live refit is skipped
+    sigStreamRecordingChanged = QtCore.Signal(bool)
+    sigFitUpdated = QtCore.Signal(str, dict) #measurement type, fit result
+    auto_stop = ConfigOption('auto_stop', False) #End G2/lifetime acquisitions once the live fit reaches the target precision or auto_stop_max_time passed
+    auto_stop_g2_precision = ConfigOption('auto_stop_g2_precision', 0.05) #Target 95% confidence half width of the fitted g2(0)
+    auto_stop_lifetime_precision = ConfigOption('auto_stop_lifetime_precision', 0.02) #Target 95% confidence half width of every fitted lifetime, relative to the lifetime
+    auto_stop_max_time = ConfigOption('auto_stop_max_time', 600) #s, longest acquisition in auto stop mode
+    auto_stop_save = ConfigOption('auto_stop_save', False) #Save without the dialog when an acquisition is auto stopped
+    sigAutoStopped = QtCore.Signal(str) #reason, "precision" or "max time"
 
     measurement_type = None #Should be "G2" or "LIFETIME" for the measurement type in progress
 
@@ -65,6 +82,10 @@ class QuTagLogic(LogicBase):
         self._thread_lock = RecursiveMutex()
         self._filename = None
         self._notes = None
+        self._stream_recorder = None
+        self._live_fitter = None
+        self.fit_results = {}
+        self._auto_stop_reason = None
 
 
     def on_activate(self):
@@ -82,6 +103,14 @@ class QuTagLogic(LogicBase):
         self.counts = 0
         self.time=0
         self.isRunning = False
+        self.lifetime_snapshot = None
+        self.hbt_snapshot = None
+        self._hbt_rates = [0]*len(self.g2_channels)
+        self._hbt_rate_future = None
+        self.fit_results = {}
+        if self.live_fit:
+            self._live_fitter = LiveHistogramFitter(self._on_fit_result, self.lifetime_exponentials,
+                                                    self.fit_min_change, self.log)
 
         # Connect signals
         self.sigStart.connect(self.start_query_loop)
@@ -99,7 +128,11 @@ class QuTagLogic(LogicBase):
     def on_deactivate(self):
         """ Deactivate module.
         """
+        self.stop_stream_recording()
         self.stop_query_loop()
+        if self._live_fitter is not None:
+            self._live_fitter.stop()
+            self._live_fitter = None
         for i in range(5):
             time.sleep(self.queryInterval / 1000)
             QtCore.QCoreApplication.processEvents()
@@ -144,17 +177,109 @@ class QuTagLogic(LogicBase):
             return
         qi = self.queryInterval
         try:
+            events = None # raw histogram counts, the g2 curve is normalised and needs the HBT event count
             if self.measurement_type == "G2":
-                self.time, self.counts = self.get_G2()
+                self.hbt_snapshot = self.get_hbt_snapshot(max_age=0)
+                self.time = self.hbt_snapshot['time']
+                self.counts = self.hbt_snapshot['g2']
+                events = self.hbt_snapshot['event_count'][0]
             elif self.measurement_type == "LIFETIME":
-                self.time, self.counts = self.get_Lifetime()
+                self.lifetime_snapshot = self._qutag.get_lifetime_snapshot()
+                self.time = self.lifetime_snapshot['time']
+                self.counts = self.lifetime_snapshot['histograms'][self._qutag.lifetime_stop_channel]
+            if self._live_fitter is not None and self.measurement_type in ("G2", "LIFETIME"):
+                self._live_fitter.submit(self.measurement_type, self.time, self.counts, events)
         except:
             qi = 3000
             self.log.exception("Exception in status loop, throttling refresh rate.")
 
+        if self.auto_stop and self.isRunning and self._check_auto_stop():
+            self.sig_update_display.emit()
+            self._finish_auto_stop()
+            return
         self.queryTimer.start(qi)
         self.sig_update_display.emit()
 
+    def set_auto_stop(self, enabled, precision=None, max_time=None, save=None):
+        """ Configures the auto stop mode of G2 and lifetime acquisitions.
+        Args:
+            enabled (bool): end acquisitions automatically
+            precision (float): target 95% confidence half width, absolute for g2(0), relative for the lifetime of
+                               the current measurement type. Unchanged if None.
+            max_time (float): s, longest acquisition. Unchanged if None.
+            save (bool): save without the dialog after an auto stop. Unchanged if None.
+        """
+        self.auto_stop = bool(enabled)
+        if precision is not None:
+            if self.measurement_type == "LIFETIME":
+                self.auto_stop_lifetime_precision = precision
+            else:
+                self.auto_stop_g2_precision = precision
+        if max_time is not None:
+            self.auto_stop_max_time = max_time
+        if save is not None:
+            self.auto_stop_save = bool(save)
+
+    def get_auto_stop_precision(self):
+        """ Current precision of the live fit in the units of the auto stop target.
+        Returns:
+            float: g2(0) confidence half width (G2) or the largest relative lifetime confidence half width
+                   (LIFETIME), inf while no fit converged
+        """
+        result = self.fit_results.get(self.measurement_type)
+        if result is None:
+            return np.inf
+        if self.measurement_type == "G2":
+            return float(result['g2_0_confidence'])
+        if self.measurement_type == "LIFETIME":
+            tau = np.asarray(result['tau'])
+            if not np.all(tau > 0):
+                return np.inf
+            return float(np.max(np.asarray(result['tau_confidence'])/tau))
+        return np.inf
+
+    def _check_auto_stop(self):
+        """ Sets _auto_stop_reason and returns True once the acquisition should end. """
+        if self.measurement_type == "G2":
+            target = self.auto_stop_g2_precision
+        elif self.measurement_type == "LIFETIME":
+            target = self.auto_stop_lifetime_precision
+        else:
+            return False
+        if self.get_auto_stop_precision() <= target:
+            self._auto_stop_reason = "precision"
+        elif (datetime.now() - self.last_scan_start).total_seconds() >= self.auto_stop_max_time:
+            self._auto_stop_reason = "max time"
+        else:
+            return False
+        return True
+
+    def _finish_auto_stop(self):
+        reason = self._auto_stop_reason
+        self.log.info("{0} acquisition auto stopped ({1}) after {2:.1f} s, precision {3:.3g}".format(
+            self.measurement_type, reason, (datetime.now() - self.last_scan_start).total_seconds(),
+            self.get_auto_stop_precision()))
+        self.stop()
+        self.sigAutoStopped.emit(reason)
+        if self.auto_stop_save:
+            name = "auto_" + datetime.now().strftime("%Y%m%d-%H%M%S")
+            if self.measurement_type == "G2":
+                self.initiate_g2_save(filename=name, notes="auto stop: " + reason)
+            else:
+                self.initiate_lifetime_save(filename=name, notes="auto stop: " + reason)
+
+    def _on_fit_result(self, measurement_type, result):
+        """ Called from the fit worker thread, publishes tau or g2(0) with their 95% confidence intervals.
+        """
+        if measurement_type == "LIFETIME":
+            summary = {'tau': list(result['tau']), 'tau_confidence': list(result['tau_confidence'])}
+        else:
+            summary = {'g2_0': result['g2_0'], 'g2_0_confidence': result['g2_0_confidence'],
+                       't1': result['t1'], 't1_confidence': result['t1_confidence']}
+        summary['params'] = list(result['params'])
+        self.fit_results[measurement_type] = summary
+        self.sigFitUpdated.emit(measurement_type, summary)
+
     @QtCore.Slot(str, str)
     def _on_save_data_received(self, filename, notes):
         print("on save method triggered")
@@ -178,6 +303,33 @@ class QuTagLogic(LogicBase):
         """
         return self._qutag.getG2()
     
+    def get_hbt_snapshot(self, max_age=None):
+        """ Returns one consistent HBT status: g2 curve, event counts, integration time and the count rates of the
+        g2 channels. The rates come from the last finished background counter readout, so building a snapshot never
+        waits for a counter exposure.
+        Args:
+            max_age (float): s, snapshots younger than this are reused, one query tick if None
+        Returns:
+            dict: see Qutag.get_hbt_snapshot, plus 'rates' (list of count rates of the g2 channels)
+        """
+        if max_age is None:
+            max_age = self._snapshot_max_age
+        snapshot = dict(self._qutag.get_hbt_snapshot(max_age))
+        snapshot['rates'] = self._poll_hbt_rates()
+        return snapshot
+
+    def _poll_hbt_rates(self):
+        """ Collects the finished background rate readout and starts the next one. """
+        future = self._hbt_rate_future
+        if future is None or future.done():
+            if future is not None:
+                try:
+                    self._hbt_rates = future.result()
+                except Exception:
+                    self.log.exception("Count rate readout of the g2 channels failed")
+            self._hbt_rate_future = self._qutag.get_count_rates_async(self.g2_channels)
+        return list(self._hbt_rates)
+
     def get_Lifetime(self):
         """ Returns the Lifetime histogram from the Qutag.
         Args:
@@ -185,7 +337,12 @@ class QuTagLogic(LogicBase):
         Returns:
             list: [numpy list of bins, numpy list of counts in each bin]
         """
-        return self._qutag.getLifetime()
+        return self._qutag.getLifetime(self._snapshot_max_age)
+
+    @property
+    def _snapshot_max_age(self):
+        """ Lifetime snapshots younger than one query tick are reused instead of fetched again. """
+        return self.queryInterval/1000
         
     def start(self, measurement_type):
         """ Emits signal to start query loop if not already running.
@@ -202,8 +359,13 @@ class QuTagLogic(LogicBase):
             self.sigStart.emit()
             self.isRunning = True
             self.measurement_type = measurement_type
+            # A fit of the previous acquisition must not count towards the auto stop precision of this one.
+            self.fit_results.pop(measurement_type, None)
+            if self._live_fitter is not None:
+                self._live_fitter.reset(measurement_type)
             self.log.info(str(measurement_type) + " Acquisition Started")
             self.last_scan_start=datetime.now()
+            self._auto_stop_reason = None
         else:
             pass
 
@@ -222,6 +384,7 @@ class QuTagLogic(LogicBase):
         self.stop()
         self._qutag.resetG2()
         self._qutag.resetLFT()
+        self._reset_live_fit()
 
 
     def updateConfig(self, histWidth, binNum):
@@ -237,6 +400,11 @@ class QuTagLogic(LogicBase):
         elif self.measurement_type == "LIFETIME":
             self.updateLifetimeConfig(histWidth, binNum)
 
+    def _reset_live_fit(self):
+        self.fit_results = {}
+        if self._live_fitter is not None:
+            self._live_fitter.reset()
+
     def updateG2Config(self, histWidth, binNum):
         """ Update the configuration for the G2 measurement.
         Args:
@@ -248,6 +416,7 @@ class QuTagLogic(LogicBase):
         if not self.isRunning:
             self.log.info("G2 Measurement configured with a histogram width of: " + str(histWidth) + "ns and " + str(binNum) + "Bins")
             self._qutag.configG2(histWidth, binNum,self.g2_channels)
+            self._reset_live_fit()
         else:
             self.log.warning("Can't set G2 Parameters during active measurement")
 
@@ -262,6 +431,7 @@ class QuTagLogic(LogicBase):
         if not self.isRunning:
             self.log.info("Lifetime Measurement Configured with a Histogram Width of: " + str(histWidth) + "ns and " + str(binNum) + "Bins")
             self._qutag.configLifetime(histWidth, binNum, self.lifetime_channels, self.lifetime_delays)
+            self._reset_live_fit()
         else:
             self.log.warning("Can't set Lifetime Parameters during active measurement")
 
@@ -272,7 +442,7 @@ class QuTagLogic(LogicBase):
         Returns:
             double: Integration time in seconds.
         """
-        return self._qutag.getHBTIntegrationTime()
+        return self.get_hbt_snapshot()['integration_time']
     
     def getLFTIntegrationTime(self):
         """ Returns the integration time for the Lifetime measurement.
@@ -281,7 +451,7 @@ class QuTagLogic(LogicBase):
         Returns:
             double: Integration time in seconds.
         """
-        return self._qutag.getLFTExposureTime()
+        return self._qutag.getLFTExposureTime(self._snapshot_max_age)
     
     def getLFTStartEvents(self):
         """ Returns the number of start events for the current lifetime histogram. 
@@ -291,7 +461,7 @@ class QuTagLogic(LogicBase):
         Returns:
             int: Number of times the start channel was triggered.
         """
-        return self._qutag.getLFTStartEvents()
+        return self._qutag.getLFTStartEvents(self._snapshot_max_age)
     
     def getLFTStopEvents(self):
         """ Returns the number of stop events for the current lifetime histogram. 
@@ -301,7 +471,7 @@ class QuTagLogic(LogicBase):
         Returns:
             int: Number of times the stop channel was triggered.
         """
-        return self._qutag.getLFTStopEvents()
+        return self._qutag.getLFTStopEvents(self._snapshot_max_age)
     
     def getHBTTotalCount(self):
         """ Returns the total number of times the channels contributing to the HBT histogram were triggered.
@@ -310,7 +480,7 @@ class QuTagLogic(LogicBase):
         Returns:
             int: Total number of counts for both channels.
         """
-        return self._qutag.getHBTTotalCount()
+        return self.get_hbt_snapshot()['event_count'][0]
     
     def getHBTRate(self):
         """ Returns the rate of counts for each channel contributing to the HBT histogram.
@@ -319,20 +489,137 @@ class QuTagLogic(LogicBase):
         Returns:
             list: List of rates for each detector channel, usually two channels for a standard G2 measurement.
         """
-        return self._qutag.getHBTRate()
+        return self.get_hbt_snapshot()['event_count'][2]
     
     def getHBTCount(self):
-         return self._qutag.getHBTCount()
+         return self.get_hbt_snapshot()['event_count'][1]
     
     def getHBTLiveInfo(self):
-        return self._qutag.getHBTEventCount()
+        return self.get_hbt_snapshot()['event_count']
     
-    def getLFTLiveInfo(self):
-        return self._qutag.getLFTStats()
+    def getLFTLiveInfo(self, channel=None):
+        """ Returns (too big, start events, stop events, exposure time) of a lifetime stop channel from the
+        snapshot of the current query tick, the first stop channel if channel is None.
+        """
+        snapshot = self.get_lifetime_snapshot()
+        if channel is None:
+            channel = self._qutag.lifetime_stop_channel
+        return snapshot['stats'][channel]
+
+    def get_lifetime_snapshot(self):
+        """ Returns the lifetime histograms and statistics of all stop channels, fetched at most once per query tick.
+        """
+        snapshot = self._qutag.get_lifetime_snapshot(self._snapshot_max_age)
+        self.lifetime_snapshot = snapshot
+        return snapshot
     
     def get_count_rates(self, channels):
         return self._qutag.get_count_rates(channels)
 
+    @property
+    def is_stream_recording(self):
+        return self._stream_recorder is not None and self._stream_recorder.is_running
+
+    def start_stream_recording(self, name=None):
+        """ Starts draining the raw time tag stream of the quTAG to disk in the background.
+        The recording can be opened with qudi.logic.qutag_stream.TagStreamReader for offline analysis.
+        Args:
+            name (str): appended to the timestamped directory name
+        Returns:
+            str: path of the stream directory, None if a recording is already running or a hardware timed scan
+                 reads the time tags
+        """
+        with self._thread_lock:
+            if self.is_stream_recording:
+                self.log.warning("Time tag stream recording already running")
+                return None
+            if not self._qutag.reserve_timestamps(self._stream_owner):
+                self.log.error("Can not record the time tag stream while the " + str(self._qutag.timestamp_owner) + " reads the time tags")
+                return None
+            dirname = datetime.now().strftime('%Y%m%d-%H%M-%S') + '_TagStream'
+            if name:
+                dirname += '_' + name
+            path = os.path.join(self.module_default_data_dir, dirname)
+            metadata = {'measurement type': self.measurement_type,
+                        'g2 channels': self.g2_channels,
+                        'lifetime channels': self.lifetime_channels,
+                        'notes': self._notes}
+            if self._poi.active_POI_Visible():
+                metadata["ROI"] = self._poi.roi_name
+                metadata["POI"] = self._poi.active_poi
+            try:
+                writer = TagStreamWriter(path, self._qutag.timeBase, metadata)
+                self._stream_recorder = TagStreamRecorder(self._qutag, writer, self.stream_drain_interval/1000, self.log)
+                self._stream_recorder.start()
+            except Exception:
+                self._stream_recorder = None
+                self._qutag.release_timestamps(self._stream_owner)
+                raise
+            self.log.info("Recording time tag stream to: " + path)
+            self.sigStreamRecordingChanged.emit(True)
+            return path
+
+    def stop_stream_recording(self):
+        """ Stops the background tag stream recording after a final buffer drain.
+        """
+        with self._thread_lock:
+            if self._stream_recorder is None:
+                return
+            recorder = self._stream_recorder
+            self._stream_recorder = None
+            try:
+                recorder.stop()
+            finally:
+                self._qutag.release_timestamps(self._stream_owner)
+            self.log.info("Time tag stream recording stopped")
+            self.sigStreamRecordingChanged.emit(False)
+
+    def get_stream_g2(self, path, channel_pairs=None, histWidth=None, binNum=None):
+        """ Computes g2 in software from a recorded tag stream, for any channel pairs and binning.
+        Args:
+            path (str): stream directory written by start_stream_recording
+            channel_pairs (list): [(start channel, stop channel), ...], the configured g2_channels if None
+            histWidth (float): full width of the histogram in nanoseconds, histWidth of the logic if None
+            binNum (int): number of bins, binNum of the logic if None
+        Returns:
+            tuple: (numpy list of delays in ns, {pair: numpy list of g2 values})
+        """
+        ns=1e-9
+        if channel_pairs is None:
+            channel_pairs = [tuple(self.g2_channels)]
+        histWidth = self.histWidth if histWidth is None else histWidth
+        binNum = self.binNum if binNum is None else binNum
+        reader = TagStreamReader(path)
+        if reader.data_lost:
+            self.log.warning("Tag stream " + str(path) + " lost data during recording, g2 is computed from the remaining tags")
+        tau, g2 = correlate_stream(reader, channel_pairs, histWidth*ns/binNum, binNum)
+        return tau/ns, g2
+
+    def benchmark_g2(self, rate=1e6, duration=1, dead_time=5e-9):
+        """ Compares the software correlator with the DLL HBT path on synthetic Poisson and antibunched tags.
+        The DLL path feeds the tags through inputTimestamps, which only works if the DLL accepts simulated input.
+        Returns:
+            dict: timings and g2(0) per source, see qutag_correlation.benchmark_correlator
+        """
+        ns=1e-9
+        binWidth = self.histWidth*ns/self.binNum
+        results = benchmark_correlator(rate, duration, binWidth, self.binNum, self._qutag.timeBase, dead_time)
+        try:
+            for name, source_dead_time in (('poisson', 0), ('antibunched', dead_time)):
+                timestamps, channels = synthetic_tags(rate, duration, self._qutag.timeBase, source_dead_time,
+                                                      channels=self.g2_channels, seed=0)
+                self._qutag.resetG2()
+                start = time.perf_counter()
+                self._qutag.input_timestamps(timestamps, channels)
+                _, g2 = self._qutag.getG2()
+                results[name]['dll_seconds'] = time.perf_counter() - start
+                results[name]['dll_g2_0'] = float(g2[len(g2)//2])
+        except Exception:
+            self.log.exception("DLL correlation path not available for the benchmark")
+        for name, result in results.items():
+            self.log.info(name + " g2 benchmark: " + str(result))
+        return results
+
     def plot(self, data, title=None):
         if self.measurement_type == "G2":
             return self.plot_g2(data, title)
@@ -371,16 +658,16 @@ class QuTagLogic(LogicBase):
             self.initiate_lifetime_save()
 
     @QtCore.Slot() 
-    def initiate_g2_save(self):
+    def initiate_g2_save(self, filename=None, notes=None):
         time, counts = self.get_G2()
         data=np.vstack((time,counts))
-        self.save_g2(data)
+        self.save_g2(data, filename, notes)
 
     @QtCore.Slot() 
-    def initiate_lifetime_save(self):
+    def initiate_lifetime_save(self, filename=None, notes=None):
         time, counts = self.get_Lifetime()
         data=np.vstack((time,counts))
-        self.save_lifetime(data)
+        self.save_lifetime(data, filename, notes)
     
     def save(self, scan_data):
         """ Save the current scan data.
@@ -391,7 +678,7 @@ class QuTagLogic(LogicBase):
             self.save_lifetime(scan_data)
 
     
-    def save_lifetime(self, scan_data):
+    def save_lifetime(self, scan_data, filename=None, notes=None):
 
         # whatever changes i make to save needs to happen here
         print("Attempting to Save Lifetime")
@@ -405,13 +692,17 @@ class QuTagLogic(LogicBase):
             
             print("im here now")
             
-            # first you need to request the GUI to open the save dialog
-            self.sigRequestSaveDialog.emit()
-            print("i emitted to GUI")
-
-            # listen for results?
-            self._waiting = QtCore.QEventLoop()
-            self._waiting.exec_()
+            if filename is None:
+                # first you need to request the GUI to open the save dialog
+                self.sigRequestSaveDialog.emit()
+                print("i emitted to GUI")
+
+                # listen for results?
+                self._waiting = QtCore.QEventLoop()
+                self._waiting.exec_()
+            else:
+                self._filename = filename
+                self._notes = notes
 
             print("here is filename:", self._filename)
             print("here is notes:", self._notes)
@@ -429,9 +720,12 @@ class QuTagLogic(LogicBase):
                 print("2")
                 parameters["bin_count"] = self._qutag.getLFTBinCount()
                 print("3")
-                parameters["total exposure time"] = self._qutag.getLFTExposureTime() #Check to see how this retrieves the current dataset to make sure it is synced.
+                parameters["total exposure time"] = self.getLFTIntegrationTime() #Check to see how this retrieves the current dataset to make sure it is synced.
                 print("4")
                 parameters['measurement start'] = self.last_scan_start
+                if self._auto_stop_reason is not None:
+                    parameters['auto stop'] = self._auto_stop_reason
+                    parameters['fit precision'] = self.get_auto_stop_precision()
                 parameters["y-axis name"] = "Normalized Counts"
                 parameters["y-axis Units"] = "Arb. Units"
                 parameters["x-axis name"] = "Time"
@@ -464,7 +758,7 @@ class QuTagLogic(LogicBase):
                 self.sigSaveStateChanged.emit(False)
             return
 
-    def save_g2(self, scan_data):
+    def save_g2(self, scan_data, filename=None, notes=None):
         print("Attempting to Save G2")
         with self._thread_lock:
             if self.module_state() != 'idle':
@@ -476,13 +770,17 @@ class QuTagLogic(LogicBase):
 
             print("im here now")
             
-            # first you need to request the GUI to open the save dialog
-            self.sigRequestSaveDialog.emit()
-            print("i emitted to GUI")
-
-            # listen for results?
-            self._waiting = QtCore.QEventLoop()
-            self._waiting.exec_()
+            if filename is None:
+                # first you need to request the GUI to open the save dialog
+                self.sigRequestSaveDialog.emit()
+                print("i emitted to GUI")
+
+                # listen for results?
+                self._waiting = QtCore.QEventLoop()
+                self._waiting.exec_()
+            else:
+                self._filename = filename
+                self._notes = notes
 
             print("here is filename:", self._filename)
             print("here is notes:", self._notes)
@@ -499,6 +797,9 @@ class QuTagLogic(LogicBase):
                 parameters["bin_count"] = self._qutag.getHBTBinCount()
                 parameters["total events"] = self._qutag.getHBTTotalCount()
                 parameters['measurement start'] = self.last_scan_start
+                if self._auto_stop_reason is not None:
+                    parameters['auto stop'] = self._auto_stop_reason
+                    parameters['fit precision'] = self.get_auto_stop_precision()
                 parameters["y-axis name"] = "Normalized Counts"
                 parameters["y-axis Units"] = "Arb. Units"
                 parameters["x-axis name"] = "Time"
@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+"""
+Continuous recording of the raw quTAG time tag stream to disk.
+
+A stream is stored as a directory holding
+    header.json     timebase, start time and free metadata
+    timestamps.bin  int64 timestamps in units of the timebase, append only
+    channels.bin    uint8 channel number of every timestamp, append only
+    index.bin       one CHUNK_DTYPE record per drained buffer (offset, count, first/last timestamp, data lost)
+Both columns are raw little endian arrays and can be memory mapped with numpy, so recordings of any
+length can be analysed without loading them into RAM.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import os
+import json
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+CHUNK_DTYPE = np.dtype([('offset', '<i8'),
+                        ('count', '<i8'),
+                        ('first', '<i8'),
+                        ('last', '<i8'),
+                        ('data_lost', '<i1')])
+
+_HEADER_FILE = 'header.json'
+_TIMESTAMP_FILE = 'timestamps.bin'
+_CHANNEL_FILE = 'channels.bin'
+_INDEX_FILE = 'index.bin'
+
+
+class TagStreamWriter:
+    """ Appends drained quTAG buffers to a stream directory.
+    """
+
+    def __init__(self, path, timebase, metadata=None):
+        os.makedirs(path, exist_ok=False)
+        self.path = path
+        self.count = 0
+        self.data_lost = False
+        header = {'version': 1,
+                  'timebase': timebase,
+                  'start': datetime.now().isoformat(),
+                  'metadata': metadata if metadata is not None else {}}
+        with open(os.path.join(path, _HEADER_FILE), 'w') as file:
+            json.dump(header, file, indent=2, default=str)
+        self._timestamp_file = open(os.path.join(path, _TIMESTAMP_FILE), 'ab')
+        self._channel_file = open(os.path.join(path, _CHANNEL_FILE), 'ab')
+        self._index_file = open(os.path.join(path, _INDEX_FILE), 'ab')
+
+    def append(self, timestamps, channels, data_lost=False):
+        """ Writes one chunk. The index record is written last, so a chunk only counts once it is complete.
+        """
+        count = len(timestamps)
+        if count == 0 and not data_lost:
+            return
+        np.asarray(timestamps, dtype='<i8').tofile(self._timestamp_file)
+        np.asarray(channels).view(np.uint8).tofile(self._channel_file)
+        self._timestamp_file.flush()
+        self._channel_file.flush()
+        record = np.array([(self.count, count,
+                            timestamps[0] if count else 0,
+                            timestamps[-1] if count else 0,
+                            bool(data_lost))], dtype=CHUNK_DTYPE)
+        record.tofile(self._index_file)
+        self._index_file.flush()
+        self.count += count
+        self.data_lost = self.data_lost or bool(data_lost)
+
+    def close(self):
+        for file in (self._timestamp_file, self._channel_file, self._index_file):
+            file.close()
+
+
+class TagStreamReader:
+    """ Memory mapped read access to a recorded stream.
+
+    Only chunks listed in the index are exposed, a trailing chunk cut off by a crash is ignored.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        with open(os.path.join(path, _HEADER_FILE), 'r') as file:
+            self.header = json.load(file)
+        self.timebase = self.header['timebase']
+        self.metadata = self.header['metadata']
+        index = np.fromfile(os.path.join(path, _INDEX_FILE), dtype=CHUNK_DTYPE)
+        self.index = index
+        self.count = int(index['offset'][-1] + index['count'][-1]) if index.size else 0
+        self.data_lost = bool(index['data_lost'].any()) if index.size else False
+        if self.count > 0:
+            self.timestamps = np.memmap(os.path.join(path, _TIMESTAMP_FILE), dtype='<i8', mode='r',
+                                        shape=(self.count,))
+            self.channels = np.memmap(os.path.join(path, _CHANNEL_FILE), dtype=np.uint8, mode='r',
+                                      shape=(self.count,))
+        else:
+            self.timestamps = np.empty(0, dtype=np.int64)
+            self.channels = np.empty(0, dtype=np.uint8)
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def duration(self):
+        """ Time between the first and the last tag in s.
+        """
+        if self.count == 0:
+            return 0
+        return (self.timestamps[-1] - self.timestamps[0])*self.timebase
+
+    def iter_blocks(self, block_size=10_000_000):
+        """ Yields (timestamps, channels) memory mapped slices of at most block_size tags.
+        """
+        for start in range(0, self.count, block_size):
+            stop = min(start + block_size, self.count)
+            yield self.timestamps[start:stop], self.channels[start:stop]
+
+    def time_slice(self, start, stop):
+        """ Returns (timestamps, channels) of all tags in [start, stop), times in units of the timebase.
+        """
+        first, last = np.searchsorted(self.timestamps, [start, stop], side='left')
+        return self.timestamps[first:last], self.channels[first:last]
+
+
+class TagStreamRecorder:
+    """ Background thread that drains the quTAG timestamp buffer into a TagStreamWriter.
+
+    @param qutag: Qutag hardware module, read through Qutag.read_timestamps
+    @param TagStreamWriter writer: destination of the stream
+    @param float drain_interval: s between buffer reads, has to be short enough that the 1M tag
+                                 buffer of the quTAG does not overflow at the expected count rate
+    """
+
+    def __init__(self, qutag, writer, drain_interval=0.1, log=None):
+        self._qutag = qutag
+        self._writer = writer
+        self._drain_interval = drain_interval
+        self._log = log
+        self._stop_event = threading.Event()
+        self._thread = None
+        self.error = None
+
+    @property
+    def is_running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        # Tags that piled up before the recording started are not part of it.
+        self._qutag.read_timestamps()
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run, name='qutag_stream_recorder', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops the thread after one last drain and closes the writer.
+        """
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._writer.close()
+
+    def _run(self):
+        try:
+            while True:
+                next_drain = time.perf_counter() + self._drain_interval
+                timestamps, channels, valid, data_lost = self._qutag.read_timestamps()
+                self._writer.append(timestamps[:valid], channels[:valid], data_lost)
+                if self._stop_event.is_set():
+                    break
+                self._stop_event.wait(max(next_drain - time.perf_counter(), 0))
+        except Exception as e:
+            self.error = e
+            if self._log is not None:
+                self._log.exception('Time tag stream recording failed')
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""
+Single file storage of a region of interest (ROI): POIs, position history, scan image, extents and per-POI
+properties in one numpy .npz container.
+
+The container holds the members
+    header          JSON: format version, ROI name, POI name tag, creation time, scan image extent, active POI
+    poi_names       (n,) str
+    poi_anchors     (n, 3) float, POI positions relative to the initial ROI origin in m
+    poi_properties  JSON: {name: properties} of the POIs with properties
+    history         (k, 4) float, time in s and x, y, z ROI origin
+    scan_image      2D scan image, only present if the ROI has one
+
+Members are only read when accessed, so opening a container for its POIs never reads the scan image.
+
+Qudi is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+Qudi is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with Qudi. If not, see <http://www.gnu.org/licenses/>.
+
+Copyright (c) the Qudi Developers. See the COPYRIGHT.txt file at the
+top-level directory of this distribution and at <https://github.com/Ulm-IQO/qudi/>
+"""
+
+import json
+from datetime import datetime
+
+import numpy as np
+
+from qudi.logic.atomic_write import atomic_write
+
+ROI_CONTAINER_VERSION = 1
+
+
+def _to_json(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('Object of type {0} is not JSON serializable'.format(type(value).__name__))
+
+
+def save_roi_container(path, roi_dict, active_poi=None):
+    """ Writes a ROI to a container file, see the module docstring.
+
+    @param str path: file path, should end with .npz
+    @param dict roi_dict: ROI as returned by RegionOfInterest.to_dict
+    @param str active_poi: active POI stored with the ROI
+    """
+    pois = roi_dict['pois']
+    header = {'version': ROI_CONTAINER_VERSION,
+              'name': roi_dict['name'],
+              'poi_nametag': roi_dict['poi_nametag'],
+              'creation_time': roi_dict['creation_time'],
+              'scan_image_extent': roi_dict['scan_image_extent'],
+              'active_poi': active_poi,
+              'saved': datetime.now().isoformat()}
+    members = {'header': np.array(json.dumps(header, default=_to_json)),
+               'poi_names': np.array([poi['name'] for poi in pois], dtype=str),
+               'poi_anchors': np.array([poi['position'] for poi in pois], dtype=float).reshape(-1, 3),
+               'poi_properties': np.array(json.dumps({poi['name']: poi['properties'] for poi in pois
+                                                      if poi.get('properties')}, default=_to_json)),
+               'history': np.asarray(roi_dict['pos_history'], dtype=float).reshape(-1, 4)}
+    if roi_dict['scan_image'] is not None:
+        members['scan_image'] = np.asarray(roi_dict['scan_image'])
+    atomic_write(path, lambda file: np.savez(file, **members), binary=True)
+
+
+class RoiContainer:
+    """ Read access to a ROI container file.
+
+    POI positions and properties are looked up by name through a table built on opening, the scan image is read on
+    first access. Use as context manager or call close() to release the file.
+
+    @param str path: container file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = np.load(path, allow_pickle=False)
+        try:
+            header = json.loads(str(self._file['header']))
+            if header.get('version', 0) > ROI_CONTAINER_VERSION:
+                raise ValueError('ROI container {0} has version {1}, newest readable version is {2}'
+                                 ''.format(path, header.get('version'), ROI_CONTAINER_VERSION))
+            self.name = header.get('name')
+            self.poi_nametag = header.get('poi_nametag')
+            self.creation_time = header.get('creation_time')
+            self.active_poi = header.get('active_poi')
+            extent = header.get('scan_image_extent')
+            self.scan_image_extent = None if extent is None else tuple(tuple(axis) for axis in extent)
+            self.poi_names = [str(name) for name in self._file['poi_names']]
+            self.poi_anchors = self._file['poi_anchors']
+            self.history = self._file['history']
+            self._properties = json.loads(str(self._file['poi_properties']))
+        except Exception:
+            self._file.close()
+            raise
+        self._rows = {name: row for row, name in enumerate(self.poi_names)}
+        self._scan_image = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def __len__(self):
+        return len(self.poi_names)
+
+    def __contains__(self, name):
+        return name in self._rows
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def origin(self):
+        return self.history[-1, 1:]
+
+    @property
+    def has_scan_image(self):
+        return 'scan_image' in self._file.files
+
+    @property
+    def scan_image(self):
+        """ Scan image of the ROI, None if it has none. Read from the file on first access. """
+        if self._scan_image is None and self.has_scan_image:
+            self._scan_image = self._file['scan_image']
+        return self._scan_image
+
+    def get_poi_anchor(self, name):
+        return self.poi_anchors[self._rows[name]]
+
+    def get_poi_position(self, name):
+        return self.poi_anchors[self._rows[name]] + self.origin
+
+    def get_poi_properties(self, name):
+        if name not in self._rows:
+            raise KeyError('No POI with name "{0}" found in ROI container.'.format(name))
+        return dict(self._properties.get(name, {}))
+
+    def to_dict(self):
+        """ ROI in the representation of RegionOfInterest.to_dict, reads the scan image.
+        """
+        return {'name': self.name,
+                'poi_nametag': self.poi_nametag,
+                'creation_time': self.creation_time,
+                'pos_history': self.history,
+                'scan_image': self.scan_image,
+                'scan_image_extent': self.scan_image_extent,
+                'pois': [{'name': name, 'position': tuple(anchor), 'properties': self._properties.get(name)}
+                         for name, anchor in zip(self.poi_names, self.poi_anchors)]}
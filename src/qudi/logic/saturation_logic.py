@@ -113,8 +113,10 @@ class SaturationLogic(LogicBase):
             power_data = []
             count_data = []
             for i in range(self.num_to_average):
+                # The power meter is read while the counter exposure runs in the background.
+                count_future = self.get_counts_async()
                 power_data += [self.get_power()]
-                count_data += [self.get_counts()]
+                count_data += [count_future.result()]
             # print(count_data)
             power_data = np.array(power_data).T
             count_data = np.array(count_data).T
@@ -221,6 +223,8 @@ class SaturationLogic(LogicBase):
         return self._power_meter.get_process_value()
     def get_counts(self):
         return self._counter_logic.get_count_rates(self.counter_channels)
+    def get_counts_async(self):
+        return self._counter_logic.get_count_rates_async(self.counter_channels)
     def set_integration_time(self, dT):
         self._counter_logic.set_exposure_time(dT)
     def set_VA_position(self, position):
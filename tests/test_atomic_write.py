@@ -0,0 +1,41 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the replace-on-success file writes.
+"""
+
+import os
+
+import pytest
+
+from qudi.logic.atomic_write import atomic_write
+
+
+def test_writes_and_replaces(tmp_path):
+    path = str(tmp_path / 'state.json')
+    atomic_write(path, lambda file: file.write('first'))
+    atomic_write(path, lambda file: file.write('second'))
+    with open(path) as file:
+        assert file.read() == 'second'
+    assert os.listdir(tmp_path) == ['state.json']
+
+
+def test_binary(tmp_path):
+    path = str(tmp_path / 'data.bin')
+    atomic_write(path, lambda file: file.write(b'\x00\x01'), binary=True)
+    with open(path, 'rb') as file:
+        assert file.read() == b'\x00\x01'
+
+
+def test_failed_writer_keeps_the_previous_file(tmp_path):
+    path = str(tmp_path / 'state.json')
+    atomic_write(path, lambda file: file.write('complete'))
+
+    def failing_writer(file):
+        file.write('trunc')
+        raise RuntimeError('disk full')
+
+    with pytest.raises(RuntimeError):
+        atomic_write(path, failing_writer)
+    with open(path) as file:
+        assert file.read() == 'complete'
+    assert os.listdir(tmp_path) == ['state.json']
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the drift reference localisation and the polynomial drift model.
+"""
+
+import numpy as np
+import pytest
+
+from qudi.hardware.interfuse.drift_tracker import DriftTracker, locate_peak
+
+
+@pytest.mark.parametrize('centre', [0.3e-6, 0.512e-6, 0.77e-6])
+def test_locate_peak_is_exact_for_a_gaussian(centre):
+    positions = np.linspace(0, 1e-6, 21)
+    counts = 10 + 1000*np.exp(-(positions - centre)**2/(2*(0.1e-6)**2))
+    # The background shifts the log parabola slightly off the Gaussian
+    assert locate_peak(positions, counts) == pytest.approx(centre, abs=2e-9)
+    assert locate_peak(positions, counts - 10) == pytest.approx(centre, abs=1e-12)
+
+
+def test_locate_peak_rejects_lines_without_emitter():
+    positions = np.linspace(0, 1e-6, 21)
+    assert locate_peak(positions, np.random.default_rng(41).poisson(100, 21)) is None
+    edge = 10 + 1000*np.exp(-positions**2/(2*(0.1e-6)**2))
+    assert locate_peak(positions, edge) is None
+
+
+def test_constant_velocity():
+    tracker = DriftTracker(('x', 'y'), order=1)
+    assert tracker.predict(100) == {'x': 0.0, 'y': 0.0}
+    tracker.add(100, {'x': 1e-8, 'y': -2e-8})
+    # One sample gives a constant offset
+    assert tracker.predict(200) == pytest.approx({'x': 1e-8, 'y': -2e-8})
+    for t in (110, 120, 130):
+        tracker.add(t, {'x': 1e-8 + 1e-9*(t - 100), 'y': -2e-8, 'z': 5})
+    assert tracker.predict(150) == pytest.approx({'x': 6e-8, 'y': -2e-8}, abs=1e-15)
+    assert set(tracker.to_dict()['coefficients']) == {'x', 'y'}
+
+
+def test_history_limits_the_fit():
+    tracker = DriftTracker(('x',), order=1, history=3)
+    for t, x in ((0, 100.0), (10, 0.0), (20, 1.0), (30, 2.0)):
+        tracker.add(t, {'x': x})
+    assert tracker.predict(40)['x'] == pytest.approx(3.0)
+    assert len(tracker.samples) == 4
+
+
+def test_quadratic_model():
+    tracker = DriftTracker(('z',), order=2)
+    for t in range(5):
+        tracker.add(1000 + t, {'z': 2*t**2 - t})
+    assert tracker.predict(1006)['z'] == pytest.approx(2*36 - 6)
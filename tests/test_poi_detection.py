@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the vectorised emitter detection against the pixel by pixel reference search.
+"""
+
+import numpy as np
+import pytest
+
+from qudi.logic.poi_detection import (detect_spots, local_max_reference, spot_shape_mask,
+                                      _is_spot_shape_reference, synthetic_emitter_map, spot_filter_size)
+
+
+@pytest.mark.parametrize('shape, emitters, filter_size, threshold, seed', [
+    ((60, 80), 30, 7, 5, 0),
+    ((70, 50), 40, 5, 3, 1),
+    ((40, 40), 15, 8, 2, 2),
+    ((50, 65), 80, 3, 1.5, 3),
+])
+def test_matches_reference(shape, emitters, filter_size, threshold, seed):
+    image, _ = synthetic_emitter_map(shape, emitters, seed=seed)
+    rows, cols = detect_spots(image, filter_size, threshold)
+    ref_rows, ref_cols = local_max_reference(image, filter_size, threshold)
+    assert rows.size > 0
+    np.testing.assert_array_equal(rows, ref_rows)
+    np.testing.assert_array_equal(cols, ref_cols)
+
+
+def test_non_integer_image_matches_reference():
+    image, _ = synthetic_emitter_map((50, 50), 20, seed=4)
+    image = image*0.37 + 0.5
+    rows, cols = detect_spots(image, 6, 4)
+    ref_rows, ref_cols = local_max_reference(image, 6, 4)
+    np.testing.assert_array_equal(rows, ref_rows)
+    np.testing.assert_array_equal(cols, ref_cols)
+
+
+@pytest.mark.parametrize('size', [3, 4, 7])
+def test_shape_mask_matches_reference(size):
+    rng = np.random.default_rng(size)
+    windows = rng.integers(0, 20, (500, size, size)).astype(np.float64)
+    windows[:100, size//2, :] += 30  # bright centre rows, elongated windows
+    mask = spot_shape_mask(windows.mean(axis=2), windows.mean(axis=1), size//2)
+    expected = [_is_spot_shape_reference(window) for window in windows]
+    np.testing.assert_array_equal(mask, expected)
+
+
+def test_merge_keeps_brightest_of_touching_candidates():
+    image = np.zeros((30, 30))
+    image[10:12, 10:12] = [[100, 100], [100, 100]]
+    image[11, 11] = 120
+    image[20, 20] = 90
+    rows, cols = detect_spots(image, 5, 2)
+    assert rows.size == 2
+    merged_rows, merged_cols = detect_spots(image, 5, 2, merge=True)
+    np.testing.assert_array_equal(merged_rows, [11, 20])
+    np.testing.assert_array_equal(merged_cols, [11, 20])
+    flat = image.copy()
+    flat[11, 11] = 100
+    assert detect_spots(flat, 5, 2)[0].size == 5
+    assert detect_spots(flat, 5, 2, merge=True)[0].size == 2
+
+
+def test_image_smaller_than_filter():
+    rows, cols = detect_spots(np.ones((5, 5)), 5, 1)
+    assert rows.size == 0 and cols.size == 0
+    assert spot_filter_size(64, (0, 8.0), 0.75) == 6
@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the POI grid index against brute force distance computations.
+"""
+
+import numpy as np
+import pytest
+
+from qudi.logic.poi_index import PoiGridIndex
+
+
+def _random_pois(rng, count, extent=5e-6):
+    return {'poi{0:d}'.format(i): rng.uniform(0, extent, 3) for i in range(count)}
+
+
+def _brute_nearest(positions, position, max_distance=None):
+    names = list(positions)
+    distances = [np.linalg.norm(positions[name] - position) for name in names]
+    best = int(np.argmin(distances))
+    if max_distance is not None and distances[best] > max_distance:
+        return None
+    return names[best]
+
+
+def _brute_within(positions, position, radius):
+    found = [(name, np.linalg.norm(pos - position)) for name, pos in positions.items()]
+    return sorted(name for name, distance in found if distance <= radius)
+
+
+def _brute_clusters(positions, radius):
+    names = list(positions)
+    groups = {name: {name} for name in names}
+    for a in names:
+        for b in names:
+            if np.linalg.norm(positions[a] - positions[b]) <= radius and groups[a] is not groups[b]:
+                merged = groups[a] | groups[b]
+                for name in merged:
+                    groups[name] = merged
+    return sorted(sorted(group) for group in {id(g): g for g in groups.values()}.values() if len(group) > 1)
+
+
+# Cell sizes from much smaller to much larger than the POI spacing, the small ones take the all-POI fallback
+@pytest.mark.parametrize('cell_size', [1e-9, 100e-9, 500e-9, 10e-6])
+def test_queries_match_brute_force(cell_size):
+    rng = np.random.default_rng(11)
+    positions = _random_pois(rng, 300)
+    index = PoiGridIndex(cell_size)
+    index.rebuild(positions)
+    for position in rng.uniform(-1e-6, 6e-6, (50, 3)):
+        name, distance = index.nearest(position)
+        assert name == _brute_nearest(positions, position)
+        assert distance == pytest.approx(np.linalg.norm(positions[name] - position))
+        name, _ = index.nearest(position, max_distance=300e-9)
+        assert name == _brute_nearest(positions, position, 300e-9)
+        found = index.within(position, 400e-9)
+        assert sorted(name for name, _ in found) == _brute_within(positions, position, 400e-9)
+        assert [d for _, d in found] == sorted(d for _, d in found)
+
+
+@pytest.mark.parametrize('cell_size', [50e-9, 200e-9])
+def test_clusters_match_brute_force(cell_size):
+    rng = np.random.default_rng(12)
+    positions = _random_pois(rng, 150, extent=2e-6)
+    index = PoiGridIndex(cell_size)
+    index.rebuild(positions)
+    clusters = sorted(sorted(group) for group in index.clusters(150e-9))
+    assert clusters
+    assert clusters == _brute_clusters(positions, 150e-9)
+
+
+def test_updates():
+    rng = np.random.default_rng(13)
+    positions = _random_pois(rng, 100)
+    index = PoiGridIndex(200e-9)
+    index.rebuild(positions)
+    for name in list(positions)[:30]:
+        index.remove(name)
+        del positions[name]
+    for name in list(positions)[:20]:
+        positions[name] = rng.uniform(0, 5e-6, 3)
+        index.insert(name, positions[name])
+    index.rename('poi50', 'renamed')
+    positions['renamed'] = positions.pop('poi50')
+    assert len(index) == len(positions)
+    assert 'poi50' not in index and 'renamed' in index
+    for position in rng.uniform(0, 5e-6, (30, 3)):
+        assert index.nearest(position)[0] == _brute_nearest(positions, position)
+        assert sorted(name for name, _ in index.within(position, 500e-9)) == \
+               _brute_within(positions, position, 500e-9)
+
+
+def test_empty_index():
+    index = PoiGridIndex()
+    assert index.nearest(np.zeros(3)) == (None, np.inf)
+    assert index.within(np.zeros(3), 1) == []
+    assert index.clusters(1) == []
+    index.insert('a', np.zeros(3))
+    index.remove('a')
+    assert index.nearest(np.zeros(3)) == (None, np.inf)
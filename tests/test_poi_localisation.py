@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the batched sub-pixel localisation and the ranking of emitter candidates.
+"""
+
+import numpy as np
+
+from qudi.logic.poi_detection import localise_spots, rank_spots, synthetic_emitter_map, detect_spots
+
+
+def _gaussian_image(shape, centres, amplitudes, sigma, background):
+    rows = np.arange(shape[0])[:, np.newaxis]
+    cols = np.arange(shape[1])[np.newaxis, :]
+    image = np.full(shape, float(background))
+    for (r, c), amplitude in zip(centres, amplitudes):
+        image += amplitude*np.exp(-((rows - r)**2 + (cols - c)**2)/(2*sigma**2))
+    return image
+
+
+def test_noise_free_spots():
+    centres = np.array([[10.3, 12.6], [25.5, 8.2], [18.0, 30.9]])
+    amplitudes = np.array([500, 1000, 200])
+    image = _gaussian_image((40, 40), centres, amplitudes, 1.2, 20)
+    spots = localise_spots(image, np.round(centres[:, 0]), np.round(centres[:, 1]), radius=4)
+    assert spots['gaussian'].all()
+    np.testing.assert_allclose(spots['row'], centres[:, 0], atol=0.02)
+    np.testing.assert_allclose(spots['col'], centres[:, 1], atol=0.02)
+    np.testing.assert_allclose(spots['sigma'], 1.2, rtol=0.05)
+    np.testing.assert_allclose(spots['amplitude'], amplitudes, rtol=0.05)
+    np.testing.assert_allclose(spots['background'], 20, atol=1)
+
+
+def test_noisy_spots_are_closer_than_the_pixel_grid():
+    image, centres = synthetic_emitter_map((120, 120), 25, sigma=1.5, amplitude=300, background=5, seed=7)
+    rows, cols = detect_spots(image, 5, 3)
+    spots = localise_spots(image, rows, cols)
+    distances = np.hypot(spots['row'][:, np.newaxis] - centres[:, 0], spots['col'][:, np.newaxis] - centres[:, 1])
+    nearest = distances.min(axis=1)
+    pixel_error = np.hypot(rows[:, np.newaxis] - centres[:, 0], cols[:, np.newaxis] - centres[:, 1]).min(axis=1)
+    isolated = nearest < 1
+    assert isolated.sum() > 10
+    assert np.median(nearest[isolated]) < np.median(pixel_error[isolated])
+
+
+def test_single_pixel_falls_back_to_the_centroid():
+    image = np.zeros((15, 15))
+    image[7, 8] = 50
+    spots = localise_spots(image, [7], [7], radius=3)
+    assert not spots['gaussian'][0]
+    assert spots['row'][0] == 7 and spots['col'][0] == 8
+    assert spots['sigma'][0] == 0
+    assert spots['amplitude'][0] == 50
+
+
+def test_edge_candidates_stay_in_their_patch():
+    # The patch is padded with the edge pixels, so only the result range is checked at the border.
+    image = _gaussian_image((20, 20), [[0.4, 19.2]], [400], 1.0, 0)
+    spots = localise_spots(image, [0], [19], radius=3)
+    assert np.isfinite(spots['row']).all() and np.isfinite(spots['col']).all()
+    assert abs(spots['row'][0]) <= 3 and abs(spots['col'][0] - 19) <= 3
+
+
+def test_rank_spots():
+    spots = {'amplitude': np.array([10., 50., 30., 50., 5.]),
+             'sigma': np.array([1., 3., 1.5, 1.2, 1.])}
+    np.testing.assert_array_equal(rank_spots(spots), [1, 3, 2, 0, 4])
+    np.testing.assert_array_equal(rank_spots(spots, min_amplitude=10), [1, 3, 2, 0])
+    np.testing.assert_array_equal(rank_spots(spots, sigma_range=(2, 1)), [3, 2, 0, 4])
+    assert rank_spots(spots, min_amplitude=100).size == 0
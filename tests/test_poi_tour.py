@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the POI survey visit order against brute force tours.
+"""
+
+import itertools
+
+import numpy as np
+import pytest
+
+from qudi.logic.poi_tour import order_tour, tour_length
+
+
+def _nearest_neighbour(points, start):
+    tour, current, left = [], start, list(range(len(points)))
+    while left:
+        nearest = min(left, key=lambda i: np.linalg.norm(points[i] - current))
+        left.remove(nearest)
+        tour.append(nearest)
+        current = points[nearest]
+    return tour
+
+
+def test_tour_length():
+    positions = np.array([[0, 0, 0], [3, 4, 0], [3, 4, 2]], dtype=float)
+    assert tour_length(positions, [0, 1, 2]) == pytest.approx(7)
+    assert tour_length(positions, [2, 1, 0], start=[3, 4, 4]) == pytest.approx(9)
+    assert tour_length(positions, [0, 2], weights=(1, 1, 10)) == pytest.approx(np.sqrt(25 + 400))
+
+
+@pytest.mark.parametrize('count', [0, 1, 2, 60])
+def test_order_is_a_permutation(count):
+    positions = np.random.default_rng(count).uniform(0, 1e-5, (count, 3))
+    order = order_tour(positions)
+    np.testing.assert_array_equal(np.sort(order), np.arange(count))
+
+
+def test_points_on_a_line():
+    rng = np.random.default_rng(21)
+    x = rng.permutation(np.arange(20.0))
+    positions = np.stack((x, np.zeros(20), np.zeros(20)), axis=1)
+    order = order_tour(positions, start=[-1, 0, 0])
+    np.testing.assert_array_equal(x[order], np.arange(20.0))
+
+
+def test_no_segment_reversal_improves_the_tour():
+    rng = np.random.default_rng(22)
+    positions = rng.uniform(0, 1e-5, (40, 3))
+    start = np.zeros(3)
+    order = order_tour(positions, start)
+    length = tour_length(positions, order, start)
+    assert length <= tour_length(positions, _nearest_neighbour(positions, start), start) + 1e-18
+    for i, j in itertools.combinations(range(len(order) + 1), 2):
+        reversed_order = np.concatenate((order[:i], order[i:j][::-1], order[j:]))
+        assert tour_length(positions, reversed_order, start) >= length - 1e-18
+
+
+def test_small_tours_are_close_to_the_optimum():
+    # 2-opt ends in a local optimum, single tours may be a few 10 % longer than the best one
+    rng = np.random.default_rng(23)
+    ratios = []
+    for _ in range(10):
+        positions = rng.uniform(0, 1e-5, (7, 3))
+        start = rng.uniform(0, 1e-5, 3)
+        optimum = min(tour_length(positions, order, start) for order in itertools.permutations(range(7)))
+        ratios.append(tour_length(positions, order_tour(positions, start), start)/optimum)
+    assert max(ratios) <= 1.25
+    assert np.mean(ratios) <= 1.05
+
+
+def test_weights():
+    # A slow z axis: visit both POIs at z=0 before the ones at z=1, although they are further away in x
+    positions = np.array([[0, 0, 1], [10, 0, 0], [0, 1, 1], [10, 1, 0]], dtype=float)
+    order = order_tour(positions, start=[5, 0, 0], weights=(1, 1, 100))
+    assert set(order[:2]) == {1, 3}
+    assert tour_length(positions, order, [5, 0, 0], (1, 1, 100)) < \
+           tour_length(positions, [0, 2, 1, 3], [5, 0, 0], (1, 1, 100))
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the software g2 correlator against a brute force pair histogram.
+"""
+
+import numpy as np
+
+from qudi.logic.qutag_correlation import (correlation_histogram, TagCorrelator, correlate_stream,
+                                          synthetic_tags)
+from qudi.logic.qutag_stream import TagStreamWriter, TagStreamReader
+
+
+def _brute_force(start_tags, stop_tags, bin_width, bin_count):
+    half_window = bin_width*bin_count/2
+    differences = (stop_tags[None, :] - start_tags[:, None]).ravel()
+    bins = np.floor((differences + half_window)/bin_width).astype(np.int64)
+    return np.bincount(bins[(bins >= 0) & (bins < bin_count)], minlength=bin_count)
+
+
+def _tags(rng, size, stop):
+    return np.sort(rng.integers(0, stop, size)).astype(np.int64)
+
+
+def test_histogram_matches_brute_force():
+    rng = np.random.default_rng(1)
+    start_tags, stop_tags = _tags(rng, 400, 50000), _tags(rng, 500, 50000)
+    expected = _brute_force(start_tags, stop_tags, 37, 64)
+    np.testing.assert_array_equal(correlation_histogram(start_tags, stop_tags, 37, 64), expected)
+    # Slicing the start tags to bound the memory use does not change the result
+    np.testing.assert_array_equal(correlation_histogram(start_tags, stop_tags, 37, 64, max_pairs=7), expected)
+
+
+def test_histogram_without_tags():
+    empty = np.empty(0, dtype=np.int64)
+    np.testing.assert_array_equal(correlation_histogram(empty, np.arange(5), 1, 4), np.zeros(4))
+
+
+def test_blocks_count_border_pairs_once():
+    rng = np.random.default_rng(2)
+    timestamps = _tags(rng, 3000, 200000)
+    channels = rng.integers(1, 3, timestamps.size).astype(np.uint8)
+    pairs = [(1, 2), (2, 1)]
+
+    correlator = TagCorrelator(pairs, 50, 40)
+    for first in range(0, timestamps.size, 250):
+        correlator.add_block(timestamps[first:first + 250], channels[first:first + 250])
+
+    for start_chan, stop_chan in pairs:
+        expected = _brute_force(timestamps[channels == start_chan], timestamps[channels == stop_chan], 50, 40)
+        np.testing.assert_array_equal(correlator.histograms[(start_chan, stop_chan)], expected)
+    assert correlator.singles[1] + correlator.singles[2] == timestamps.size
+
+
+def test_g2_of_synthetic_sources():
+    bin_count = 200
+    for dead_time, expected_g2_0 in ((0, 1.0), (20e-9, 0.0)):
+        timestamps, channels = synthetic_tags(1e6, 2, timebase=1e-12, dead_time=dead_time, seed=3)
+        correlator = TagCorrelator([(1, 2)], 1e-9/1e-12, bin_count)
+        correlator.add_block(timestamps, channels)
+        g2 = correlator.g2((1, 2))
+        assert abs(g2[bin_count//2 - 2:bin_count//2 + 2].mean() - expected_g2_0) < 0.15
+        # Far from zero delay both sources are uncorrelated
+        assert abs(np.concatenate((g2[:20], g2[-20:])).mean() - 1) < 0.1
+
+
+def test_correlate_stream(tmp_path):
+    timestamps, channels = synthetic_tags(1e5, 1, timebase=1e-12, seed=4)
+    writer = TagStreamWriter(str(tmp_path / 'stream'), 1e-12)
+    for first in range(0, timestamps.size, 30000):
+        writer.append(timestamps[first:first + 30000], channels[first:first + 30000])
+    writer.close()
+
+    tau, g2 = correlate_stream(TagStreamReader(str(tmp_path / 'stream')), [(1, 2)], 1e-9, 100, block_size=7000)
+    correlator = TagCorrelator([(1, 2)], 1e-9/1e-12, 100)
+    correlator.add_block(timestamps, channels)
+    np.testing.assert_allclose(tau, correlator.tau*1e-12)
+    np.testing.assert_allclose(g2[(1, 2)], correlator.g2((1, 2)))
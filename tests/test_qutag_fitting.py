@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the lifetime and antibunching fits and of the live refit decisions.
+"""
+
+import threading
+
+import numpy as np
+
+from qudi.logic.qutag_fitting import (fit_lifetime, fit_antibunching, lifetime_model, antibunching_model,
+                                      LiveHistogramFitter)
+
+
+def test_fit_lifetime_recovers_decay():
+    rng = np.random.default_rng(1)
+    time = np.linspace(0, 50, 500)
+    counts = rng.poisson(lifetime_model(np.clip(time - 5, 0, None), 2000, 3.2, 10)*(time >= 5) + 10*(time < 5))
+    result = fit_lifetime(time, counts)
+    assert abs(result['tau'][0] - 3.2) < 3*result['tau_confidence'][0]
+    assert result['tau_confidence'][0] < 0.2
+
+
+def test_fit_antibunching_recovers_dip():
+    rng = np.random.default_rng(2)
+    time = np.linspace(-50, 50, 401)
+    g2 = antibunching_model(time, 1.0, 0.2, 4.0, 1.5) + rng.normal(0, 0.01, time.size)
+    result = fit_antibunching(time, g2)
+    assert abs(result['g2_0'] - 0.2) < 0.05
+    assert abs(result['params'][3] - 1.5) < 0.5
+    assert result['g2_0_confidence'] < 0.1
+
+
+class _Results:
+    def __init__(self):
+        self.results = []
+        self.event = threading.Event()
+
+    def __call__(self, kind, result):
+        self.results.append((kind, result))
+        self.event.set()
+
+    def wait(self, timeout=10):
+        fitted = self.event.wait(timeout)
+        self.event.clear()
+        return fitted
+
+
+def _g2_curve():
+    time = np.linspace(-50, 50, 201)
+    return time, antibunching_model(time, 1.0, 0.3, 5.0, 0.0)
+
+
+def test_normalised_curve_is_refitted_as_events_grow():
+    """ A normalised g2 curve hardly changes once the noise is low, the refit follows the raw events. """
+    results = _Results()
+    fitter = LiveHistogramFitter(results, min_change=0.02)
+    try:
+        time, g2 = _g2_curve()
+        fitter.submit('G2', time, g2, events=1e6)
+        assert results.wait()
+        fitter.submit('G2', time, g2, events=1.01e6)
+        assert not results.wait(0.5)
+        fitter.submit('G2', time, g2, events=1.03e6)
+        assert results.wait()
+        assert len(results.results) == 2
+    finally:
+        fitter.stop()
+
+
+def test_reset_refits_the_next_histogram():
+    results = _Results()
+    fitter = LiveHistogramFitter(results, min_change=0.02)
+    try:
+        time, g2 = _g2_curve()
+        fitter.submit('G2', time, g2, events=1e6)
+        assert results.wait()
+        fitter.reset('G2')
+        # Fewer events than the last fit, e.g. a new acquisition, is always refitted
+        fitter.submit('G2', time, g2, events=1e3)
+        assert results.wait()
+        assert len(results.results) == 2
+    finally:
+        fitter.stop()
+
+
+def test_lifetime_events_default_to_the_histogram_sum():
+    results = _Results()
+    fitter = LiveHistogramFitter(results, min_change=0.5)
+    try:
+        time = np.linspace(0, 50, 200)
+        counts = lifetime_model(time, 1000, 4.0, 5)
+        fitter.submit('LIFETIME', time, counts)
+        assert results.wait()
+        fitter.submit('LIFETIME', time, 1.2*counts)
+        assert not results.wait(0.5)
+        fitter.submit('LIFETIME', time, 2*counts)
+        assert results.wait()
+        assert abs(results.results[-1][1]['tau'][0] - 4.0) < 0.1
+    finally:
+        fitter.stop()
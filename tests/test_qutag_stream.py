@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the raw quTAG time tag stream format and the background recorder.
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from qudi.logic.qutag_stream import TagStreamWriter, TagStreamReader, TagStreamRecorder
+
+
+def _chunks(rng, count, size):
+    start = 0
+    for _ in range(count):
+        timestamps = start + np.cumsum(rng.integers(1, 100, size)).astype(np.int64)
+        start = int(timestamps[-1])
+        yield timestamps, rng.integers(0, 8, size).astype(np.int8)
+
+
+def test_round_trip(tmp_path):
+    rng = np.random.default_rng(1)
+    chunks = list(_chunks(rng, 5, 1000))
+    writer = TagStreamWriter(str(tmp_path / 'stream'), 1e-12, metadata={'sample': 'A'})
+    for i, (timestamps, channels) in enumerate(chunks):
+        writer.append(timestamps, channels, data_lost=(i == 3))
+    writer.close()
+
+    reader = TagStreamReader(str(tmp_path / 'stream'))
+    assert len(reader) == 5000
+    assert reader.timebase == 1e-12
+    assert reader.metadata == {'sample': 'A'}
+    assert reader.data_lost
+    np.testing.assert_array_equal(reader.index['data_lost'], [0, 0, 0, 1, 0])
+    np.testing.assert_array_equal(reader.timestamps, np.concatenate([t for t, _ in chunks]))
+    np.testing.assert_array_equal(reader.channels.view(np.int8), np.concatenate([c for _, c in chunks]))
+    blocks = list(reader.iter_blocks(1500))
+    assert [len(t) for t, _ in blocks] == [1500, 1500, 1500, 500]
+    np.testing.assert_array_equal(np.concatenate([t for t, _ in blocks]), reader.timestamps)
+
+
+def test_time_slice(tmp_path):
+    writer = TagStreamWriter(str(tmp_path / 'stream'), 1e-12)
+    writer.append(np.arange(0, 1000, 10, dtype=np.int64), np.ones(100, dtype=np.int8))
+    writer.close()
+    timestamps, channels = TagStreamReader(str(tmp_path / 'stream')).time_slice(95, 200)
+    np.testing.assert_array_equal(timestamps, np.arange(100, 200, 10))
+    assert channels.size == timestamps.size
+
+
+def test_truncated_chunk_is_ignored(tmp_path):
+    path = str(tmp_path / 'stream')
+    writer = TagStreamWriter(path, 1e-12)
+    writer.append(np.arange(10, dtype=np.int64), np.zeros(10, dtype=np.int8))
+    writer.close()
+    # A crash after the tag data but before the index record of the next chunk
+    with open(os.path.join(path, 'timestamps.bin'), 'ab') as file:
+        np.arange(10, 15, dtype='<i8').tofile(file)
+    reader = TagStreamReader(path)
+    assert len(reader) == 10
+    np.testing.assert_array_equal(reader.timestamps, np.arange(10))
+
+
+def test_empty_stream(tmp_path):
+    writer = TagStreamWriter(str(tmp_path / 'stream'), 1e-12)
+    writer.append(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8))
+    writer.close()
+    reader = TagStreamReader(str(tmp_path / 'stream'))
+    assert len(reader) == 0
+    assert reader.duration == 0
+
+
+class _TagSource:
+    """ Hands out prepared buffer reads like Qutag.read_timestamps, then empty reads. """
+
+    def __init__(self, chunks):
+        self._chunks = list(chunks)
+        self._lock = threading.Lock()
+        self.reads = 0
+
+    def read_timestamps(self):
+        with self._lock:
+            self.reads += 1
+            if self.reads == 1 or not self._chunks:
+                # The first read drains tags from before the recording
+                return np.arange(3, dtype=np.int64), np.zeros(3, dtype=np.int8), 3 if self.reads == 1 else 0, False
+            timestamps, channels = self._chunks.pop(0)
+            return timestamps, channels, len(timestamps), False
+
+
+def test_recorder_drains_until_stopped(tmp_path):
+    rng = np.random.default_rng(2)
+    chunks = list(_chunks(rng, 4, 100))
+    source = _TagSource(chunks)
+    recorder = TagStreamRecorder(source, TagStreamWriter(str(tmp_path / 'stream'), 1e-12), drain_interval=0.001)
+    recorder.start()
+    while source.reads < 6:
+        threading.Event().wait(0.001)
+    recorder.stop()
+    assert recorder.error is None
+    assert not recorder.is_running
+    reader = TagStreamReader(str(tmp_path / 'stream'))
+    np.testing.assert_array_equal(reader.timestamps, np.concatenate([t for t, _ in chunks]))
@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the ROI container round trip: every member written by save_roi_container is read back unchanged.
+"""
+
+import json
+
+import numpy as np
+import pytest
+
+from qudi.logic.roi_container import RoiContainer, save_roi_container, ROI_CONTAINER_VERSION
+
+
+def _roi_dict(scan_image=True):
+    rng = np.random.default_rng(31)
+    return {'name': 'sample A',
+            'poi_nametag': 'spot',
+            'creation_time': '2026-10-17 12:00:00',
+            'pos_history': np.array([[0, 0, 0, 0], [10.5, 1e-7, -2e-7, 3e-8]]),
+            'scan_image': rng.random((20, 30)) if scan_image else None,
+            'scan_image_extent': ((0, 1e-5), (-1e-5, 2e-5)),
+            'pois': [{'name': 'spot1', 'position': (1e-6, 2e-6, 3e-6),
+                      'properties': {'amplitude': np.float64(120.5), 'gaussian_fit': True, 'rank': 0}},
+                     {'name': 'spot2', 'position': (-1e-6, 5e-7, 0.0), 'properties': None},
+                     {'name': 'spot3', 'position': (4e-6, 4e-6, 4e-6), 'properties': {}}]}
+
+
+def test_round_trip(tmp_path):
+    path = str(tmp_path / 'roi.npz')
+    roi = _roi_dict()
+    save_roi_container(path, roi, active_poi='spot2')
+    with RoiContainer(path) as container:
+        assert len(container) == 3
+        assert 'spot1' in container and 'spot4' not in container
+        assert container.active_poi == 'spot2'
+        assert container.scan_image_extent == roi['scan_image_extent']
+        np.testing.assert_array_equal(container.origin, [1e-7, -2e-7, 3e-8])
+        np.testing.assert_array_equal(container.get_poi_anchor('spot3'), [4e-6, 4e-6, 4e-6])
+        np.testing.assert_allclose(container.get_poi_position('spot1'), np.add((1e-6, 2e-6, 3e-6), container.origin))
+        assert container.get_poi_properties('spot1') == {'amplitude': 120.5, 'gaussian_fit': True, 'rank': 0}
+        assert container.get_poi_properties('spot2') == {}
+        with pytest.raises(KeyError):
+            container.get_poi_properties('spot4')
+
+        loaded = container.to_dict()
+        for key in ('name', 'poi_nametag', 'creation_time', 'scan_image_extent'):
+            assert loaded[key] == roi[key]
+        np.testing.assert_array_equal(loaded['pos_history'], roi['pos_history'])
+        np.testing.assert_array_equal(loaded['scan_image'], roi['scan_image'])
+        assert [poi['name'] for poi in loaded['pois']] == ['spot1', 'spot2', 'spot3']
+        assert [poi['position'] for poi in loaded['pois']] == [poi['position'] for poi in roi['pois']]
+        assert loaded['pois'][0]['properties'] == {'amplitude': 120.5, 'gaussian_fit': True, 'rank': 0}
+
+
+def test_scan_image_is_read_on_access(tmp_path):
+    path = str(tmp_path / 'roi.npz')
+    save_roi_container(path, _roi_dict())
+    with RoiContainer(path) as container:
+        assert container.has_scan_image
+        assert container._scan_image is None
+        assert container.scan_image.shape == (20, 30)
+        assert container.scan_image is container.scan_image
+
+
+def test_without_scan_image_and_pois(tmp_path):
+    path = str(tmp_path / 'roi.npz')
+    roi = _roi_dict(scan_image=False)
+    roi['pois'] = []
+    roi['scan_image_extent'] = None
+    save_roi_container(path, roi)
+    with RoiContainer(path) as container:
+        assert not container.has_scan_image
+        assert container.scan_image is None
+        assert container.scan_image_extent is None
+        assert container.active_poi is None
+        assert len(container) == 0
+        assert container.poi_anchors.shape == (0, 3)
+
+
+def test_overwrite_and_newer_version(tmp_path):
+    path = str(tmp_path / 'roi.npz')
+    save_roi_container(path, _roi_dict())
+    roi = _roi_dict()
+    roi['name'] = 'sample B'
+    save_roi_container(path, roi)
+    assert not (tmp_path / 'roi.npz.tmp').exists()
+    with RoiContainer(path) as container:
+        assert container.name == 'sample B'
+
+    with np.load(path) as file:
+        members = dict(file)
+    header = json.loads(str(members['header']))
+    header['version'] = ROI_CONTAINER_VERSION + 1
+    members['header'] = np.array(json.dumps(header))
+    np.savez(path, **members)
+    with pytest.raises(ValueError):
+        RoiContainer(path)
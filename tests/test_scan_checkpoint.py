@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the scan checkpoint round trip: lines written before an interruption are restored on resume.
+"""
+
+import json
+import os
+
+import numpy as np
+import pytest
+
+from qudi.hardware.interfuse.scan_checkpoint import ScanCheckpoint
+
+
+def _settings(resolution):
+    return {'axes': ['x', 'y'][:len(resolution)],
+            'range': [[0, 1e-5], [0, 2e-5]][:len(resolution)],
+            'resolution': list(resolution),
+            'frequency': 100.0,
+            'position': {'x': 0.0, 'y': 0.0, 'z': 1e-6},
+            'channel_units': {'APD1': 'c/s', 'APD2': 'c/s'},
+            'line_scan_mode': 'step',
+            'serpentine': True,
+            'lag_compensation': False}
+
+
+def _buffers(rng, shape):
+    return {'APD1': rng.random(shape), 'APD2': rng.random(shape)}
+
+
+def test_round_trip_2d(tmp_path):
+    rng = np.random.default_rng(3)
+    path = str(tmp_path / 'scan')
+    buffers = _buffers(rng, (6, 4))
+    checkpoint = ScanCheckpoint.create(path, _settings((6, 4)), (6, 4))
+    checkpoint.write_lines(buffers, [2, 0])
+    checkpoint.write_lines(buffers, [2])
+
+    resumed = ScanCheckpoint.open(path)
+    assert resumed.settings == _settings((6, 4))
+    assert resumed.lines_done == {0, 2}
+    assert not resumed.complete
+    for channel, data in buffers.items():
+        np.testing.assert_array_equal(resumed.data[channel][:, [0, 2]], data[:, [0, 2]])
+        assert np.isnan(resumed.data[channel][:, [1, 3]]).all()
+
+
+def test_resumed_lines_are_added(tmp_path):
+    rng = np.random.default_rng(4)
+    path = str(tmp_path / 'scan')
+    buffers = _buffers(rng, (5, 3))
+    ScanCheckpoint.create(path, _settings((5, 3)), (5, 3)).write_lines(buffers, [0])
+    resumed = ScanCheckpoint.open(path)
+    resumed.write_lines(buffers, [1, 2])
+    resumed.mark_complete()
+
+    final = ScanCheckpoint.open(path)
+    assert final.complete
+    assert final.lines_done == {0, 1, 2}
+    for channel, data in buffers.items():
+        np.testing.assert_array_equal(final.data[channel], data)
+
+
+def test_round_trip_1d(tmp_path):
+    path = str(tmp_path / 'scan')
+    buffers = {'APD1': np.arange(7.0), 'APD2': np.arange(7.0)[::-1]}
+    checkpoint = ScanCheckpoint.create(path, _settings((7,)), (7,))
+    checkpoint.write_lines(buffers, [0])
+    resumed = ScanCheckpoint.open(path)
+    assert resumed.lines_done == {0}
+    np.testing.assert_array_equal(resumed.data['APD2'], buffers['APD2'])
+
+
+def test_no_lines_written(tmp_path):
+    path = str(tmp_path / 'scan')
+    checkpoint = ScanCheckpoint.create(path, _settings((3, 3)), (3, 3))
+    checkpoint.write_lines(_buffers(np.random.default_rng(5), (3, 3)), [])
+    with open(os.path.join(path, 'checkpoint.json')) as file:
+        assert json.load(file)['lines_done'] == []
+    assert np.isnan(ScanCheckpoint.open(path).data['APD1']).all()
+
+
+def test_existing_directory_is_not_overwritten(tmp_path):
+    path = str(tmp_path / 'scan')
+    ScanCheckpoint.create(path, _settings((3, 3)), (3, 3))
+    with pytest.raises(FileExistsError):
+        ScanCheckpoint.create(path, _settings((3, 3)), (3, 3))
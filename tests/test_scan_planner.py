@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the scan time estimate, the measured overhead statistics and the reduction of scan settings to a time
+budget.
+"""
+
+import numpy as np
+import pytest
+
+from qudi.hardware.interfuse.scan_planner import ScanOverheadStatistics, estimate_scan_time, fit_to_budget
+
+_OVERHEAD = {'pixel': 2e-3, 'line': 50e-3}
+
+
+def _duration(resolution, frequency, overhead=_OVERHEAD):
+    lines = resolution[1] if len(resolution) == 2 else 1
+    return estimate_scan_time(resolution[0], lines, frequency, overhead)['duration_s']
+
+
+def test_estimate_scan_time():
+    estimate = estimate_scan_time(100, 20, 50, _OVERHEAD)
+    line_time = 100*(1/50 + 2e-3) + 50e-3
+    assert estimate['duration_s'] == pytest.approx(20*line_time)
+    assert estimate['nominal_duration_s'] == pytest.approx(40)
+    assert estimate['pixel_rate_hz'] == pytest.approx(100/line_time)
+    assert estimate['max_pixel_rate_hz'] == pytest.approx(100/(100*2e-3 + 50e-3))
+    assert estimate_scan_time(10, 1, 10, {'pixel': 0, 'line': 0})['max_pixel_rate_hz'] == np.inf
+
+
+def test_overhead_statistics():
+    statistics = ScanOverheadStatistics(window=2)
+    assert not statistics.has_data('step')
+    assert statistics.overhead('step', 1e-3, 0.1) == {'move': 1e-3, 'settle': 0, 'counter': 0, 'pixel': 1e-3,
+                                                      'line': 0.1}
+    assert statistics.overhead('hardware_timed', 1e-3, 0.1)['pixel'] == 0
+
+    dwell = 0.01
+    # move, settle, exposure, total per pixel
+    timing = np.array([[1e-3, 2e-3, dwell + 1e-3, dwell + 4e-3]]*5)
+    statistics.add_step_line(np.array([[1, 1, 1, 1]]*5), dwell, 100)  # pushed out of the window
+    statistics.add_step_line(timing, dwell, timing[:, 3].sum() + 0.02)
+    statistics.add_step_line(timing, dwell, timing[:, 3].sum() + 0.04)
+    overhead = statistics.overhead('step', 1, 1)
+    assert overhead['move'] == pytest.approx(1e-3)
+    assert overhead['settle'] == pytest.approx(2e-3)
+    assert overhead['counter'] == pytest.approx(1e-3)
+    assert overhead['pixel'] == pytest.approx(4e-3)
+    assert overhead['line'] == pytest.approx(0.03)
+
+    statistics.add_hardware_timed_line(100, dwell, 100*dwell + 0.2)
+    assert statistics.overhead('hardware_timed', 1, 1)['line'] == pytest.approx(0.2)
+
+
+def test_settings_within_budget_are_unchanged():
+    assert fit_to_budget((50, 40), 100, _OVERHEAD, 1000, (1, 1000), ((2, 1000), (2, 1000))) == ((50, 40), 100)
+
+
+@pytest.mark.parametrize('resolution, budget', [((200, 150), 60), ((64, 64), 5), ((500,), 1)])
+def test_resolution_is_the_largest_that_fits(resolution, budget):
+    fitted, frequency = fit_to_budget(resolution, 100, _OVERHEAD, budget, (1, 1000),
+                                      ((2, 10000),)*len(resolution))
+    assert frequency == 100
+    assert _duration(fitted, frequency) <= budget
+    assert _duration(tuple(res + 1 for res in fitted), frequency) > budget
+    assert all(res <= original for res, original in zip(fitted, resolution))
+
+
+def test_frequency_is_raised_first():
+    resolution, frequency = fit_to_budget((100, 100), 50, _OVERHEAD, 200, (1, 1000), ((2, 1000), (2, 1000)),
+                                          adjust='frequency')
+    assert resolution == (100, 100)
+    assert 50 < frequency <= 1000
+    assert _duration(resolution, frequency) == pytest.approx(200)
+
+
+def test_frequency_limit_then_resolution():
+    resolution, frequency = fit_to_budget((100, 100), 50, _OVERHEAD, 10, (1, 1000), ((2, 1000), (2, 1000)),
+                                          adjust='frequency')
+    assert frequency == 1000
+    assert resolution[0] < 100 and resolution[1] < 100
+    assert _duration(resolution, frequency) <= 10
+
+
+def test_resolution_stays_within_limits():
+    resolution, _ = fit_to_budget((100, 100), 10, _OVERHEAD, 1e-3, (1, 1000), ((5, 1000), (8, 1000)))
+    assert resolution == (5, 8)
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the precompiled scan trajectories against per-pixel positions and of the trajectory cache.
+"""
+
+import numpy as np
+import pytest
+
+from qudi.hardware.interfuse.scan_trajectory import TrajectoryCompiler
+
+
+def _reference_positions(axes, ranges, resolution, fixed_position):
+    pixels = resolution[0]
+    lines = resolution[1] if len(axes) == 2 else 1
+    positions = {ax: np.empty((lines, pixels)) for ax in ('x', 'y', 'z')}
+    for line in range(lines):
+        for pixel in range(pixels):
+            for ax in ('x', 'y', 'z'):
+                if ax == axes[0]:
+                    low, high = ranges[0]
+                    positions[ax][line, pixel] = low + (high - low) * pixel / (pixels - 1)
+                elif len(axes) == 2 and ax == axes[1]:
+                    low, high = ranges[1]
+                    positions[ax][line, pixel] = low + (high - low) * line / (lines - 1)
+                else:
+                    positions[ax][line, pixel] = fixed_position[ax]
+    return positions
+
+
+@pytest.mark.parametrize('axes, ranges, resolution', [
+    (('x', 'y'), ((0, 1e-5), (-2e-5, 3e-5)), (7, 5)),
+    (('y', 'z'), ((1e-6, 0), (0, 2e-6)), (4, 9)),
+    (('z',), ((-1e-6, 1e-6),), (11,)),
+])
+def test_positions_match_reference(axes, ranges, resolution):
+    fixed_position = {'x': 1e-6, 'y': 2e-6, 'z': 3e-6}
+    trajectory = TrajectoryCompiler().compile(axes, ranges, resolution, fixed_position)
+    expected = _reference_positions(axes, ranges, resolution, fixed_position)
+    assert set(trajectory.positions) == {'x', 'y', 'z'}
+    for ax in expected:
+        np.testing.assert_allclose(trajectory.positions[ax], expected[ax], rtol=0, atol=1e-18)
+    assert trajectory.line_count == expected['x'].shape[0]
+
+
+def test_line_pixel_order_and_outputs():
+    compiler = TrajectoryCompiler()
+    trajectory = compiler.compile(('x', 'y'), ((0, 4), (0, 2)), (5, 3), {'z': 0},
+                                  compile_outputs=lambda pos: np.stack([pos['x'], pos['y']], axis=-1) * 2)
+    pixels = np.arange(5)[::-1]
+    line = trajectory.line(1, pixels)
+    np.testing.assert_array_equal(line['x'], [4, 3, 2, 1, 0])
+    np.testing.assert_array_equal(line['y'], np.ones(5))
+    np.testing.assert_array_equal(trajectory.line_outputs(1, pixels)[:, 0], [8, 6, 4, 2, 0])
+    assert compiler.compile(('x', 'y'), ((0, 4), (0, 2)), (5, 3), {'z': 0}).line_outputs(0) is None
+
+
+def test_trajectory_is_read_only():
+    trajectory = TrajectoryCompiler().compile(('x', 'y'), ((0, 1), (0, 1)), (3, 3), {'z': 0},
+                                              compile_outputs=lambda pos: pos['x'] + pos['y'])
+    with pytest.raises(ValueError):
+        trajectory.positions['x'][0, 0] = 1
+    with pytest.raises(ValueError):
+        trajectory.outputs[0, 0] = 1
+
+
+def test_cache_key():
+    compiler = TrajectoryCompiler()
+    args = (('x', 'y'), ((0, 1), (0, 1)), (3, 3))
+    first = compiler.compile(*args, {'z': 0}, calibration=(1.0,))
+    # Positions of scanned axes are not part of the key
+    assert compiler.compile(*args, {'x': 5, 'y': 5, 'z': 0}, calibration=(1.0,)) is first
+    assert compiler.compile(*args, {'z': 1e-6}, calibration=(1.0,)) is not first
+    assert compiler.compile(*args, {'z': 0}, calibration=(2.0,)) is not first
+    assert (compiler.hits, compiler.misses) == (1, 3)
+
+
+def test_cache_evicts_least_recently_used():
+    compiler = TrajectoryCompiler(max_entries=2)
+    compile_z = lambda z: compiler.compile(('x',), ((0, 1),), (4,), {'y': 0, 'z': z})
+    first = compile_z(0)
+    second = compile_z(1)
+    assert compile_z(0) is first
+    compile_z(2)
+    assert compile_z(0) is first
+    assert compile_z(1) is not second
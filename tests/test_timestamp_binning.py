@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Tests of the quTAG time tag pixel binning against a per-tag reference.
+"""
+
+import numpy as np
+
+from qudi.hardware.qutag.timestamp_binning import TimestampBinner
+
+
+def _reference_counts(timestamps, tag_channels, channels, edges, pixel_count):
+    counts = np.zeros((len(channels), pixel_count), dtype=np.int64)
+    for timestamp, channel in zip(timestamps, tag_channels):
+        if channel not in channels:
+            continue
+        for pixel in range(len(edges) - 1):
+            if edges[pixel] <= timestamp < edges[pixel + 1]:
+                counts[channels.index(channel), pixel] += 1
+    return counts
+
+
+def _random_tags(rng, size, stop, channels):
+    timestamps = np.sort(rng.integers(0, stop, size)).astype(np.int64)
+    tag_channels = rng.choice(channels, size).astype(np.int8)
+    return timestamps, tag_channels
+
+
+def test_grid_matches_reference():
+    rng = np.random.default_rng(1)
+    timestamps, tag_channels = _random_tags(rng, 2000, 100000, [1, 2, 3, 5])
+    binner = TimestampBinner([1, 2], 17)
+    edges = binner.grid_edges(12345, 4321.5)
+    counts = binner.bin_line(timestamps, tag_channels, edges)
+    np.testing.assert_array_equal(counts, _reference_counts(timestamps, tag_channels, [1, 2], edges, 17))
+
+
+def test_binner_is_reusable_across_lines():
+    rng = np.random.default_rng(2)
+    binner = TimestampBinner([1], 10)
+    for line in range(3):
+        timestamps, tag_channels = _random_tags(rng, 500, 10000, [1, 2])
+        edges = binner.grid_edges(1000*line, 800)
+        counts = binner.bin_line(timestamps, tag_channels, edges)
+        np.testing.assert_array_equal(counts, _reference_counts(timestamps, tag_channels, [1], edges, 10))
+
+
+def _merge(*streams):
+    timestamps = np.concatenate([stream[0] for stream in streams])
+    tag_channels = np.concatenate([stream[1] for stream in streams]).astype(np.int8)
+    order = np.argsort(timestamps, kind='stable')
+    return timestamps[order], tag_channels[order]
+
+
+def test_pixel_clock_line():
+    rng = np.random.default_rng(3)
+    markers = np.arange(8)*1000 + 500
+    photons, _ = _random_tags(rng, 400, 9000, [1])
+    timestamps, tag_channels = _merge((markers, np.full(markers.size, 7)), (photons, np.ones(photons.size)))
+
+    binner = TimestampBinner([1], 8)
+    binner.start_line(1000, clock_channel=7)
+    binner.add_block(timestamps, tag_channels)
+    assert binner.complete
+    edges = np.append(markers, 8500)
+    np.testing.assert_array_equal(binner.finish(), _reference_counts(timestamps, tag_channels, [1], edges, 8))
+
+
+def test_line_spanning_two_reads():
+    rng = np.random.default_rng(4)
+    markers = np.arange(11)*1000 + 500
+    photons, photon_channels = _random_tags(rng, 3000, 12000, [1, 2, 3])
+    timestamps, tag_channels = _merge((markers, np.full(markers.size, 7)), (photons, photon_channels))
+    reference = _reference_counts(timestamps, tag_channels, [1, 2], markers, 10)
+
+    # The first read ends inside pixel 4 before its closing marker, the second one repeats the last 50 tags.
+    split = np.searchsorted(timestamps, 4700)
+    binner = TimestampBinner([1, 2], 10)
+    binner.start_line(1000, clock_channel=7)
+    binner.add_block(timestamps[:split], tag_channels[:split])
+    assert not binner.complete
+    binner.add_block(timestamps[split - 50:], tag_channels[split - 50:])
+    assert binner.complete
+    np.testing.assert_array_equal(binner.finish(), reference)
+
+
+def test_grid_line_waits_for_line_start():
+    rng = np.random.default_rng(5)
+    photons, photon_channels = _random_tags(rng, 2000, 20000, [1, 2])
+    timestamps, tag_channels = _merge(([3000], [8]), (photons, photon_channels))
+    binner = TimestampBinner([1, 2], 12)
+    edges = binner.grid_edges(3000, 1000.5)
+    reference = _reference_counts(timestamps, tag_channels, [1, 2], edges, 12)
+
+    binner.start_line(1000.5, sync_channel=8)
+    for block in np.array_split(np.arange(timestamps.size), 5):
+        binner.add_block(timestamps[block], tag_channels[block], data_lost=block[0] == 0)
+    assert binner.complete
+    assert binner.data_lost
+    np.testing.assert_array_equal(binner.finish(), reference)
+
+
+def test_missing_pixel_clock_markers_leave_pixels_empty():
+    timestamps = np.array([0, 10, 100, 110, 250, 400], dtype=np.int64)
+    tag_channels = np.array([7, 1, 7, 1, 1, 1], dtype=np.int8)
+    binner = TimestampBinner([1], 4)
+    binner.start_line(100, clock_channel=7)
+    binner.add_block(timestamps, tag_channels)
+    assert binner.line_end is None and binner.marker_count == 2
+    np.testing.assert_array_equal(binner.finish(), [[1, 1, 0, 0]])
+    binner.start_line(100, clock_channel=7)
+    np.testing.assert_array_equal(binner.finish(), np.zeros((1, 4)))
+
+
+def test_no_tags():
+    binner = TimestampBinner([1, 2], 5)
+    counts = binner.bin_line(np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8), binner.grid_edges(0, 10))
+    np.testing.assert_array_equal(counts, np.zeros((2, 5)))